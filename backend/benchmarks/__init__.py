@@ -0,0 +1,20 @@
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_ROOT = os.path.dirname(BACKEND_DIR)
+SAMPLE_PDF = os.path.join(PROJECT_ROOT, "Prot_000.pdf")
+
+
+def setup_django():
+    """Configure Django so benchmarks can import ``documents`` outside ``manage.py``."""
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "docparser.settings")
+    os.environ.setdefault("ICF_LLM_BACKEND", "stub")
+    # Measure real work, not cache hits left over from earlier runs
+    os.environ.setdefault("ICF_CACHE_ENABLED", "False")
+    # No migrated database needed, and no reuse of earlier runs' pages
+    os.environ.setdefault("ICF_PERSIST_PROTOCOLS", "False")
+    import django
+    django.setup()
@@ -0,0 +1,186 @@
+"""Concurrent generations: sync views under WSGI versus async views under ASGI, with a slow fake model.
+
+Every request uploads a different small protocol to ``POST
+/api/generate_icf/`` while ``StubLLMServer`` answers each model call after
+``--latency`` seconds, so the model dominates and throughput depends on how
+many generations can wait on it at once. Each setup runs in a fresh process:
+
+- ``wsgi``: the DRF views through Django's test client on
+  ``--wsgi-threads`` threads, like a threaded WSGI server
+- ``asgi-sync``: the same views through the async test client, i.e. the
+  ASGI handler; Django runs sync views one at a time on a single thread
+- ``asgi``: the async views (``ICF_ASYNC_VIEWS``) through the async test
+  client, up to ``--concurrency`` requests in flight on one event loop
+
+It reports requests per second, latency percentiles, the most threads alive
+at once and peak RSS:
+
+    python -m benchmarks.bench_asgi --requests 64 --concurrency 64 --wsgi-threads 8 --latency 2
+
+``--llm-connections`` raises the gateway's connection cap for every setup,
+so it doesn't bound the async one. To load a real server (e.g. ``uvicorn
+docparser.asgi:application`` with ``ICF_ASYNC_VIEWS=True``) use
+``bench_e2e --url``.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from . import setup_django
+from .bench_e2e import summarize
+from .synthetic import write_protocol_pdf
+
+SETUPS = ("wsgi", "asgi-sync", "asgi")
+
+
+class ThreadSampler:
+    """Record the most threads alive at once while running."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_wsgi(paths, threads):
+    from django.test import Client
+
+    local = threading.local()
+
+    def one(path):
+        if not hasattr(local, "client"):
+            local.client = Client()
+        start = time.perf_counter()
+        with open(path, "rb") as f:
+            status = local.client.post("/api/generate_icf/", {"file": f}).status_code
+        return time.perf_counter() - start, status
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(one, paths))
+
+
+async def run_asgi(paths, concurrency):
+    from django.test import AsyncClient
+
+    client = AsyncClient()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(path):
+        async with slots:
+            start = time.perf_counter()
+            with open(path, "rb") as f:
+                status = (await client.post("/api/generate_icf/", {"file": f})).status_code
+            return time.perf_counter() - start, status
+
+    return await asyncio.gather(*(one(path) for path in paths))
+
+
+def measure(setup, paths, base_url, options):
+    """Run in a fresh process: send ``paths[1:]`` after a warm-up with ``paths[0]``; return the results."""
+    os.environ.update({
+        "ICF_LLM_BACKEND": "openai",
+        "OPENAI_BASE_URL": base_url,
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "fake-key",
+        "ICF_LLM_MAX_CONNECTIONS": str(options["llm_connections"]),
+        "ICF_ASYNC_VIEWS": str(setup == "asgi"),
+    })
+    setup_django()
+    logging.getLogger("documents").setLevel(logging.WARNING)
+    logging.getLogger("django.request").setLevel(logging.ERROR)
+
+    if setup == "wsgi":
+        def send(batch):
+            return run_wsgi(batch, options["wsgi_threads"])
+    else:
+        def send(batch):
+            return asyncio.run(run_asgi(batch, options["concurrency"]))
+
+    send(paths[:1])  # Warm-up: template, gateway, HTTP connections
+    with ThreadSampler() as threads:
+        start = time.perf_counter()
+        outcomes = send(paths[1:])
+        elapsed = time.perf_counter() - start
+    latencies = [seconds for seconds, status in outcomes if status == 200]
+    return {
+        "setup": setup,
+        "requests": len(outcomes),
+        "errors": len(outcomes) - len(latencies),
+        "elapsed_seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 3),
+        "latency": summarize(latencies),
+        "peak_threads": threads.peak,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--setups", nargs="+", choices=SETUPS, default=list(SETUPS))
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=64, help="requests in flight in the ASGI setups")
+    parser.add_argument("--wsgi-threads", type=int, default=8, help="request threads in the WSGI setup")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=2.0, help="fake API seconds per call")
+    parser.add_argument("--llm-connections", type=int, default=1024)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+    options = {"concurrency": args.concurrency, "wsgi_threads": args.wsgi_threads,
+               "llm_connections": args.llm_connections}
+
+    # One fake API for every setup, outside the processes being measured
+    setup_django()
+    from documents.llm_stub import StubLLMServer
+
+    server = StubLLMServer(latency=args.latency).start()
+    context = multiprocessing.get_context("spawn")
+    results = []
+    print(f"{'setup':>10} {'req/s':>7} {'p50 s':>7} {'p95 s':>7} {'max s':>7} {'errors':>6} {'threads':>7} "
+          f"{'peak MB':>8} {'llm calls':>9}")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            # A different protocol per request, so identical in-flight prompts aren't coalesced
+            paths = []
+            for seed in range(args.requests + 1):
+                paths.append(os.path.join(tmp, f"protocol_{seed}.pdf"))
+                write_protocol_pdf(paths[-1], args.pages, seed=seed)
+            for setup in args.setups:
+                calls_before = server.httpd.stub.calls
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(measure, setup, paths, server.base_url, options).result()
+                result["llm_calls"] = server.httpd.stub.calls - calls_before
+                results.append(result)
+                latency = result["latency"]
+                print(f"{setup:>10} {result['requests_per_second']:>7.2f} {latency.get('p50', 0):>7.2f} "
+                      f"{latency.get('p95', 0):>7.2f} {latency.get('max', 0):>7.2f} {result['errors']:>6} "
+                      f"{result['peak_threads']:>7} {result['peak_rss_mb']:>8.1f} {result['llm_calls']:>9}")
+    finally:
+        server.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"options": vars(args), "results": results}, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
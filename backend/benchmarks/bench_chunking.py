@@ -0,0 +1,43 @@
+"""Throughput of map-reduce section extraction versus page count.
+
+Runs entirely offline against ``StubLLMClient`` with a fixed per-call latency:
+
+    python -m benchmarks.bench_chunking --pages 50 200 800 --latency 0.2 --in-flight 1 4 8
+"""
+import argparse
+import time
+from . import setup_django
+
+setup_django()
+
+from documents.chunking import chunk_pages, map_reduce_sections  # noqa: E402
+from documents.llm_stub import StubLLMClient  # noqa: E402
+from documents.pipeline import build_prompt  # noqa: E402
+from .synthetic import synthetic_pages  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, nargs="+", default=[25, 100, 400])
+    parser.add_argument("--latency", type=float, default=0.1, help="stub seconds per LLM call")
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--chunk-tokens", type=int, default=3000)
+    parser.add_argument("--overlap", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'pages':>6} {'chunks':>6} {'in-flight':>9} {'seconds':>8} {'pages/s':>8} {'sections':>8}")
+    for count in args.pages:
+        pages = synthetic_pages(count)
+        chunks = sum(1 for _ in chunk_pages(pages, args.chunk_tokens, args.overlap))
+        for in_flight in args.in_flight:
+            client = StubLLMClient(latency=args.latency)
+            start = time.perf_counter()
+            sections = map_reduce_sections(
+                pages, build_prompt, client=client,
+                max_tokens=args.chunk_tokens, overlap_pages=args.overlap, max_in_flight=in_flight,
+            )
+            elapsed = time.perf_counter() - start
+            print(f"{count:>6} {chunks:>6} {in_flight:>9} {elapsed:>8.2f} {count / elapsed:>8.1f} {len(sections):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""DOCX extraction: whole-document python-docx join versus streamed logical pages.
+
+The baseline is the original ``iter_docx_pages``, which loaded the document
+with python-docx and returned every paragraph joined as one page, without
+tables. The streaming extractor splits the body into logical pages. Each run
+happens in a fresh process so peak RSS (which includes lxml's memory) is
+comparable. Documents are synthetic protocols with headings, paragraphs,
+tables and page breaks:
+
+    python -m benchmarks.bench_docx --sections 50 200 800
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from . import setup_django
+
+setup_django()
+
+import docx  # noqa: E402
+from docx.enum.text import WD_BREAK  # noqa: E402
+from documents.chunking import chunk_pages  # noqa: E402
+from documents.utils import iter_docx_pages  # noqa: E402
+from .synthetic import PARAGRAPHS  # noqa: E402
+
+
+def make_docx(path, sections, paragraphs_per_section=12):
+    doc = docx.Document()
+    doc.add_heading("Synthetic Clinical Protocol", 0)
+    for number in range(1, sections + 1):
+        doc.add_heading(f"{number} Section {number}", 1)
+        for i in range(paragraphs_per_section):
+            doc.add_paragraph(PARAGRAPHS[(number + i) % len(PARAGRAPHS)] * 2)
+        if number % 3 == 0:
+            table = doc.add_table(rows=6, cols=4)
+            for row in range(6):
+                for col in range(4):
+                    table.cell(row, col).text = f"Visit {row}" if col == 0 else f"{number}.{row}.{col}"
+        if number % 5 == 0:
+            doc.paragraphs[-1].add_run().add_break(WD_BREAK.PAGE)
+    doc.save(path)
+
+
+def legacy_pages(path):
+    doc = docx.Document(path)
+    text = "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
+    return [{"page": 1, "text": text}]
+
+
+def streamed_pages(path):
+    with open(path, "rb") as f:
+        return list(iter_docx_pages(f))
+
+
+def measure(kind, path):
+    """Run in a fresh process: seconds, pages, characters, tables kept, chunks and peak RSS growth (MB)."""
+    setup_django()
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    pages = legacy_pages(path) if kind == "python-docx" else streamed_pages(path)
+    seconds = time.perf_counter() - start
+    grown = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) / 1024
+    chunks = sum(1 for _ in chunk_pages(pages))
+    chars = sum(len(page["text"]) for page in pages)
+    tables = sum(page["text"].count("[Table]") for page in pages)
+    return seconds, len(pages), chars, tables, chunks, grown
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sections", type=int, nargs="+", default=[50, 200, 800])
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(f"{'sections':>8} {'KB':>7} {'extractor':>11} {'seconds':>8} {'pages':>6} {'chars':>9} "
+          f"{'tables':>6} {'chunks':>6} {'peak MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for sections in args.sections:
+            path = os.path.join(tmp, f"protocol_{sections}.docx")
+            # Built in a child too: Linux keeps a process's peak RSS across fork and exec
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                pool.submit(make_docx, path, sections).result()
+            size = os.path.getsize(path) / 1024
+            for kind in ("python-docx", "streamed"):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    seconds, pages, chars, tables, chunks, grown = pool.submit(measure, kind, path).result()
+                print(f"{sections:>8} {size:>7.0f} {kind:>11} {seconds:>8.2f} {pages:>6} {chars:>9} "
+                      f"{tables:>6} {chunks:>6} {grown:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
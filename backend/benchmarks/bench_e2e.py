@@ -0,0 +1,254 @@
+"""End-to-end load test of ``POST /api/generate_icf/`` against a fake OpenAI API.
+
+Generates synthetic PDF and DOCX protocols of the requested page counts,
+starts ``StubLLMServer`` (a local chat completions API with a fixed latency
+per call and per streamed delta) and points the real OpenAI client at it, then
+sends ``--requests`` protocols at each ``--concurrency`` level. By default
+requests go through Django's test client in this process. With ``--url`` they
+go to a running server instead, e.g. under an ASGI server; start that server
+with ``OPENAI_BASE_URL=http://127.0.0.1:<--llm-port>/v1`` so it uses the same
+fake API.
+
+For each scenario it reports requests per second, request latency
+percentiles, percentiles of each pipeline stage from the responses'
+``timings``, model calls per request and peak RSS. ``--output`` writes the
+results as JSON and ``--compare`` prints the change against an earlier file:
+
+    python -m benchmarks.bench_e2e --pages 20 100 --formats pdf docx --concurrency 1 4 \\
+        --requests 8 --latency 0.2 --output e2e.json --compare e2e-before.json
+
+Every request uploads a different protocol of the same size. Persistence is
+off unless ``ICF_PERSIST_PROTOCOLS=True`` is set, which needs a migrated
+database; repeated runs then reuse the pages stored by earlier ones.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from . import BACKEND_DIR, setup_django
+from .synthetic import write_protocol_docx, write_protocol_pdf
+
+PERCENTILES = (50, 90, 95, 99)
+# Metrics compared by --compare, and whether higher is better
+COMPARED = [("requests_per_second", True), ("latency.p50", False), ("latency.p95", False), ("peak_rss_mb", False)]
+
+
+def percentile(values, q):
+    """Linear-interpolated ``q``-th percentile of ``values``."""
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def summarize(values):
+    if not values:
+        return {}
+    summary = {f"p{q}": round(percentile(values, q), 4) for q in PERCENTILES}
+    summary["mean"] = round(sum(values) / len(values), 4)
+    summary["max"] = round(max(values), 4)
+    return summary
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def multipart_body(path):
+    boundary = uuid.uuid4().hex
+    with open(path, "rb") as f:
+        content = f.read()
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{os.path.basename(path)}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n").encode()
+    return head + content + f"\r\n--{boundary}--\r\n".encode(), f"multipart/form-data; boundary={boundary}"
+
+
+def client_sender():
+    """Post with Django's test client, one client per thread."""
+    from django.test import Client
+
+    local = threading.local()
+
+    def send(path):
+        if not hasattr(local, "client"):
+            local.client = Client()
+        with open(path, "rb") as f:
+            response = local.client.post("/api/generate_icf/", {"file": f})
+        return response.status_code, json.loads(response.content) if response.status_code == 200 else None
+
+    return send
+
+
+def url_sender(base_url):
+    """Post to a running server at ``base_url``."""
+    def send(path):
+        body, content_type = multipart_body(path)
+        request = urllib.request.Request(f"{base_url.rstrip('/')}/api/generate_icf/", data=body,
+                                         headers={"Content-Type": content_type}, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=600) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+    return send
+
+
+def run_scenario(send, paths, concurrency, stub):
+    """Send each of ``paths`` once, ``concurrency`` at a time."""
+    latencies, stages, errors = [], {}, 0
+    calls_before = stub.calls
+
+    def one(path):
+        start = time.perf_counter()
+        status, data = send(path)
+        return time.perf_counter() - start, status, data
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(one, paths))
+    elapsed = time.perf_counter() - start
+
+    for seconds, status, data in outcomes:
+        if status != 200 or data is None:
+            errors += 1
+            continue
+        latencies.append(seconds)
+        for stage, stage_seconds in data.get("timings", {}).items():
+            stages.setdefault(stage, []).append(stage_seconds)
+    return {
+        "requests": len(paths),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 3),
+        "latency": summarize(latencies),
+        "stages": {stage: summarize(values) for stage, values in stages.items()},
+        "llm_calls_per_request": round((stub.calls - calls_before) / len(paths), 2),
+    }
+
+
+def lookup(result, dotted):
+    for key in dotted.split("."):
+        result = (result or {}).get(key)
+    return result
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {scenario["name"]: scenario for scenario in json.load(f)["scenarios"]}
+    print(f"\nChange against {baseline_path}:")
+    print(f"{'scenario':>22} " + " ".join(f"{metric:>20}" for metric, _ in COMPARED))
+    for scenario in results["scenarios"]:
+        before = baseline.get(scenario["name"])
+        if before is None:
+            continue
+        cells = []
+        for metric, higher_is_better in COMPARED:
+            old, new = lookup(before, metric), lookup(scenario, metric)
+            if not old or new is None:
+                cells.append(f"{'-':>20}")
+                continue
+            change = (new - old) / old
+            worse = change < 0 if higher_is_better else change > 0
+            cells.append(f"{change:>+18.1%}{' !' if worse and abs(change) > 0.1 else '  '}")
+        print(f"{scenario['name']:>22} " + " ".join(cells))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[20, 100])
+    parser.add_argument("--formats", nargs="+", choices=["pdf", "docx"], default=["pdf", "docx"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--requests", type=int, default=8, help="requests per scenario")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake API seconds per call")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="fake API seconds per streamed delta")
+    parser.add_argument("--url", help="send requests to this running server instead of the test client")
+    parser.add_argument("--llm-port", type=int, default=0, help="port for the fake API (default: any free port)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    # The fake API has to be up before settings are read, so the OpenAI client points at it
+    from documents.llm_stub import StubLLMServer
+
+    server = StubLLMServer(port=args.llm_port, latency=args.latency, token_latency=args.token_latency).start()
+    print(f"Fake OpenAI API at {server.base_url}")
+    os.environ.update({
+        "ICF_LLM_BACKEND": "openai",
+        "OPENAI_BASE_URL": server.base_url,
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "fake-key",
+    })
+    setup_django()
+    logging.getLogger("documents").setLevel(logging.WARNING)  # No per-run log line
+    send = url_sender(args.url) if args.url else client_sender()
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "target": args.url or "django-test-client",
+            "llm": {"latency": args.latency, "token_latency": args.token_latency},
+        },
+        "scenarios": [],
+    }
+    writers = {"pdf": write_protocol_pdf, "docx": write_protocol_docx}
+    print(f"{'scenario':>22} {'req/s':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'llm s p50':>9} "
+          f"{'calls':>6} {'errors':>6} {'peak MB':>8}")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for file_format in args.formats:
+                for pages in args.pages:
+                    # A different protocol per request, so identical in-flight prompts aren't coalesced
+                    paths = []
+                    for seed in range(args.requests + 1):
+                        paths.append(os.path.join(tmp, f"protocol_{pages}_{seed}.{file_format}"))
+                        writers[file_format](paths[-1], pages, seed=seed)
+                    send(paths[0])  # Warm-up: template, process pools, HTTP connections
+                    for concurrency in args.concurrency:
+                        name = f"{file_format}-{pages}p-c{concurrency}"
+                        scenario = {"name": name, "format": file_format, "pages": pages, "concurrency": concurrency}
+                        scenario.update(run_scenario(send, paths[1:], concurrency, server.httpd.stub))
+                        # Peak RSS of this process: only meaningful with the in-process test client
+                        scenario["peak_rss_mb"] = None if args.url else round(peak_rss_mb(), 1)
+                        results["scenarios"].append(scenario)
+                        latency, llm = scenario["latency"], scenario["stages"].get("llm", {})
+                        print(f"{name:>22} {scenario['requests_per_second']:>7.2f} {latency.get('p50', 0):>7.2f} "
+                              f"{latency.get('p95', 0):>7.2f} {latency.get('p99', 0):>7.2f} {llm.get('p50', 0):>9.2f} "
+                              f"{scenario['llm_calls_per_request']:>6} {scenario['errors']:>6} "
+                              f"{scenario['peak_rss_mb'] or 0:>8.1f}")
+    finally:
+        server.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Section-to-page attribution: substring scan versus the inverted index.
+
+The baseline is the original per-section loop that lowercased every page and
+substring-searched every keyword; the index is built once and ranks all
+sections in one pass:
+
+    python -m benchmarks.bench_index --pages 1000 5000 10000
+"""
+import argparse
+import time
+from . import setup_django
+
+setup_django()
+
+from documents.index import PageIndex  # noqa: E402
+from documents.sections import get_registry  # noqa: E402
+from .synthetic import synthetic_pages  # noqa: E402
+
+
+def substring_scan(pages, section_keywords, k=3):
+    results = {}
+    for section_name, keywords in section_keywords.items():
+        matches = []
+        for page in pages:
+            page_text_lower = page["text"].lower()
+            if any(keyword in page_text_lower for keyword in keywords):
+                matches.append((page["page"], sum(1 for keyword in keywords if keyword in page_text_lower)))
+        matches.sort(key=lambda item: item[1], reverse=True)
+        results[section_name] = matches[:k]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--lookups", type=int, default=200, help="page-number lookups to time")
+    args = parser.parse_args()
+    section_keywords = get_registry().keywords()
+
+    print(f"{'pages':>6} {'scan s':>8} {'build s':>8} {'query ms':>9} {'linear lookup ms':>17} {'index lookup ms':>16}")
+    for count in args.pages:
+        pages = synthetic_pages(count)
+
+        start = time.perf_counter()
+        substring_scan(pages, section_keywords)
+        scan = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = PageIndex()
+        for page in pages:
+            index.add_page(page["page"], page["text"], page)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index.top_pages_by_section(section_keywords)
+        query = time.perf_counter() - start
+
+        targets = [count - i for i in range(args.lookups)]
+        start = time.perf_counter()
+        for page_num in targets:
+            next((p for p in pages if p["page"] == page_num), None)
+        linear = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for page_num in targets:
+            index.get(page_num)
+        direct = time.perf_counter() - start
+
+        print(f"{count:>6} {scan:>8.3f} {build:>8.3f} {query * 1000:>9.2f} {linear * 1000:>17.2f} {direct * 1000:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
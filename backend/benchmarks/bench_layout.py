@@ -0,0 +1,64 @@
+"""Tokens sent to the model: plain ``get_text()`` versus layout-aware extraction.
+
+Extracts a PDF (by default the bundled ``Prot_000.pdf``) three ways: plain
+text, layout-aware without tables, and layout-aware with compact tables. For
+each it reports extraction time, characters, estimated tokens (as the chunker
+counts them) and how many chunks, i.e. model calls in ``chunked`` mode, the
+text makes:
+
+    python -m benchmarks.bench_layout --pdf ../Prot_000.pdf --chunk-tokens 3000
+"""
+import argparse
+import time
+from collections import Counter
+from . import SAMPLE_PDF, setup_django
+
+setup_django()
+
+from documents.chunking import chunk_pages, estimate_tokens  # noqa: E402
+from documents.utils import iter_pdf_pages  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pdf", default=SAMPLE_PDF)
+    parser.add_argument("--chunk-tokens", type=int, default=3000)
+    parser.add_argument("--margin", type=float, default=0.12)
+    parser.add_argument("--show-page", type=int, help="print this page's text both ways")
+    args = parser.parse_args()
+
+    runs = [
+        ("get_text", {}),
+        ("layout", {"layout": True, "margin": args.margin, "tables": False}),
+        ("layout+tables", {"layout": True, "margin": args.margin, "tables": True}),
+    ]
+    print(f"{'extraction':>14} {'seconds':>8} {'chars':>8} {'tokens':>8} {'saved':>6} {'chunks':>6}")
+    baseline = None
+    pages_by_run = {}
+    for label, options in runs:
+        with open(args.pdf, "rb") as f:
+            start = time.perf_counter()
+            pages = list(iter_pdf_pages(f, **options))
+            seconds = time.perf_counter() - start
+        pages_by_run[label] = pages
+        tokens = sum(estimate_tokens(page["text"]) for page in pages)
+        baseline = baseline or tokens
+        chunks = sum(1 for _ in chunk_pages(pages, max_tokens=args.chunk_tokens, overlap_pages=0))
+        print(f"{label:>14} {seconds:>8.2f} {sum(len(page['text']) for page in pages):>8} {tokens:>8} "
+              f"{1 - tokens / baseline:>6.1%} {chunks:>6}")
+
+    stats = Counter()
+    for page in pages_by_run["layout+tables"]:
+        stats.update(page["layout"])
+    print(f"\n{len(pages)} pages: {stats['running_chars']} header/footer chars dropped, "
+          f"{stats['raw_chars'] - stats['chars'] - stats['running_chars']} chars of whitespace and table "
+          f"cells saved, {stats['tables']} tables ({stats['table_chars']} chars)")
+
+    if args.show_page:
+        for label in ("get_text", "layout+tables"):
+            print(f"\n--- page {args.show_page}, {label} ---")
+            print(pages_by_run[label][args.show_page - 1]["text"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Model-reply parsing: speed on large replies and robustness on malformed ones.
+
+The baseline is the old path, which stripped fences and called ``json.loads``
+on each chunk reply, dumped the merged result, then stripped and loaded it
+twice more for sections and for the response. It is compared with
+``parse_response`` on the whole reply and ``IncrementalParser`` fed in
+16-character pieces, for clean, fenced, prose-wrapped, truncated and markdown
+replies. ``--fuzz N`` then mutates replies at random and checks that parsing
+only ever returns valid sections or raises ``ResponseParseError``, and that
+streamed and whole parses of intact replies agree:
+
+    python -m benchmarks.bench_parsing --sections 4 40 --section-chars 2000 50000 --fuzz 2000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from . import setup_django
+
+setup_django()
+
+from documents.parsing import (  # noqa: E402
+    ExtractedSection, IncrementalParser, ResponseParseError, parse_response, sections_to_dict,
+)
+from .synthetic import PARAGRAPHS  # noqa: E402
+
+PIECE_CHARS = 16
+
+
+def legacy_strip(text):
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text[7:]
+    if text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+
+def legacy_parse(reply):
+    """Sections recovered by the old path, or 0 if it gave up."""
+    try:
+        parsed = json.loads(legacy_strip(reply))
+    except json.JSONDecodeError:
+        return 0
+    generated_text = json.dumps(parsed, indent=2)
+    json.loads(legacy_strip(generated_text))
+    json.loads(generated_text)
+    return len(parsed)
+
+
+def make_reply(sections, section_chars, seed=0):
+    rng = random.Random(seed)
+    obj = {}
+    for i in range(sections):
+        parts, length = [], 0
+        while length < section_chars:
+            parts.append(rng.choice(PARAGRAPHS))
+            length += len(parts[-1]) + 1
+        obj[f"Section {i + 1}"] = {"content": "\n".join(parts), "source_pages": sorted(rng.sample(range(1, 200), 3))}
+    return obj
+
+
+def variants(obj):
+    text = json.dumps(obj, indent=2)
+    markdown = "\n\n".join(f"**{name}**\n{data['content']}" for name, data in obj.items())
+    return [
+        ("clean", text),
+        ("fenced", f"```json\n{text}\n```"),
+        ("prose", f"Here is the extracted information:\n```json\n{text}\n```\nLet me know if you need more."),
+        ("unfenced-prose", f"Sure. The sections are below.\n{text}\nNote: page numbers are approximate."),
+        ("truncated", f"```json\n{text[:int(len(text) * 0.7)]}"),
+        ("markdown", markdown),
+    ]
+
+
+def parse_whole(reply):
+    try:
+        sections = parse_response(reply)
+    except ResponseParseError:
+        return 0
+    json.dumps(sections_to_dict(sections), indent=2)  # generated_text, as the pipeline builds it
+    return len(sections)
+
+
+def parse_streamed(reply):
+    parser = IncrementalParser()
+    for start in range(0, len(reply), PIECE_CHARS):
+        parser.feed(reply[start:start + PIECE_CHARS])
+    if parser.complete:
+        return len(parser.close())
+    return parse_whole(reply)  # what extract_chunk does with a reply that isn't one JSON object
+
+
+def best_of(fn, reply, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(reply)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def mutate(text, rng):
+    chars = list(text)
+    for _ in range(rng.randint(1, 6)):
+        if not chars:
+            break
+        i = rng.randrange(len(chars))
+        op = rng.random()
+        if op < 0.3:
+            del chars[i]
+        elif op < 0.6:
+            chars.insert(i, rng.choice('{}[]",:\\` \nx0'))
+        elif op < 0.8:
+            chars[i] = rng.choice('{}[]",:\\`x')
+        else:
+            chars = chars[:i]  # truncate
+    return "".join(chars)
+
+
+def check_sections(sections):
+    assert isinstance(sections, list)
+    for section in sections:
+        assert isinstance(section, ExtractedSection)
+        assert isinstance(section.content, str) and section.content.strip()
+        assert all(isinstance(p, int) and not isinstance(p, bool) and p >= 1 for p in section.source_pages)
+
+
+def fuzz(iterations, seed):
+    rng = random.Random(seed)
+    outcomes = {"parsed": 0, "rejected": 0}
+    for i in range(iterations):
+        obj = make_reply(rng.randint(0, 6), rng.randint(10, 400), seed=i)
+        _, reply = rng.choice(variants(obj))
+        reply = mutate(reply, rng) if rng.random() < 0.8 else reply
+        try:
+            check_sections(parse_response(reply, page_numbers=[1, 2, 3] if rng.random() < 0.5 else None))
+            outcomes["parsed"] += 1
+        except ResponseParseError:
+            outcomes["rejected"] += 1
+        except Exception:
+            print(f"fuzz case {i} (seed {seed}) failed on reply: {reply[:300]!r}", file=sys.stderr)
+            raise
+
+        # Any split of an intact reply streams to the same sections as a whole parse
+        text = json.dumps(obj)
+        parser = IncrementalParser()
+        pos = 0
+        while pos < len(text):
+            step = rng.randint(1, 40)
+            check_sections(parser.feed(text[pos:pos + step]))
+            pos += step
+        assert parser.complete and parser.close() == parse_response(text), f"fuzz case {i}: stream mismatch"
+    return outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sections", type=int, nargs="+", default=[4, 40])
+    parser.add_argument("--section-chars", type=int, nargs="+", default=[2000, 50000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--fuzz", type=int, default=1000, help="random malformed replies to check (0 to skip)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'sections':>8} {'chars':>6} {'variant':>14} {'KB':>7} "
+          f"{'old ms':>8} {'found':>5} {'parse ms':>8} {'found':>5} {'stream ms':>9} {'found':>5}")
+    for sections in args.sections:
+        for chars in args.section_chars:
+            for name, reply in variants(make_reply(sections, chars, seed=args.seed)):
+                old_ms, old_found = best_of(legacy_parse, reply, args.repeat)
+                new_ms, new_found = best_of(parse_whole, reply, args.repeat)
+                stream_ms, stream_found = best_of(parse_streamed, reply, args.repeat)
+                print(f"{sections:>8} {chars:>6} {name:>14} {len(reply) / 1024:>7.1f} "
+                      f"{old_ms:>8.2f} {old_found:>5} {new_ms:>8.2f} {new_found:>5} {stream_ms:>9.2f} {stream_found:>5}")
+
+    if args.fuzz:
+        start = time.perf_counter()
+        outcomes = fuzz(args.fuzz, args.seed)
+        print(f"fuzz: {args.fuzz} cases in {time.perf_counter() - start:.1f}s, "
+              f"{outcomes['parsed']} parsed, {outcomes['rejected']} rejected, no invariant violations")
+
+
+if __name__ == "__main__":
+    main()
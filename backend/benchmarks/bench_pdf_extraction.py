@@ -0,0 +1,97 @@
+"""Serial versus process-pool PDF text extraction.
+
+Times ``iter_pdf_pages`` on the bundled ``Prot_000.pdf`` and on synthetic
+table-heavy PDFs of the requested sizes, with the extraction settings the
+service runs with (``ICF_PDF_LAYOUT``, ``ICF_PDF_MARGIN``, ``ICF_PDF_TABLES``;
+``--no-layout`` for plain ``get_text()``):
+
+    python -m benchmarks.bench_pdf_extraction --pages 300 1000 --workers 2 4
+
+Worker counts are capped at the available CPUs, as in the service; counts
+that would fall back to serial reading are skipped.
+"""
+import argparse
+import os
+import tempfile
+import time
+from . import SAMPLE_PDF, setup_django
+
+setup_django()
+
+import fitz  # noqa: E402
+from django.conf import settings  # noqa: E402
+from documents.utils import available_cpus, iter_pdf_pages, get_process_pool  # noqa: E402
+
+
+def make_table_pdf(path, pages, rows=60):
+    """Write a PDF whose pages are dense adverse-event tables, the slow case for get_text()."""
+    doc = fitz.open()
+    for number in range(1, pages + 1):
+        page = doc.new_page()
+        y = 36
+        for row in range(rows):
+            cells = [f"AE-{number:04d}-{row:02d}", "Grade 2", "Related", f"{row % 28 + 1} days", "Resolved"]
+            for col, cell in enumerate(cells):
+                page.insert_text((36 + col * 105, y), cell, fontsize=7)
+            y += 12
+        page.insert_text((36, 820), f"Protocol XYZ-123  Confidential  Page {number} of {pages}", fontsize=6)
+    doc.save(path)
+    doc.close()
+
+
+def time_extraction(path, workers, batch_pages, extraction):
+    with open(path, "rb") as f:
+        start = time.perf_counter()
+        pages = iter_pdf_pages(f, workers=workers, parallel_min_pages=1, batch_pages=batch_pages, **extraction)
+        chars = sum(len(page["text"]) for page in pages)
+    return time.perf_counter() - start, chars
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[300, 1000])
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--batch-pages", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    parser.add_argument("--no-layout", action="store_true", help="plain get_text() instead of the configured layout mode")
+    args = parser.parse_args()
+
+    layout = getattr(settings, "ICF_PDF_LAYOUT", True) and not args.no_layout
+    extraction = {
+        "layout": layout,
+        "margin": getattr(settings, "ICF_PDF_MARGIN", 0.12),
+        "tables": getattr(settings, "ICF_PDF_TABLES", False),
+    }
+    cpus = available_cpus()
+    workers = sorted({min(count, cpus) for count in args.workers} - {1})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        documents = [("Prot_000.pdf", SAMPLE_PDF)]
+        for count in args.pages:
+            path = os.path.join(tmp, f"synthetic_{count}.pdf")
+            make_table_pdf(path, count)
+            documents.append((f"synthetic {count}p", path))
+
+        # Start the pool up front so worker spawn time is not charged to the first document
+        for count in workers:
+            get_process_pool(count).submit(os.getpid).result()
+
+        print(f"CPUs available: {cpus}")
+        mode = f"layout (margin {extraction['margin']}, tables {extraction['tables']})" if layout else "plain"
+        print(f"Extraction: {mode}")
+        if not workers:
+            print("Only one CPU: the service reads serially, so there is no parallel mode to compare")
+        print(f"{'document':<18} {'pages':>6} {'mode':>10} {'seconds':>8} {'speedup':>8}")
+        for label, path in documents:
+            with fitz.open(path) as pdf:
+                page_count = pdf.page_count
+            serial = min(time_extraction(path, 1, args.batch_pages, extraction)[0] for _ in range(args.repeat))
+            print(f"{label:<18} {page_count:>6} {'serial':>10} {serial:>8.3f} {1.0:>8.2f}")
+            for count in workers:
+                get_process_pool(count).submit(os.getpid).result()
+                elapsed = min(time_extraction(path, count, args.batch_pages, extraction)[0] for _ in range(args.repeat))
+                print(f"{label:<18} {page_count:>6} {f'{count} procs':>10} {elapsed:>8.3f} {serial / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
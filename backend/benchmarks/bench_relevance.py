@@ -0,0 +1,122 @@
+"""Ranking pages per section: BM25 over keywords versus hashed TF-IDF vectors.
+
+A synthetic protocol gets a short title page full of "study" and, on a few
+known pages each, a sentence per section phrased without its exact keywords
+("withdraw whenever you choose", "kept confidentially"). For each ranker it
+reports build and ranking time, recall of those pages in the top ``--k``,
+how often the title page is ranked, and the estimated tokens
+``per_section`` mode would send per section. With ``--pdf`` a real protocol
+is ranked too; it has no known answers, so only tokens sent and title page
+hits are shown:
+
+    python -m benchmarks.bench_relevance --pages 100 400 --pdf ../Prot_000.pdf
+"""
+import argparse
+import random
+import time
+from . import SAMPLE_PDF, setup_django
+
+setup_django()
+
+from documents.chunking import ranked_chunk  # noqa: E402
+from documents.index import PageIndex  # noqa: E402
+from documents.sections import get_registry  # noqa: E402
+from documents.utils import iter_pdf_pages  # noqa: E402
+from documents.vectors import PageVectors  # noqa: E402
+from .synthetic import synthetic_pages  # noqa: E402
+
+TITLE_PAGE = ("Clinical Study Protocol\nA Phase 3 Randomized Study of Investigational Product in Adults\n"
+              "Study Number XYZ-123\nStudy Sponsor: Example Pharma\nVersion 2.0")
+
+# One sentence per section, avoiding the section's exact keywords
+PARAPHRASES = {
+    "Purpose of the Study": "This research aims to find out whether the investigational therapy shortens recovery.",
+    "Study Procedures": "Enrolled participants are randomly assigned and undergo blood draws and scans.",
+    "Study Duration": "Each participant takes part for roughly seven months including the final follow up.",
+    "Risks": "Participants may experience harmful or dangerous reactions, such as allergic complications.",
+    "Benefits": "You might not gain anything advantageous, though breathing could improve.",
+    "Confidentiality": "Your records are kept confidentially and your identity is never revealed.",
+    "Use of Health Information": "Your medical information may be disclosed to regulators and auditors.",
+    "Costs": "Nothing is charged to you; all study related expenses are covered.",
+    "Compensation for Injury": "If you are injured because of the research, you will be compensated for care.",
+    "Payment for Participation": "You will be paid for each completed visit and reimbursed for parking.",
+    "Research Funding": "This research is funded through a grant to the hospital.",
+    "Voluntary Participation": "Taking part is voluntary and you may withdraw whenever you choose.",
+    "Alternatives": "Instead of joining, you could choose alternative approved therapies.",
+    "Contact Information": "Please call the study doctor with any questions about your rights.",
+}
+
+
+def synthetic_protocol(count, plants=2, seed=0):
+    """Page texts with a title page and each paraphrase on ``plants`` random pages; returns ``(pages, answers)``."""
+    rng = random.Random(seed)
+    pages = synthetic_pages(count, seed=seed)
+    pages[0]["text"] = TITLE_PAGE
+    answers = {}
+    for name, sentence in PARAPHRASES.items():
+        answers[name] = set(rng.sample(range(2, count + 1), plants))
+        for number in answers[name]:
+            pages[number - 1]["text"] += "\n" + sentence
+    return pages, answers
+
+
+def rankers(k, min_relative):
+    specs = list(get_registry())
+
+    def bm25(index):
+        return index.top_pages_by_section({spec.name: spec.keywords for spec in specs}, k=k)
+
+    def vectors(index):
+        return index.vectors.rank({spec.name: spec.query for spec in specs}, k=k, min_relative=min_relative)
+
+    return {"bm25": (lambda: PageIndex(), bm25),
+            "vectors": (lambda: PageIndex(vectors=PageVectors()), vectors)}
+
+
+def run(label, pages, answers, k, min_relative, chunk_tokens):
+    texts = {page["page"]: page["text"] for page in pages}
+    for name, (build, rank) in rankers(k, min_relative).items():
+        start = time.perf_counter()
+        index = build()
+        for page in pages:
+            index.add_page(page["page"], page["text"])
+        built = time.perf_counter() - start
+        start = time.perf_counter()
+        ranked = rank(index)
+        ranking = time.perf_counter() - start
+
+        recall = "-"
+        if answers:
+            found = sum(len(answers[section] & {page for page, _ in matches}) for section, matches in ranked.items())
+            recall = f"{found / sum(len(pages) for pages in answers.values()):.0%}"
+        title = sum(1 for matches in ranked.values() if any(page == 1 for page, _ in matches))
+        tokens = [
+            ranked_chunk(0, [page for page, _ in matches] or sorted(texts)[:k], texts, chunk_tokens).tokens
+            for matches in ranked.values()
+        ]
+        print(f"{label:>14} {name:>8} {built:>8.3f} {ranking * 1000:>8.1f} {recall:>7} {title:>6} "
+              f"{sum(tokens) // len(tokens):>11} {sum(tokens):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 400])
+    parser.add_argument("--pdf", help="also rank this protocol", nargs="?", const=SAMPLE_PDF)
+    parser.add_argument("--k", type=int, default=6, help="pages ranked per section (ICF_SECTION_TOP_PAGES)")
+    parser.add_argument("--min-relative", type=float, default=0.6, help="ICF_SECTION_MIN_RELEVANCE")
+    parser.add_argument("--chunk-tokens", type=int, default=3000)
+    args = parser.parse_args()
+
+    print(f"{'protocol':>14} {'ranker':>8} {'build s':>8} {'rank ms':>8} {'recall':>7} {'title':>6} "
+          f"{'tokens/sec':>11} {'tokens':>9}")
+    for count in args.pages:
+        pages, answers = synthetic_protocol(count)
+        run(f"synthetic-{count}", pages, answers, args.k, args.min_relative, args.chunk_tokens)
+    if args.pdf:
+        with open(args.pdf, "rb") as f:
+            pages = list(iter_pdf_pages(f, layout=True))
+        run("pdf", pages, None, args.k, args.min_relative, args.chunk_tokens)
+
+
+if __name__ == "__main__":
+    main()
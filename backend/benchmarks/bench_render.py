@@ -0,0 +1,140 @@
+"""DOCX render time and output size: per-paragraph python-docx versus the template engine.
+
+The baseline is the original ``render_icf``, which built the form from scratch
+with ``Document()`` and one ``add_heading``/``add_paragraph`` call (plus a
+style lookup) per line, including the full processing logs. The template
+engine is timed with the logs inline, moved to an appendix file, and omitted:
+
+    python -m benchmarks.bench_render --sections 4 15 --section-chars 2000 20000 --source-pages 5 50
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+from . import setup_django
+
+setup_django()
+
+from docx import Document  # noqa: E402
+from documents.index import PageIndex  # noqa: E402
+from documents.parsing import ExtractedSection  # noqa: E402
+from documents.pipeline import build_detailed_logs, summarize_page  # noqa: E402
+from documents.rendering import get_template, render_document  # noqa: E402
+from documents.sections import get_registry  # noqa: E402
+from .synthetic import PARAGRAPHS, synthetic_pages  # noqa: E402
+
+SECTION_NAMES = [spec.name for spec in get_registry()]
+
+
+def legacy_render(generated_sections, detailed_logs, generated_text, output_path):
+    doc = Document()
+    doc.add_heading('Informed Consent Form', level=1)
+    doc.add_heading('Generated from Clinical Trial Protocol', level=2)
+    doc.add_paragraph()
+    timestamp = datetime.datetime.now().strftime("%B %d, %Y at %I:%M %p")
+    doc.add_paragraph(f"Generated on: {timestamp}")
+    doc.add_paragraph()
+
+    doc.add_heading('Protocol Information Summary', level=2)
+    doc.add_paragraph("The following information has been extracted from the clinical trial protocol:")
+    for section_name in generated_sections.keys():
+        doc.add_paragraph(f"• {section_name}", style='List Bullet')
+    doc.add_paragraph()
+    for section_name, content in generated_sections.items():
+        doc.add_heading(section_name, level=2)
+        content_para = doc.add_paragraph(content)
+        content_para.style = 'Normal'
+        doc.add_paragraph()
+
+    doc.add_heading('Processing Logs', level=2)
+    doc.add_paragraph("The following logs show the page numbers and content used to generate each section:")
+    doc.add_paragraph()
+    for log_entry in detailed_logs:
+        if log_entry["type"] == "section_generation":
+            doc.add_heading(f"Section: {log_entry['section']}", level=3)
+            doc.add_paragraph(f"Content Length: {log_entry['content_length']} characters")
+            if log_entry.get('contributing_pages'):
+                doc.add_paragraph("Source Pages Used:")
+                for page_info in log_entry['contributing_pages']:
+                    doc.add_paragraph(f"• Page {page_info['page']} (relevance: {page_info['relevance_score']})")
+                    page_sample = doc.add_paragraph(f"  Content sample: {page_info['content_sample']}")
+                    page_sample.style = 'Intense Quote'
+                doc.add_paragraph()
+            doc.add_paragraph("Generated Content:")
+            generated_content = doc.add_paragraph(log_entry['content_preview'])
+            generated_content.style = 'Intense Quote'
+            doc.add_paragraph()
+        elif log_entry["type"] == "document_generation":
+            doc.add_heading("Document Generation Summary", level=3)
+            doc.add_paragraph(f"Sections Generated: {log_entry['sections_count']}")
+            doc.add_paragraph(f"Pages Processed: {log_entry['total_pages_processed']}")
+            doc.add_paragraph()
+    doc.save(output_path)
+
+
+def make_inputs(sections, section_chars, source_pages):
+    pages = synthetic_pages(max(source_pages * 2, 10))
+    index = PageIndex()
+    for page in pages:
+        index.add_page(page["page"], page["text"], summarize_page(page))
+
+    extracted = []
+    for i in range(sections):
+        name = SECTION_NAMES[i] if i < len(SECTION_NAMES) else f"Additional Section {i + 1}"
+        lines, length = [], 0
+        while length < section_chars:
+            lines.append(PARAGRAPHS[(i + len(lines)) % len(PARAGRAPHS)])
+            length += len(lines[-1]) + 1
+        extracted.append(ExtractedSection(name, "\n".join(lines), list(range(1, source_pages + 1))))
+    return extracted, build_detailed_logs(index, extracted)
+
+
+def measure(render, repeat):
+    """Best wall time of ``repeat`` runs and bytes written per run (both files for an appendix)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        best = float("inf")
+        for i in range(repeat):
+            path = os.path.join(tmp, f"icf_{i}.docx")
+            start = time.perf_counter()
+            render(path)
+            best = min(best, time.perf_counter() - start)
+        size = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp)) // repeat
+    return best, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sections", type=int, nargs="+", default=[4, 15])
+    parser.add_argument("--section-chars", type=int, nargs="+", default=[2000, 20000])
+    parser.add_argument("--source-pages", type=int, nargs="+", default=[5, 50])
+    parser.add_argument("--repeat", type=int, default=5, help="best of N runs")
+    args = parser.parse_args()
+
+    template = get_template()  # Loaded once, as in the server
+    headings = get_registry().headings()
+    generated_on = datetime.datetime.now().strftime("%B %d, %Y at %I:%M %p")
+
+    print(f"{'sections':>8} {'chars':>6} {'pages':>5} {'renderer':>17} {'ms':>8} {'bytes':>8} {'speedup':>8}")
+    for sections in args.sections:
+        for chars in args.section_chars:
+            for source_pages in args.source_pages:
+                extracted, detailed_logs = make_inputs(sections, chars, source_pages)
+                # The old renderer took a {name: content} dict
+                generated_sections = {section.name: section.content for section in extracted}
+                text = str(generated_sections)
+                runs = [("python-docx", lambda path: legacy_render(generated_sections, detailed_logs, text, path))]
+                for logs in ("inline", "appendix", "omit"):
+                    runs.append((f"template/{logs}", lambda path, logs=logs: render_document(
+                        template, path, extracted, detailed_logs, text, generated_on, logs=logs, headings=headings)))
+
+                baseline = None
+                for label, render in runs:
+                    seconds, size = measure(render, args.repeat)
+                    baseline = baseline or seconds
+                    print(f"{sections:>8} {chars:>6} {source_pages:>5} {label:>17} {seconds * 1000:>8.1f} "
+                          f"{size:>8} {baseline / seconds:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Size and serialization time of generate responses: full versus compact, DRF's JSON versus orjson.
+
+Runs the pipeline offline over synthetic protocols (and ``--pdf``), then for
+each payload reports its size, the best of ``--repeat`` encodings with DRF's
+``JSONRenderer`` (what every response went through before) and with
+``FastJSONRenderer``, and its size and compression time with gzip and, if
+installed, brotli:
+
+- ``full``: the response as before, with ``generated_text``, ``log`` and ``detailed_logs``
+- ``compact``: ``?response=compact``, sections once and the logs by reference
+- ``logs:pages`` / ``logs:attribution``: the first page (``limit=100``) of each kind from the logs endpoint
+
+    python -m benchmarks.bench_response --pages 100 400 --pdf ../Prot_000.pdf
+"""
+import argparse
+import os
+import tempfile
+import time
+from . import SAMPLE_PDF, setup_django
+
+setup_django()
+
+from django.utils.text import compress_string  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+from documents.middleware import BROTLI_QUALITY, brotli  # noqa: E402
+from documents.pipeline import LOG_KINDS, compact_response, iter_pages, run_pipeline  # noqa: E402
+from documents.renderers import FastJSONRenderer  # noqa: E402
+from documents.serialization import orjson  # noqa: E402
+from .synthetic import write_protocol_pdf  # noqa: E402
+
+LOGS_URL = "/api/jobs/0123456789abcdef0123456789abcdef/logs/"
+
+
+def generate(path):
+    with tempfile.TemporaryDirectory() as tmp, open(path, "rb") as f:
+        return run_pipeline(iter_pages(f, path), output_path=os.path.join(tmp, "icf.docx"))
+
+
+def payloads(result):
+    yield "full", result
+    yield "compact", compact_response(result, LOGS_URL)
+    for kind, key in LOG_KINDS.items():
+        entries = result[key][:100]
+        yield f"logs:{kind}", {"count": len(result[key]), "next": None, "previous": None, "results": entries}
+
+
+def best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        best = min(best, time.perf_counter() - start)
+    return value, best
+
+
+def run(label, result, repeat):
+    for name, data in payloads(result):
+        body, drf = best_of(repeat, lambda: JSONRenderer().render(data))
+        _, fast = best_of(repeat, lambda: FastJSONRenderer().render(data))
+        gzipped, gzip_time = best_of(repeat, lambda: compress_string(body, max_random_bytes=100))
+        row = (f"{label:>14} {name:>17} {len(body) / 1024:>9.1f} {drf * 1000:>8.2f} {fast * 1000:>8.2f} "
+               f"{len(gzipped) / 1024:>8.1f} {gzip_time * 1000:>7.2f}")
+        if brotli:
+            compressed, br_time = best_of(repeat, lambda: brotli.compress(body, quality=BROTLI_QUALITY))
+            row += f" {len(compressed) / 1024:>8.1f} {br_time * 1000:>7.2f}"
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 400])
+    parser.add_argument("--pdf", help="also measure this protocol's responses", nargs="?", const=SAMPLE_PDF)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"JSON: DRF JSONRenderer vs FastJSONRenderer ({'orjson' if orjson else 'json fallback'})")
+    header = (f"{'protocol':>14} {'payload':>17} {'KB':>9} {'drf ms':>8} {'fast ms':>8} "
+              f"{'gzip KB':>8} {'gzip ms':>7}")
+    print(header + (f" {'br KB':>8} {'br ms':>7}" if brotli else ""))
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.pages:
+            path = os.path.join(tmp, f"protocol_{count}.pdf")
+            write_protocol_pdf(path, count)
+            run(f"synthetic-{count}", generate(path), args.repeat)
+    if args.pdf:
+        run("pdf", generate(args.pdf), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
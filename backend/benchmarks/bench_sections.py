@@ -0,0 +1,88 @@
+"""Latency of chunked versus per-section extraction as the section registry grows.
+
+``chunked`` asks for every section from each chunk of pages, so each reply
+grows with the number of sections; ``per_section`` makes one call per section
+over its top-ranked pages, all in flight at once. Runs offline against
+``StubLLMClient`` with a fixed latency per call plus a latency per streamed
+delta, so longer replies take longer, as they do with a real model:
+
+    python -m benchmarks.bench_sections --pages 100 400 --sections 4 8 14 --latency 0.2 --token-latency 0.002
+"""
+import argparse
+import time
+from functools import partial
+from . import setup_django
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from documents.chunking import map_reduce_sections  # noqa: E402
+from documents.llm_stub import StubLLMClient  # noqa: E402
+from documents.pipeline import generate_sections_per_section, new_page_index, summarize_page  # noqa: E402
+from documents.sections import SectionRegistry, get_registry  # noqa: E402
+from .synthetic import synthetic_pages  # noqa: E402
+
+
+class CountingClient(StubLLMClient):
+    """Stub client that also totals the prompt tokens it is sent."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prompt_tokens = 0
+
+    def _begin(self, messages):
+        with self._lock:
+            self.prompt_tokens += len(messages[-1]["content"]) // 4
+        return super()._begin(messages)
+
+
+def protocol_pages(count, specs):
+    """Synthetic pages, with a sentence for each registry section on a few of them."""
+    pages = synthetic_pages(count)
+    for i, spec in enumerate(specs):
+        for page in pages[i % count::max(count // 3, 1)][:3]:
+            page["text"] += f"\n{spec.name}: {', '.join(spec.keywords)} are described in this part of the protocol."
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 400])
+    parser.add_argument("--sections", type=int, nargs="+", default=[4, 8, 14])
+    parser.add_argument("--latency", type=float, default=0.2, help="stub seconds per LLM call")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="stub seconds per streamed delta")
+    parser.add_argument("--in-flight", type=int, default=4, help="concurrent calls in chunked mode")
+    args = parser.parse_args()
+
+    specs = list(get_registry())
+    chunk_tokens = settings.ICF_CHUNK_TOKENS
+    ignore_token = lambda chunk, text: None  # noqa: E731 - streaming makes reply length count
+
+    print(f"{'pages':>6} {'sections':>8} {'mode':>11} {'calls':>6} {'prompt tok':>10} {'seconds':>8} {'found':>6}")
+    for count in args.pages:
+        pages = protocol_pages(count, specs)
+        index = new_page_index()
+        for page in pages:
+            index.add_page(page["page"], page["text"], summarize_page(page))
+        texts = {page["page"]: page["text"] for page in pages}
+
+        for n in args.sections:
+            subset = SectionRegistry(specs[:n])
+            runs = [
+                ("chunked", lambda client: map_reduce_sections(
+                    pages, partial(subset.build_prompt, specs=subset.specs), client=client,
+                    max_tokens=chunk_tokens, max_in_flight=args.in_flight, on_token=ignore_token)),
+                ("per_section", lambda client: generate_sections_per_section(
+                    index, texts, subset.specs, on_token=ignore_token, client=client)[1]),
+            ]
+            for mode, run in runs:
+                client = CountingClient(latency=args.latency, token_latency=args.token_latency)
+                start = time.perf_counter()
+                sections = run(client)
+                elapsed = time.perf_counter() - start
+                print(f"{count:>6} {n:>8} {mode:>11} {client.calls:>6} {client.prompt_tokens:>10} "
+                      f"{elapsed:>8.2f} {len(sections):>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Deterministic synthetic protocol content for benchmarks."""
+import random
+
+PARAGRAPHS = [
+    "The purpose of this study is to evaluate the safety and efficacy of the investigational product.",
+    "Study procedures include screening, randomization, dosing visits and follow-up assessments.",
+    "Risks include adverse events such as headache, nausea and injection site reactions.",
+    "Participants may benefit from improvement in symptoms, although benefit is not guaranteed.",
+    "Data will be recorded in the electronic case report form and monitored by the sponsor.",
+    "Laboratory samples are shipped to the central laboratory and stored for up to five years.",
+    "The investigator must report serious adverse events to the sponsor within 24 hours.",
+    "Statistical analysis will use a mixed model for repeated measures on the primary endpoint.",
+]
+
+
+def synthetic_pages(count, paragraphs_per_page=12, seed=0):
+    """Return ``count`` page dicts built from shuffled protocol-like paragraphs."""
+    rng = random.Random(seed)
+    return [
+        {"page": number, "text": "\n".join(rng.choice(PARAGRAPHS) for _ in range(paragraphs_per_page))}
+        for number in range(1, count + 1)
+    ]
+
+
+# One sentence per consent form section, so the stub model finds every registered section somewhere
+SECTION_SENTENCES = [
+    "Confidentiality of study records is protected; data are coded and kept private.",
+    "Use of health information is described, including disclosure to the sponsor and regulators.",
+    "There are no costs to participants for the study drug or study visits.",
+    "Compensation for injury: medical treatment is provided if a research injury occurs.",
+    "Payment for participation covers travel and time at each visit.",
+    "Research funding for this trial is provided by the sponsor company.",
+    "Voluntary participation: participants may withdraw at any time without penalty.",
+    "Alternatives to participation include standard of care and other approved treatments.",
+    "Contact information for questions is the study investigator's telephone number.",
+    "Study duration is about 28 weeks, including the follow-up visits.",
+]
+
+
+def protocol_page_texts(count, paragraphs_per_page=10, seed=0):
+    """Page texts for a synthetic protocol: protocol-like paragraphs plus a section sentence every few pages."""
+    pages = synthetic_pages(count, paragraphs_per_page, seed)
+    for i, page in enumerate(pages):
+        if i % 3 == 0:
+            page["text"] += "\n" + SECTION_SENTENCES[(i // 3) % len(SECTION_SENTENCES)]
+    return [page["text"] for page in pages]
+
+
+def write_protocol_pdf(path, pages, seed=0):
+    """Write a ``pages``-page protocol PDF with a running header and footer."""
+    import fitz
+
+    doc = fitz.open()
+    for number, text in enumerate(protocol_page_texts(pages, seed=seed), start=1):
+        page = doc.new_page()
+        page.insert_text((36, 30), "Protocol XYZ-123 Version 2.0", fontsize=8)
+        page.insert_textbox(fitz.Rect(36, 60, 560, 780), text, fontsize=10)
+        page.insert_text((36, 820), f"Confidential  Page {number} of {pages}", fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+def write_protocol_docx(path, pages, seed=0):
+    """Write a protocol DOCX with a heading and page break per synthetic page."""
+    import docx
+    from docx.enum.text import WD_BREAK
+
+    doc = docx.Document()
+    for number, text in enumerate(protocol_page_texts(pages, seed=seed), start=1):
+        doc.add_heading(f"{number} Protocol Section {number}", 1)
+        for line in text.split("\n"):
+            doc.add_paragraph(line)
+        doc.paragraphs[-1].add_run().add_break(WD_BREAK.PAGE)
+    doc.save(path)
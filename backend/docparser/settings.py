@@ -7,6 +7,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Load .env file
 load_dotenv(BASE_DIR / ".env")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # e.g. a local `python -m documents.llm_stub` server
 
 SECRET_KEY = "django-insecure-clinical-protocol-extractor-interview-project"
 DEBUG = True
@@ -30,6 +31,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
 'corsheaders.middleware.CorsMiddleware',
+'documents.middleware.CompressionMiddleware',
 'django.middleware.security.SecurityMiddleware',
 'django.contrib.sessions.middleware.SessionMiddleware',
 'django.middleware.common.CommonMiddleware',
@@ -79,3 +81,121 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # CORS
 
 CORS_ALLOW_ALL_ORIGINS = True
+
+# Background ICF generation jobs
+
+ICF_JOB_BACKEND = os.getenv("ICF_JOB_BACKEND", "documents.jobs.ThreadPoolBackend")
+ICF_JOB_WORKERS = int(os.getenv("ICF_JOB_WORKERS", "4"))
+ICF_JOB_MAX_QUEUE = int(os.getenv("ICF_JOB_MAX_QUEUE", "32"))
+ICF_JOB_TTL = int(os.getenv("ICF_JOB_TTL", "3600"))
+ICF_JOB_MAX_ENTRIES = int(os.getenv("ICF_JOB_MAX_ENTRIES", "256"))  # Finished jobs kept in memory, LRU beyond
+
+# Async views for ASGI servers (e.g. uvicorn docparser.asgi:application)
+
+ICF_ASYNC_VIEWS = os.getenv("ICF_ASYNC_VIEWS", "False") == "True"
+ICF_ASYNC_WORKERS = int(os.getenv("ICF_ASYNC_WORKERS", str(min(4, os.cpu_count() or 1))))  # threads for blocking work
+
+# Responses: "full" (sections, generated_text and logs inline) or "compact" (sections once, logs paginated
+# at /api/jobs/<id>/logs/), per request with ?response=; JSON/text bodies compressed when the client accepts it
+
+ICF_RESPONSE_FORMAT = os.getenv("ICF_RESPONSE_FORMAT", "full")
+ICF_RESPONSE_COMPRESSION = os.getenv("ICF_RESPONSE_COMPRESSION", "br,gzip")  # preferred first; "br" needs brotli; "" = off
+ICF_COMPRESSION_MIN_BYTES = int(os.getenv("ICF_COMPRESSION_MIN_BYTES", "1024"))
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "documents.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
+# LLM extraction
+
+ICF_LLM_BACKEND = os.getenv("ICF_LLM_BACKEND", "openai")  # "openai" or "stub" (offline, deterministic)
+ICF_LLM_MODEL = os.getenv("ICF_LLM_MODEL", "gpt-4o-mini")
+ICF_STUB_LLM_LATENCY = float(os.getenv("ICF_STUB_LLM_LATENCY", "0"))
+ICF_CHUNK_TOKENS = int(os.getenv("ICF_CHUNK_TOKENS", "3000"))
+ICF_CHUNK_OVERLAP_PAGES = int(os.getenv("ICF_CHUNK_OVERLAP_PAGES", "1"))
+ICF_LLM_MAX_IN_FLIGHT = int(os.getenv("ICF_LLM_MAX_IN_FLIGHT", "4"))
+
+# Sections to extract (name, prompt, keywords, length limit and template heading per section)
+
+ICF_SECTIONS_PATH = os.getenv("ICF_SECTIONS_PATH", str(BASE_DIR / "documents" / "sections.json"))
+ICF_EXTRACTION_MODE = os.getenv("ICF_EXTRACTION_MODE", "per_section")  # "per_section" or "chunked"
+ICF_SECTION_TOP_PAGES = int(os.getenv("ICF_SECTION_TOP_PAGES", "6"))
+ICF_SECTION_MAX_IN_FLIGHT = int(os.getenv("ICF_SECTION_MAX_IN_FLIGHT", "16"))
+
+# Ranking pages for each section
+
+ICF_RELEVANCE = os.getenv("ICF_RELEVANCE", "vectors")  # "vectors" (hashed TF-IDF) or "bm25" (keywords only)
+ICF_VECTOR_DIM = int(os.getenv("ICF_VECTOR_DIM", "8192"))
+ICF_VECTOR_MMAP_PAGES = int(os.getenv("ICF_VECTOR_MMAP_PAGES", "2000"))  # larger matrices go to a temp file; 0 = never
+ICF_SECTION_MIN_RELEVANCE = float(os.getenv("ICF_SECTION_MIN_RELEVANCE", "0.6"))  # share of a section's best score
+
+# LLM gateway (shared client, rate limits and retries)
+
+ICF_LLM_TIMEOUT = float(os.getenv("ICF_LLM_TIMEOUT", "60"))
+ICF_LLM_MAX_RETRIES = int(os.getenv("ICF_LLM_MAX_RETRIES", "4"))
+ICF_LLM_REQUESTS_PER_MINUTE = int(os.getenv("ICF_LLM_REQUESTS_PER_MINUTE", "0"))  # 0 = unlimited
+ICF_LLM_TOKENS_PER_MINUTE = int(os.getenv("ICF_LLM_TOKENS_PER_MINUTE", "0"))  # 0 = unlimited
+ICF_LLM_MAX_CONNECTIONS = int(os.getenv("ICF_LLM_MAX_CONNECTIONS", "32"))
+
+# Cache for extracted pages and LLM responses
+
+ICF_CACHE_ENABLED = os.getenv("ICF_CACHE_ENABLED", "True") == "True"
+ICF_CACHE_PATH = os.getenv("ICF_CACHE_PATH", str(BASE_DIR / "icf_cache.sqlite3"))
+ICF_CACHE_MAX_BYTES = int(os.getenv("ICF_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+ICF_CACHE_TTL = int(os.getenv("ICF_CACHE_TTL", str(7 * 24 * 3600)))
+
+# PDF extraction
+
+ICF_PDF_WORKERS = int(os.getenv("ICF_PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+ICF_PDF_PARALLEL_MIN_PAGES = int(os.getenv("ICF_PDF_PARALLEL_MIN_PAGES", "100"))
+ICF_PDF_BATCH_PAGES = int(os.getenv("ICF_PDF_BATCH_PAGES", "16"))
+# Strip running headers/footers and write tables compactly (see documents/layout.py)
+ICF_PDF_LAYOUT = os.getenv("ICF_PDF_LAYOUT", "True") == "True"
+ICF_PDF_MARGIN = float(os.getenv("ICF_PDF_MARGIN", "0.12"))  # share of page height searched for headers/footers
+ICF_PDF_TABLES = os.getenv("ICF_PDF_TABLES", "False") == "True"  # ~0.2s per ruled page
+
+# DOCX extraction (logical pages split at breaks, headings and about this many characters)
+
+ICF_DOCX_PAGE_CHARS = int(os.getenv("ICF_DOCX_PAGE_CHARS", "3000"))
+
+# Batch processing
+
+ICF_BATCH_MAX_DOCUMENTS = int(os.getenv("ICF_BATCH_MAX_DOCUMENTS", "2"))
+ICF_BATCH_LLM_CONCURRENCY = int(os.getenv("ICF_BATCH_LLM_CONCURRENCY", "4"))
+ICF_BATCH_REQUESTS_PER_MINUTE = int(os.getenv("ICF_BATCH_REQUESTS_PER_MINUTE", "0"))
+
+# Protocol persistence (pages and sections in the database; amendments reuse unchanged work)
+
+ICF_PERSIST_PROTOCOLS = os.getenv("ICF_PERSIST_PROTOCOLS", "True") == "True"
+ICF_PROTOCOL_MAX_VERSIONS = int(os.getenv("ICF_PROTOCOL_MAX_VERSIONS", "10"))  # newest kept per protocol; 0 = all
+ICF_PROTOCOL_RETENTION_DAYS = int(os.getenv("ICF_PROTOCOL_RETENTION_DAYS", "0"))  # for prune_protocols; 0 = forever
+
+# DOCX rendering
+
+ICF_TEMPLATE_PATH = os.getenv("ICF_TEMPLATE_PATH", str(BASE_DIR / "documents" / "templates" / "ICF-template.docx"))
+ICF_RENDER_LOGS = os.getenv("ICF_RENDER_LOGS", "inline")  # "inline", "appendix" (separate DOCX) or "omit"
+
+# Generated file storage (content-addressed, expiring)
+
+ICF_ARTIFACT_ROOT = os.getenv("ICF_ARTIFACT_ROOT", str(BASE_DIR / "artifacts"))
+ICF_ARTIFACT_TTL = int(os.getenv("ICF_ARTIFACT_TTL", str(24 * 3600)))
+ICF_ARTIFACT_MAX_BYTES = int(os.getenv("ICF_ARTIFACT_MAX_BYTES", str(1024 * 1024 * 1024)))
+ICF_ARTIFACT_SWEEP_INTERVAL = int(os.getenv("ICF_ARTIFACT_SWEEP_INTERVAL", "300"))
+# Offload downloads to the web server: an nginx internal location mapped to ICF_ARTIFACT_ROOT,
+# e.g. "/protected-artifacts/", or X-Sendfile for Apache/lighttpd
+ICF_ARTIFACT_ACCEL_REDIRECT = os.getenv("ICF_ARTIFACT_ACCEL_REDIRECT", "")
+ICF_ARTIFACT_SENDFILE = os.getenv("ICF_ARTIFACT_SENDFILE", "False") == "True"
+
+# Metrics (stage timings in responses and logs, Prometheus text at /metrics)
+
+ICF_METRICS_ENABLED = os.getenv("ICF_METRICS_ENABLED", "True") == "True"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {"documents": {"handlers": ["console"], "level": os.getenv("ICF_LOG_LEVEL", "INFO")}},
+}
@@ -0,0 +1,32 @@
+from django.contrib import admin
+from .models import Protocol, ProtocolVersion, Page, Section
+
+
+class ProtocolVersionInline(admin.TabularInline):
+    model = ProtocolVersion
+    fields = ["number", "file_name", "status", "page_count", "pages_reused", "sections_reused", "created_at"]
+    readonly_fields = fields
+    extra = 0
+
+
+@admin.register(Protocol)
+class ProtocolAdmin(admin.ModelAdmin):
+    list_display = ["id", "title", "created_at"]
+    inlines = [ProtocolVersionInline]
+
+
+@admin.register(ProtocolVersion)
+class ProtocolVersionAdmin(admin.ModelAdmin):
+    list_display = ["protocol", "number", "file_name", "status", "page_count", "pages_reused", "pages_changed",
+                    "sections_reused", "sections_regenerated", "created_at"]
+    list_filter = ["status"]
+
+
+@admin.register(Page)
+class PageAdmin(admin.ModelAdmin):
+    list_display = ["version", "number", "text_hash"]
+
+
+@admin.register(Section)
+class SectionAdmin(admin.ModelAdmin):
+    list_display = ["version", "name", "source_pages", "reused_from"]
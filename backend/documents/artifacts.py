@@ -0,0 +1,220 @@
+"""Managed storage for generated ICFs and batch archives.
+
+Files are stored once per content hash under ``root/blobs/ab/<sha256>`` and
+handed out under opaque random ids recorded in a small SQLite index, so
+identical outputs share a blob and download URLs never expose paths. Rendered
+ICFs carry their generation time, so they are stored under a hash of what
+they were rendered from instead (``content_key``), or no two would match. Each
+artifact expires ``ttl`` seconds after it was stored; a background sweeper
+removes expired artifacts, and storing past ``max_bytes`` evicts the oldest
+artifacts until the blobs fit again. A blob is deleted once no artifact
+points at it.
+"""
+import logging
+import os
+import secrets
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from django.conf import settings
+from .cache import sha256_file
+
+logger = logging.getLogger(__name__)
+
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+ZIP_CONTENT_TYPE = "application/zip"
+
+
+@dataclass
+class Artifact:
+    id: str
+    sha256: str
+    filename: str
+    content_type: str
+    size: int
+    created_at: float
+    expires_at: float
+    path: str
+
+    @property
+    def etag(self):
+        return f'"{self.sha256}"'
+
+    @property
+    def download_url(self):
+        return f"/api/download_icf/?file={self.id}"
+
+
+class ArtifactStore:
+    def __init__(self, root, ttl=24 * 3600, max_bytes=1024 * 1024 * 1024):
+        self.root = str(root)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.blob_dir = os.path.join(self.root, "blobs")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(self.root, "artifacts.sqlite3"), check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            " id TEXT PRIMARY KEY, sha256 TEXT NOT NULL, filename TEXT NOT NULL, content_type TEXT NOT NULL,"
+            " size INTEGER NOT NULL, created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS artifacts_sha256 ON artifacts (sha256)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS artifacts_expires ON artifacts (expires_at)")
+        self._sweeper = None
+        self._stop = threading.Event()
+
+    def blob_path(self, sha256):
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
+
+    def relative_blob_path(self, sha256):
+        return f"blobs/{sha256[:2]}/{sha256}"
+
+    def _artifact(self, row):
+        artifact_id, sha256, filename, content_type, size, created_at, expires_at = row
+        return Artifact(artifact_id, sha256, filename, content_type, size, created_at, expires_at,
+                        self.blob_path(sha256))
+
+    def put(self, path, filename, content_type, content_key=None):
+        """Move the file at ``path`` into the store and return its new ``Artifact``.
+
+        Blobs are keyed by ``content_key`` if given, else by the file's
+        SHA-256. If the blob exists, ``path`` is simply removed and the
+        artifact gets the stored blob's size, which for a ``content_key`` may
+        differ from the new file's.
+        """
+        if content_key is not None:
+            sha256 = content_key
+        else:
+            with open(path, "rb") as f:
+                sha256 = sha256_file(f)
+        blob = self.blob_path(sha256)
+        now = time.time()
+        artifact_id = secrets.token_urlsafe(16)
+
+        with self._lock:
+            if os.path.exists(blob):
+                size = os.path.getsize(blob)
+                os.unlink(path)
+            else:
+                size = os.path.getsize(path)
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                # Move via a temp name in the blob dir so a blob is never seen half-written
+                staging = tempfile.NamedTemporaryFile(dir=os.path.dirname(blob), delete=False)
+                staging.close()
+                shutil.move(path, staging.name)
+                os.replace(staging.name, blob)
+            self._conn.execute(
+                "INSERT INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (artifact_id, sha256, filename, content_type, size, now, now + self.ttl),
+            )
+            self._enforce_quota(keep=artifact_id)
+        return Artifact(artifact_id, sha256, filename, content_type, size, now, now + self.ttl, blob)
+
+    def get(self, artifact_id):
+        """Return the artifact for ``artifact_id``, or ``None`` if unknown, expired or evicted."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, sha256, filename, content_type, size, created_at, expires_at FROM artifacts"
+                " WHERE id = ? AND expires_at > ?",
+                (artifact_id, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        artifact = self._artifact(row)
+        return artifact if os.path.exists(artifact.path) else None
+
+    def _delete(self, rows):
+        # Caller holds the lock; remove rows, then any blob nothing else points at
+        self._conn.executemany("DELETE FROM artifacts WHERE id = ?", [(artifact_id,) for artifact_id, _ in rows])
+        for sha256 in {sha256 for _, sha256 in rows}:
+            if self._conn.execute("SELECT 1 FROM artifacts WHERE sha256 = ? LIMIT 1", (sha256,)).fetchone():
+                continue
+            try:
+                os.unlink(self.blob_path(sha256))
+            except FileNotFoundError:
+                pass
+
+    def _blob_bytes(self):
+        return self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM artifacts GROUP BY sha256)"
+        ).fetchone()[0]
+
+    def _enforce_quota(self, keep=None):
+        """Evict the oldest artifacts until the blobs fit, never ``keep`` (the one just stored)."""
+        total = self._blob_bytes()
+        if total <= self.max_bytes:
+            return
+        # Oldest first; deleting an artifact only frees space once its blob is unreferenced
+        for artifact_id, sha256 in self._conn.execute(
+            "SELECT id, sha256 FROM artifacts WHERE id != ? ORDER BY created_at", (keep or "",)
+        ).fetchall():
+            self._delete([(artifact_id, sha256)])
+            total = self._blob_bytes()
+            if total <= self.max_bytes:
+                break
+        logger.info("Artifact store over quota, evicted down to %d bytes", total)
+
+    def evict_expired(self):
+        """Remove expired artifacts and their unreferenced blobs; return how many were removed."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, sha256 FROM artifacts WHERE expires_at <= ?", (time.time(),)
+            ).fetchall()
+            if rows:
+                self._delete(rows)
+        return len(rows)
+
+    def stats(self):
+        with self._lock:
+            artifacts, blobs = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT sha256) FROM artifacts"
+            ).fetchone()
+            size = self._blob_bytes()
+        return {"artifacts": artifacts, "blobs": blobs, "bytes": size, "max_bytes": self.max_bytes}
+
+    def start_sweeper(self, interval):
+        """Evict expired artifacts every ``interval`` seconds on a daemon thread."""
+        def sweep():
+            while not self._stop.wait(interval):
+                try:
+                    removed = self.evict_expired()
+                    if removed:
+                        logger.info("Evicted %d expired artifacts", removed)
+                except Exception:
+                    logger.exception("Artifact sweep failed")
+
+        self._sweeper = threading.Thread(target=sweep, name="icf-artifact-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def close(self):
+        self._stop.set()
+        self._conn.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store():
+    """Return the shared artifact store, starting its sweeper on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArtifactStore(
+                settings.ICF_ARTIFACT_ROOT,
+                ttl=getattr(settings, "ICF_ARTIFACT_TTL", 24 * 3600),
+                max_bytes=getattr(settings, "ICF_ARTIFACT_MAX_BYTES", 1024 * 1024 * 1024),
+            )
+            _store.start_sweeper(getattr(settings, "ICF_ARTIFACT_SWEEP_INTERVAL", 300))
+        return _store
+
+
+def peek_artifact_store():
+    """Return the artifact store if it has been created, without creating it."""
+    return _store
@@ -0,0 +1,222 @@
+"""Batch ICF generation for whole study portfolios.
+
+``run_batch`` takes files, directories and zip archives, skips inputs whose
+contents were already seen, and generates an ICF per unique protocol. All
+documents share one limit on concurrent model calls and one requests-per-minute
+budget. Outputs and a ``manifest.json`` are written to the output directory.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from django.db import close_old_connections
+from .cache import sha256_file
+from .llm import get_client
+from .pipeline import process_upload, is_supported_file
+
+STAGES = ("extraction", "llm", "attribution", "render")
+
+
+class RateLimiter:
+    """Spaces calls so no more than ``per_minute`` start in any minute (0 disables)."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class LimitedClient:
+    """Wraps a chat client so every call takes a shared concurrency slot and rate-limit turn."""
+
+    def __init__(self, client, max_concurrency, limiter):
+        self._client = client
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._limiter = limiter
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self._limiter.wait()
+        with self._slots:
+            return self._client.chat.completions.create(**kwargs)
+
+
+def collect_inputs(paths, workdir):
+    """Expand files, directories and zip archives into ``(path, label)`` pairs.
+
+    ``label`` is what the manifest shows: the path as given (or relative to the
+    directory it was found in), or ``archive.zip:member`` for archive members,
+    which are extracted under ``workdir``.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    full_path = os.path.join(root, name)
+                    label = os.path.relpath(full_path, path)
+                    if is_supported_file(name):
+                        found.append((full_path, label))
+                    elif name.lower().endswith(".zip"):
+                        found.extend((member, f"{label}:{member_label.split(':', 1)[1]}")
+                                     for member, member_label in collect_inputs([full_path], workdir))
+        elif zipfile.is_zipfile(path):
+            target = tempfile.mkdtemp(prefix="zip_", dir=workdir)
+            with zipfile.ZipFile(path) as archive:
+                for index, member in enumerate(archive.infolist()):
+                    name = os.path.basename(member.filename)
+                    if member.is_dir() or not is_supported_file(name) or name.startswith("."):
+                        continue
+                    # Flatten members so archive paths can't escape the target directory
+                    destination = os.path.join(target, f"{index}_{name}")
+                    with archive.open(member) as src, open(destination, "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+                    found.append((destination, f"{os.path.basename(path)}:{member.filename}"))
+        elif os.path.isfile(path) and is_supported_file(path):
+            found.append((path, path))
+    return found
+
+
+def output_name(source, taken):
+    """A unique ``<stem>_ICF.docx`` name in ``taken`` for the manifest label ``source``.
+
+    The stem comes from the file's own name, so an archive member's label
+    (``archive.zip:member``) doesn't put the archive name or a colon in it.
+    """
+    member = source.rsplit(":", 1)[-1]
+    stem = os.path.splitext(os.path.basename(member))[0]
+    name = f"{stem}_ICF.docx"
+    counter = 1
+    while name in taken:
+        counter += 1
+        name = f"{stem}_ICF_{counter}.docx"
+    taken.add(name)
+    return name
+
+
+def process_document(path, output_path, client):
+    """Run the pipeline on one file, saving its DOCX to ``output_path``, and return manifest fields."""
+    timings = {}
+    marks = [("extraction", time.perf_counter())]
+
+    def on_stage(stage, progress):
+        marks.append((stage, time.perf_counter()))
+
+    with open(path, "rb") as f:
+        result = process_upload(f, os.path.basename(path), on_stage=on_stage, client=client, output_path=output_path)
+    marks.append(("done", time.perf_counter()))
+
+    for (stage, started), (_, ended) in zip(marks, marks[1:]):
+        timings[stage] = timings.get(stage, 0.0) + ended - started
+
+    return {
+        "sections": sorted(result.get("sections", {})),
+        "pages": len(result["log"]),
+        "timings": {stage: round(seconds, 3) for stage, seconds in timings.items()},
+    }
+
+
+def run_batch(paths, output_dir, max_documents=2, max_llm_concurrency=4, requests_per_minute=0,
+              client=None, on_progress=None):
+    """Generate ICFs for every protocol under ``paths`` into ``output_dir`` and return the manifest.
+
+    ``max_documents`` protocols are processed at once; across all of them at
+    most ``max_llm_concurrency`` model calls are in flight and at most
+    ``requests_per_minute`` start per minute. ``on_progress(done, total)`` is
+    called after each unique document finishes.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+    workdir = tempfile.mkdtemp(prefix="icf_batch_work_")
+    try:
+        sources = collect_inputs(paths, workdir)
+
+        # Deduplicate by content so each distinct protocol is processed once
+        entries = []
+        unique = {}
+        for path, label in sources:
+            with open(path, "rb") as f:
+                digest = sha256_file(f)
+            entry = {"source": label, "path": path, "sha256": digest}
+            if digest in unique:
+                entry["duplicate_of"] = unique[digest]["source"]
+            else:
+                unique[digest] = entry
+            entries.append(entry)
+
+        limited = LimitedClient(client or get_client(), max_llm_concurrency, RateLimiter(requests_per_minute))
+        taken = set()
+        for entry in unique.values():
+            entry["output"] = output_name(entry["source"], taken)
+
+        done = 0
+        done_lock = threading.Lock()
+
+        def work(entry):
+            nonlocal done
+            try:
+                entry.update(process_document(entry["path"], os.path.join(output_dir, entry["output"]), limited))
+                entry["status"] = "succeeded"
+            except Exception as e:
+                entry["status"] = "failed"
+                entry["error"] = str(e)
+                entry.pop("output", None)
+            finally:
+                close_old_connections()
+            with done_lock:
+                done += 1
+                if on_progress:
+                    on_progress(done, len(unique))
+
+        with ThreadPoolExecutor(max_workers=max(1, max_documents), thread_name_prefix="icf-batch") as executor:
+            list(executor.map(work, unique.values()))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for entry in entries:
+        del entry["path"]
+        if "duplicate_of" in entry:
+            original = unique[entry["sha256"]]
+            entry["status"] = original["status"]
+            if "output" in original:
+                entry["output"] = original["output"]
+
+    elapsed = time.perf_counter() - started
+    stage_seconds = defaultdict(float)
+    for entry in unique.values():
+        for stage, seconds in entry.get("timings", {}).items():
+            stage_seconds[stage] += seconds
+    succeeded = sum(1 for entry in unique.values() if entry["status"] == "succeeded")
+
+    manifest = {
+        "documents": entries,
+        "summary": {
+            "inputs": len(entries),
+            "unique": len(unique),
+            "duplicates": len(entries) - len(unique),
+            "succeeded": succeeded,
+            "failed": len(unique) - succeeded,
+            "elapsed_seconds": round(elapsed, 3),
+            "documents_per_minute": round(succeeded / elapsed * 60, 2) if elapsed else 0.0,
+            "stage_seconds": {stage: round(stage_seconds[stage], 3) for stage in STAGES if stage in stage_seconds},
+        },
+    }
+    with open(os.path.join(output_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
@@ -0,0 +1,133 @@
+"""Content-addressed on-disk cache for extracted pages and model responses.
+
+Entries live in a single SQLite file. Each entry records its size and last
+access time so the cache can evict least-recently-used entries once it grows
+past ``max_bytes``, and entries older than ``ttl`` seconds are treated as
+misses and removed.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+def sha256_file(file_obj):
+    """Hash an uploaded or open file without loading it into memory, then rewind it."""
+    digest = hashlib.sha256()
+    if hasattr(file_obj, "chunks"):
+        blocks = file_obj.chunks()
+    else:
+        blocks = iter(lambda: file_obj.read(READ_BLOCK_SIZE), b"")
+    for block in blocks:
+        digest.update(block)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def sha256_text(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ContentCache:
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, ttl=7 * 24 * 3600):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, namespace TEXT NOT NULL, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+
+    def get(self, namespace, key):
+        """Return the cached value for ``key`` or ``None`` on a miss."""
+        full_key = f"{namespace}:{key}"
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM entries WHERE key = ?", (full_key,)
+            ).fetchone()
+            if row and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (full_key,))
+                row = None
+            if row is None:
+                self.misses[namespace] += 1
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, full_key))
+            self.hits[namespace] += 1
+        return json.loads(row[0])
+
+    def set(self, namespace, key, value):
+        payload = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, namespace, value, size, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (f"{namespace}:{key}", namespace, payload, len(payload), now, now),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        cursor = self._conn.execute("SELECT key, size FROM entries ORDER BY accessed_at")
+        doomed = []
+        for key, size in cursor:
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", doomed)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the shared cache, or ``None`` when ``ICF_CACHE_ENABLED`` is off."""
+    global _cache
+    if not getattr(settings, "ICF_CACHE_ENABLED", True):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ContentCache(
+                settings.ICF_CACHE_PATH,
+                max_bytes=getattr(settings, "ICF_CACHE_MAX_BYTES", 256 * 1024 * 1024),
+                ttl=getattr(settings, "ICF_CACHE_TTL", 7 * 24 * 3600),
+            )
+        return _cache
@@ -0,0 +1,37 @@
+"""Cooperative cancellation of a pipeline run, e.g. when a streaming client disconnects.
+
+A run started inside ``cancellable(event)`` calls ``check()`` between pages
+and before and during each model call; once ``event`` is set, the next
+check raises ``Cancelled``. The event travels in a context variable, so the
+chunk threads, which run in a copy of the caller's context, see it too.
+"""
+import contextvars
+from contextlib import contextmanager
+
+_event = contextvars.ContextVar("icf_cancel_event", default=None)
+
+
+class Cancelled(BaseException):
+    """Raised inside a cancelled run.
+
+    A ``BaseException``, like ``asyncio.CancelledError``, so the pipeline's
+    ``except Exception`` handlers that skip a failed chunk don't swallow it
+    and carry on.
+    """
+
+
+@contextmanager
+def cancellable(event):
+    """Run the block so that setting ``event`` (a ``threading.Event``) cancels it."""
+    token = _event.set(event)
+    try:
+        yield
+    finally:
+        _event.reset(token)
+
+
+def check():
+    """Raise ``Cancelled`` if the current run has been cancelled."""
+    event = _event.get()
+    if event is not None and event.is_set():
+        raise Cancelled
@@ -0,0 +1,257 @@
+"""Page-aligned chunking and map-reduce section extraction over a whole protocol."""
+import asyncio
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .llm import achat, chat, stream_chat
+from .parsing import ExtractedSection, IncrementalParser, parse_response
+from .metrics import span
+from . import cancellation
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class Chunk:
+    def __init__(self, index, pages):
+        self.index = index
+        self.pages = pages  # list of (page_number, text)
+
+    @property
+    def page_numbers(self):
+        return sorted({num for num, _ in self.pages})
+
+    @property
+    def tokens(self):
+        return sum(estimate_tokens(text) for _, text in self.pages)
+
+    def render(self):
+        """Text sent to the model, with a ``[Page N]`` marker before each page."""
+        return "\n".join(f"[Page {num}]\n{text}" for num, text in self.pages)
+
+
+def _split_page(page, max_tokens):
+    # A single page bigger than the budget is cut into pieces that keep its page number
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    text = page["text"]
+    for start in range(0, len(text), max_chars):
+        yield (page["page"], text[start:start + max_chars])
+
+
+def chunk_pages(pages, max_tokens=3000, overlap_pages=1):
+    """Group pages into chunks of at most ``max_tokens`` estimated tokens.
+
+    Chunks never split between pages unless one page alone exceeds the budget.
+    The last ``overlap_pages`` pages of each chunk are repeated at the start of
+    the next one so content spanning a page boundary is seen whole. ``pages``
+    may be any iterable of page dicts; chunks are yielded as soon as they fill.
+    """
+    index = 0
+    current = []
+    current_tokens = 0
+
+    for page in pages:
+        for piece in _split_page(page, max_tokens):
+            piece_tokens = estimate_tokens(piece[1])
+            if current and current_tokens + piece_tokens > max_tokens:
+                yield Chunk(index, current)
+                index += 1
+                current = current[-overlap_pages:] if overlap_pages else []
+                current_tokens = sum(estimate_tokens(text) for _, text in current)
+                # Drop overlap that would leave no room for the new page
+                while current and current_tokens + piece_tokens > max_tokens:
+                    current_tokens -= estimate_tokens(current.pop(0)[1])
+            current.append(piece)
+            current_tokens += piece_tokens
+
+    if current:
+        yield Chunk(index, current)
+
+
+def extract_chunk(chunk, build_prompt, client=None, model=None, on_token=None, on_section=None):
+    """Run one chunk through the model and return its ``ExtractedSection`` list.
+
+    With ``on_token`` the reply is streamed and ``on_token(chunk, text)`` is
+    called for each piece as it arrives; the pieces are parsed as they come,
+    so ``on_section(chunk, section)`` fires as soon as each section's value is
+    complete rather than when the whole reply is in.
+    """
+    page_numbers = chunk.page_numbers
+    cancellation.check()
+    with span("prompt_build"):
+        prompt = build_prompt(chunk.render(), page_numbers[0], page_numbers[-1])
+    if on_token:
+        parser = IncrementalParser(page_numbers)
+        parts = []
+        with span("llm"):
+            for delta in stream_chat(prompt, client=client, model=model):
+                # Leaving the loop closes the stream, so a cancelled run stops generating tokens
+                cancellation.check()
+                parts.append(delta)
+                on_token(chunk, delta)
+                for section in parser.feed(delta):
+                    if on_section:
+                        on_section(chunk, section)
+        if parser.complete:
+            return parser.close()
+        # Not a complete JSON object; parse the whole reply the tolerant way
+        with span("parsing"):
+            sections = parse_response("".join(parts), page_numbers)
+        streamed = set(parser.sections)
+        new_sections = [section for section in sections if section.name not in streamed]
+    else:
+        with span("llm"):
+            reply = chat(prompt, client=client, model=model)
+        with span("parsing"):
+            sections = new_sections = parse_response(reply, page_numbers)
+    if on_section:
+        for section in new_sections:
+            on_section(chunk, section)
+    return sections
+
+
+def merge_results(chunk_results):
+    """Reduce per-chunk section lists (in chunk order) into one ``ExtractedSection`` per name."""
+    merged = {}
+    for sections in chunk_results:
+        for section in sections:
+            entry = merged.setdefault(section.name, {"content": [], "source_pages": set()})
+            if section.content not in entry["content"]:
+                entry["content"].append(section.content)
+            entry["source_pages"].update(section.source_pages)
+
+    return [
+        ExtractedSection(name, "\n\n".join(entry["content"]), sorted(entry["source_pages"]))
+        for name, entry in merged.items()
+    ]
+
+
+def map_reduce_sections(pages, build_prompt, client=None, model=None,
+                        max_tokens=3000, overlap_pages=1, max_in_flight=4,
+                        on_token=None, on_section=None):
+    """Extract sections from every chunk of ``pages`` concurrently and merge them.
+
+    Chunks are submitted as soon as they fill, so ``pages`` can be a lazy
+    iterator. At most ``max_in_flight`` model calls run at once and at most as
+    many further chunks wait in the queue; reading pages pauses until a slot
+    frees up. Chunks whose call fails or whose reply has no sections are
+    logged and skipped; if every chunk fails the last error is raised for
+    the caller to report. Returns the merged ``ExtractedSection`` list.
+
+    ``on_token(chunk, text)`` streams model output as it arrives and
+    ``on_section(chunk, section)`` is called as each section of a chunk is
+    parsed; both run on worker threads.
+    """
+    max_in_flight = max(1, max_in_flight)
+    slots = threading.BoundedSemaphore(max_in_flight * 2)
+
+    def run(chunk):
+        try:
+            results = extract_chunk(chunk, build_prompt, client=client, model=model,
+                                    on_token=on_token, on_section=on_section)
+            return results, None
+        except Exception as e:
+            logger.warning("Chunk %d (pages %s) failed: %s", chunk.index, chunk.page_numbers, e)
+            return None, e
+        finally:
+            slots.release()
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="icf-chunk") as executor:
+        for chunk in chunk_pages(pages, max_tokens=max_tokens, overlap_pages=overlap_pages):
+            slots.acquire()
+            # Carry the caller's context so stage spans count towards its run
+            futures.append(executor.submit(contextvars.copy_context().run, run, chunk))
+
+    if not futures:
+        return []
+    outcomes = [future.result() for future in futures]
+    chunk_results = [results for results, _ in outcomes if results is not None]
+    if not chunk_results:
+        raise outcomes[-1][1]
+    return merge_results(chunk_results)
+
+
+def extract_chunks(tasks, client=None, model=None, max_in_flight=4, on_token=None, on_section=None):
+    """Run ``(chunk, build_prompt)`` tasks concurrently, one model call each, and merge the results.
+
+    Used when every chunk is known up front, e.g. one chunk of top-ranked
+    pages per section. Failures are handled as in ``map_reduce_sections``.
+    """
+    def run(task):
+        chunk, build_prompt = task
+        try:
+            return extract_chunk(chunk, build_prompt, client=client, model=model,
+                                 on_token=on_token, on_section=on_section), None
+        except Exception as e:
+            logger.warning("Chunk %d (pages %s) failed: %s", chunk.index, chunk.page_numbers, e)
+            return None, e
+
+    if not tasks:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_in_flight, len(tasks))), thread_name_prefix="icf-chunk") as executor:
+        futures = [executor.submit(contextvars.copy_context().run, run, task) for task in tasks]
+        outcomes = [future.result() for future in futures]
+    chunk_results = [results for results, _ in outcomes if results is not None]
+    if not chunk_results:
+        raise outcomes[-1][1]
+    return merge_results(chunk_results)
+
+
+async def aextract_chunk(chunk, build_prompt, client=None, model=None):
+    """Async ``extract_chunk`` without streaming: the model call is awaited, not waited for on a thread."""
+    page_numbers = chunk.page_numbers
+    with span("prompt_build"):
+        prompt = build_prompt(chunk.render(), page_numbers[0], page_numbers[-1])
+    with span("llm"):
+        reply = await achat(prompt, client=client, model=model)
+    with span("parsing"):
+        return parse_response(reply, page_numbers)
+
+
+async def aextract_chunks(tasks, client=None, model=None, max_in_flight=4):
+    """Async ``extract_chunks``: up to ``max_in_flight`` calls are awaited at once on the running loop.
+
+    No thread is held while a call waits on the model, so many requests can
+    have calls in flight from one event loop.
+    """
+    slots = asyncio.Semaphore(max(1, max_in_flight))
+
+    async def run(task):
+        chunk, build_prompt = task
+        async with slots:
+            try:
+                return await aextract_chunk(chunk, build_prompt, client=client, model=model), None
+            except Exception as e:
+                logger.warning("Chunk %d (pages %s) failed: %s", chunk.index, chunk.page_numbers, e)
+                return None, e
+
+    if not tasks:
+        return []
+    outcomes = await asyncio.gather(*(run(task) for task in tasks))
+    chunk_results = [results for results, _ in outcomes if results is not None]
+    if not chunk_results:
+        raise outcomes[-1][1]
+    return merge_results(chunk_results)
+
+
+def ranked_chunk(index, page_numbers, texts, max_tokens=3000):
+    """A ``Chunk`` of the pages in ``page_numbers`` (best first) that fit ``max_tokens``, in page order.
+
+    The first page always goes in, cut down if it alone is over budget.
+    """
+    pages, tokens = [], 0
+    for number in page_numbers:
+        text = texts[number]
+        page_tokens = estimate_tokens(text)
+        if pages and tokens + page_tokens > max_tokens:
+            continue
+        pages.append((number, text[:max_tokens * CHARS_PER_TOKEN]))
+        tokens += page_tokens
+    return Chunk(index, sorted(pages))
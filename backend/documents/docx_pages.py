@@ -0,0 +1,239 @@
+"""Streaming DOCX extraction into logical pages.
+
+A DOCX has no fixed pages, so ``iter_docx_pages`` makes them. It reads
+``word/document.xml`` with ``iterparse``, clearing each body paragraph and
+table once handled, and starts a new page at:
+
+- explicit page breaks (``<w:br w:type="page"/>``, ``pageBreakBefore``) and
+  the page breaks Word recorded when it last laid the document out
+  (``lastRenderedPageBreak``), so pages roughly follow the printed layout
+- section breaks
+- headings, once the current page holds at least a third of ``max_chars``
+- paragraphs and tables that would take the page past ``max_chars``; a
+  heading that would be left at the bottom of the page moves with them
+
+so no page is longer than ``max_chars``: a single paragraph or table longer
+than that is split between lines (table rows), then sentences, then words.
+
+Tables are written like PDF tables (see ``layout.compact_table``), one
+``a | b | c`` row per line under a ``[Table]`` marker, repeated on each
+page a long table is split over.
+"""
+import re
+import zipfile
+from lxml import etree
+from .layout import collapse, compact_table
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+BODY, P, TBL, TR, TC, SDT = f"{W}body", f"{W}p", f"{W}tbl", f"{W}tr", f"{W}tc", f"{W}sdt"
+# Page break markers in the text of a paragraph
+PAGE_BREAK = "\f"
+TABLE_MARKER = "[Table]\n"
+# Bump when pagination changes, so pages cached under the old rules aren't reused
+PAGINATION_VERSION = 3
+SENTENCE_END_RE = re.compile(r"(?<=[.!?;:])\s+")
+SPACE_RE = re.compile(r"\s+")
+# How oversized text is split, coarsest first, and what rejoins the parts
+SPLITS = ((re.compile("\n"), "\n"), (SENTENCE_END_RE, " "), (SPACE_RE, " "))
+
+
+def heading_styles(archive):
+    """Style ids of heading paragraphs: "Title", "Heading N" or with an outline level, directly or inherited."""
+    try:
+        root = etree.fromstring(archive.read("word/styles.xml"))
+    except KeyError:
+        return frozenset()
+    based_on, heading = {}, set()
+    for style in root.iter(f"{W}style"):
+        if style.get(f"{W}type") != "paragraph":
+            continue
+        style_id = style.get(f"{W}styleId")
+        name = style.find(f"{W}name")
+        name = (name.get(f"{W}val") if name is not None else style_id or "").lower()
+        parent = style.find(f"{W}basedOn")
+        if parent is not None:
+            based_on[style_id] = parent.get(f"{W}val")
+        outline = style.find(f"{W}pPr/{W}outlineLvl")
+        if name == "title" or name.startswith("heading") or (outline is not None and outline.get(f"{W}val") != "9"):
+            heading.add(style_id)
+
+    def is_heading(style_id, seen=()):
+        if style_id in heading:
+            return True
+        parent = based_on.get(style_id)
+        return parent is not None and parent not in seen and is_heading(parent, (*seen, style_id))
+
+    return frozenset(style_id for style_id in based_on.keys() | heading if is_heading(style_id))
+
+
+def paragraph_text(paragraph):
+    """Text of a ``w:p``, with ``PAGE_BREAK`` where the page breaks."""
+    parts = []
+    properties = paragraph.find(f"{W}pPr")
+    if properties is not None and properties.find(f"{W}pageBreakBefore") is not None:
+        parts.append(PAGE_BREAK)
+    for element in paragraph.iter(f"{W}t", f"{W}tab", f"{W}br", f"{W}cr", f"{W}noBreakHyphen",
+                                  f"{W}lastRenderedPageBreak"):
+        tag = element.tag
+        if tag == f"{W}t":
+            parts.append(element.text or "")
+        elif tag == f"{W}tab":
+            parts.append(" ")
+        elif tag == f"{W}noBreakHyphen":
+            parts.append("-")
+        elif tag == f"{W}lastRenderedPageBreak" or element.get(f"{W}type") == "page":
+            parts.append(PAGE_BREAK)
+        elif tag in (f"{W}br", f"{W}cr") and element.get(f"{W}type") != "column":
+            parts.append("\n")
+    return "".join(parts)
+
+
+def table_text(table):
+    rows = []
+    for row in table.iter(TR):
+        if row.getparent() is not table:
+            continue  # a nested table's rows go into its cell's text
+        rows.append([
+            collapse(" ".join(paragraph_text(p).replace(PAGE_BREAK, "") for p in cell.iter(P)))
+            for cell in row.iter(TC) if cell.getparent() is row
+        ])
+    text = compact_table(rows)
+    return f"{TABLE_MARKER}{text}" if text else ""
+
+
+def _is_heading(paragraph, heading_style_ids):
+    properties = paragraph.find(f"{W}pPr")
+    if properties is None:
+        return False
+    style = properties.find(f"{W}pStyle")
+    outline = properties.find(f"{W}outlineLvl")
+    return (style is not None and style.get(f"{W}val") in heading_style_ids) or (
+        outline is not None and outline.get(f"{W}val") != "9")
+
+
+def iter_body(path):
+    """Yield ``(kind, text, heading, section_end)`` for each top-level paragraph and table of the body.
+
+    Paragraphs inside content controls (``w:sdt``) count as top-level.
+    Elements are cleared as they are read, so memory stays flat however long
+    the document is.
+    """
+    with zipfile.ZipFile(path) as archive:
+        heading_style_ids = heading_styles(archive)
+        with archive.open("word/document.xml") as document:
+            for _, element in etree.iterparse(document, events=("end",), tag=(P, TBL, SDT), huge_tree=True):
+                parent = element.getparent()
+                # Only body-level elements, possibly wrapped in content controls
+                ancestor = parent
+                while ancestor is not None and ancestor.tag != BODY and ancestor.tag not in (P, TBL):
+                    ancestor = ancestor.getparent()
+                if ancestor is None or ancestor.tag != BODY:
+                    continue
+                if element.tag == P:
+                    section_end = element.find(f"{W}pPr/{W}sectPr") is not None
+                    yield "paragraph", paragraph_text(element), _is_heading(element, heading_style_ids), section_end
+                elif element.tag == TBL:
+                    yield "table", table_text(element), False, False
+                if parent.tag == BODY:
+                    element.clear()
+                    # Drop the handled siblings too, or the body keeps an empty node per paragraph
+                    while element.getprevious() is not None:
+                        del parent[0]
+
+
+def _split(text, limit, splits=SPLITS):
+    if len(text) <= limit:
+        return [text]
+    if not splits:
+        return [text[i:i + limit] for i in range(0, len(text), limit)]
+    (separator, joiner), finer = splits[0], splits[1:]
+    parts, current = [], ""
+    for unit in separator.split(text):
+        for piece in _split(unit, limit, finer):
+            if current and len(current) + len(joiner) + len(piece) > limit:
+                parts.append(current)
+                current = piece
+            else:
+                current = f"{current}{joiner}{piece}" if current else piece
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_block(text, max_chars):
+    """Split a block's text into parts of at most ``max_chars``, each table part keeping the ``[Table]`` marker."""
+    if len(text) <= max_chars:
+        return [text]
+    prefix = TABLE_MARKER if text.startswith(TABLE_MARKER) else ""
+    return [prefix + part for part in _split(text[len(prefix):], max(max_chars - len(prefix), 1))]
+
+
+def paginate(blocks, max_chars=3000):
+    """Group ``iter_body`` blocks into page texts; see the module docstring for where pages break."""
+    lines, size = [], 0
+    # Where the heading(s) ending the page start, while no body text follows them
+    heading_at = None
+
+    def page():
+        nonlocal heading_at
+        text = "\n".join(line for line in lines if line)
+        lines.clear()
+        heading_at = None
+        return text
+
+    for kind, text, heading, section_end in blocks:
+        if heading:
+            # Consecutive headings break as one, before the first
+            trailing = lines[heading_at:] if heading_at is not None else []
+            trailing_size = sum(len(line) + 1 for line in trailing)
+            if size - trailing_size >= max_chars // 3:
+                del lines[len(lines) - len(trailing):]
+                yield page()
+                lines.extend(trailing)
+                size = trailing_size
+                heading_at = 0
+            elif heading_at is None:
+                heading_at = len(lines)
+        pieces = text.split(PAGE_BREAK) if kind == "paragraph" else [text]
+        for i, piece in enumerate(pieces):
+            if i:
+                # A break at the very start of a page (e.g. pageBreakBefore after a section break) adds no page
+                if size:
+                    yield page()
+                    size = 0
+            piece = "\n".join(collapse(line) for line in piece.split("\n")).strip()
+            parts = split_block(piece, max_chars) if piece else []
+            while parts:
+                part = parts.pop(0)
+                # ``size`` counts a newline after each line, so a page's text is ``size - 1`` long
+                if size and size + len(part) > max_chars:
+                    carried = lines[heading_at:] if heading_at is not None and not heading else []
+                    if sum(len(line) + 1 for line in carried) > max_chars // 3:
+                        carried = []  # Not worth splitting the body over; leave the heading where it is
+                    # A page of nothing but the heading is filled with the start of its body instead
+                    if len(carried) < len(lines):
+                        del lines[len(lines) - len(carried):]
+                        yield page()
+                        # Take the heading over with its body rather than leave it at the bottom of the page
+                        lines.extend(carried)
+                        size = sum(len(line) + 1 for line in carried)
+                    if size and size + len(part) > max_chars:
+                        parts[:0] = split_block(part, max_chars - size)
+                        part = parts.pop(0)
+                lines.append(part)
+                size += len(part) + 1
+                if not heading:
+                    heading_at = None
+        if section_end or size >= max_chars:
+            if size:
+                yield page()
+            size = 0
+    if size:
+        yield page()
+
+
+def iter_docx_page_texts(path, max_chars=3000):
+    """Logical page texts of the DOCX at ``path``, in order."""
+    for text in paginate(iter_body(path), max_chars):
+        if text.strip():
+            yield text
@@ -0,0 +1,52 @@
+"""Bounded thread pool for the blocking work of async views.
+
+The async views await the model on the event loop, but PDF/DOCX extraction,
+rendering, SQLite and file I/O still block, so they are offloaded here. The
+pool has ``ICF_ASYNC_WORKERS`` threads, so that much blocking work runs at
+once however many requests are in flight; the rest waits its turn without
+holding a thread.
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, getattr(settings, "ICF_ASYNC_WORKERS", 4)),
+                thread_name_prefix="icf-async",
+            )
+        return _executor
+
+
+def peek_executor():
+    """Return the shared executor if it has been created, without creating it."""
+    return _executor
+
+
+def _call(fn, args, kwargs):
+    # Pool threads are long-lived; drop connections past CONN_MAX_AGE as a request would
+    close_old_connections()
+    return fn(*args, **kwargs)
+
+
+async def offload(fn, *args, **kwargs):
+    """Run ``fn(*args, **kwargs)`` on the shared executor and await the result.
+
+    It runs in a copy of the caller's context, so metrics spans count towards
+    the caller's pipeline run.
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        get_executor(), partial(context.run, _call, fn, args, kwargs)
+    )
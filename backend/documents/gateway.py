@@ -0,0 +1,321 @@
+"""LLM gateway: one pooled async client shared by every request and job thread.
+
+``LLMGateway`` wraps an async chat client (``AsyncOpenAI`` or the offline
+stub) and runs it on its own event loop thread. Every call goes through:
+
+* token buckets for requests and tokens per minute,
+* a concurrency cap matching the HTTP connection pool,
+* a per-call timeout,
+* retries with exponential backoff that honour ``retry-after`` headers, and
+* in-flight coalescing, so identical concurrent prompts share one upstream call.
+
+It exposes the same ``chat.completions.create(...)`` shape as the sync OpenAI
+client, so ``llm.chat``/``llm.stream_chat`` and the chunk workers use it
+unchanged. Async callers can use ``acreate``/``astream`` instead. A call
+that still fails raises ``GatewayError``.
+"""
+import asyncio
+import email.utils
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+import openai
+from .metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {408, 409, 429}
+
+
+class GatewayError(Exception):
+    """A model call failed for good: its retries ran out, or the error isn't retryable.
+
+    ``status`` is the HTTP status to answer with: 503 while the model is
+    unreachable, timing out or rate limited, 502 when it rejected the call.
+    """
+
+    def __init__(self, message, status=502):
+        super().__init__(message)
+        self.status = status
+
+    @classmethod
+    def wrap(cls, error):
+        status = getattr(error, "status_code", None)
+        unavailable = (isinstance(error, (asyncio.TimeoutError, openai.APIConnectionError, ConnectionError))
+                       or status == 429 or (status or 0) >= 500)
+        return cls(f"Model call failed: {error or type(error).__name__}", 503 if unavailable else 502)
+
+
+def estimate_message_tokens(messages):
+    return sum(len(message.get("content") or "") for message in messages) // 4 + 1
+
+
+class TokenBucket:
+    """Allow ``per_minute`` units per minute with bursts up to a minute's worth.
+
+    ``0`` disables the limit. Only used from the gateway loop, so no locking.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        if not self.capacity:
+            return
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def debit(self, amount):
+        """Correct the balance once the real usage of a call is known (may be negative)."""
+        if self.capacity:
+            self._refill()
+            self.tokens -= amount
+
+
+def _retry_after(error):
+    """Seconds the server asked us to wait, from ``retry-after-ms`` or ``retry-after``."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+async def _anext(iterator):
+    # Async generator steps are not coroutines, so wrap one for run_coroutine_threadsafe
+    try:
+        return True, await iterator.__anext__()
+    except StopAsyncIteration:
+        return False, None
+
+
+async def _aclose(iterator):
+    await iterator.aclose()
+
+
+class LLMGateway:
+    def __init__(self, client, requests_per_minute=0, tokens_per_minute=0, max_concurrency=32,
+                 timeout=60.0, max_retries=4, backoff_base=0.5, backoff_max=30.0):
+        self.client = client
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency = max_concurrency
+
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight = {}
+        self._counters = Counter()
+        self._counters_lock = threading.Lock()
+        self.latency = Histogram()
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True)
+        self._thread.start()
+
+        # Drop-in for the sync OpenAI client
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    # Sync facade
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def _create(self, model, messages, stream=False, **kwargs):
+        if stream:
+            return self._sync_stream(self._stream(model, messages, kwargs))
+        return self._run(self._complete(model, messages, kwargs))
+
+    def _sync_stream(self, events):
+        try:
+            while True:
+                more, event = self._run(_anext(events))
+                if not more:
+                    return
+                yield event
+        finally:
+            self._run(_aclose(events))
+
+    # Async API, usable from any event loop
+
+    async def acreate(self, model, messages, **kwargs):
+        future = asyncio.run_coroutine_threadsafe(self._complete(model, messages, kwargs), self._loop)
+        return await asyncio.wrap_future(future)
+
+    async def astream(self, model, messages, **kwargs):
+        events = self._stream(model, messages, kwargs)
+        try:
+            while True:
+                more, event = await asyncio.wrap_future(
+                    asyncio.run_coroutine_threadsafe(_anext(events), self._loop))
+                if not more:
+                    return
+                yield event
+        finally:
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(_aclose(events), self._loop))
+
+    # Everything below runs on the gateway loop
+
+    def _count(self, name, amount=1):
+        with self._counters_lock:
+            self._counters[name] += amount
+
+    async def _complete(self, model, messages, kwargs):
+        key = hashlib.sha256(json.dumps([model, messages, kwargs], sort_keys=True, default=str).encode()).hexdigest()
+        shared = self._inflight.get(key)
+        if shared is not None:
+            self._count("coalesced")
+            return await asyncio.shield(shared)
+
+        shared = self._loop.create_future()
+        self._inflight[key] = shared
+        try:
+            response = await self._open(model, messages, kwargs, stream=False)
+        except asyncio.CancelledError:
+            shared.cancel()
+            raise
+        except Exception as e:
+            shared.set_exception(e)
+            shared.exception()  # Mark retrieved; coalesced waiters may not exist
+            raise
+        finally:
+            del self._inflight[key]
+        shared.set_result(response)
+        return response
+
+    async def _stream(self, model, messages, kwargs):
+        # Retries only cover opening the stream; once deltas flow they can't be replayed
+        stream = await self._open(model, messages, kwargs, stream=True)
+        chars = 0
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(stream.__anext__(), self.timeout)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError as e:
+                    self._count("timeouts")
+                    self._count("failed")
+                    raise GatewayError.wrap(e) from e
+                except (openai.OpenAIError, ConnectionError) as e:
+                    self._count("failed")
+                    raise GatewayError.wrap(e) from e
+                if event.choices and event.choices[0].delta.content:
+                    chars += len(event.choices[0].delta.content)
+                yield event
+        finally:
+            self._semaphore.release()
+            self._tokens.debit(chars // 4)
+            if hasattr(stream, "aclose"):
+                await stream.aclose()
+            elif hasattr(stream, "close"):
+                await stream.close()
+
+    async def _open(self, model, messages, kwargs, stream):
+        """Send one request with rate limiting and retries.
+
+        For streams the concurrency slot stays held and ``_stream`` releases it.
+        """
+        estimate = estimate_message_tokens(messages)
+        self._count("requests")
+        attempt = 0
+        while True:
+            await self._requests.acquire()
+            await self._tokens.acquire(estimate)
+            await self._semaphore.acquire()
+            started = time.monotonic()
+            try:
+                response = await asyncio.wait_for(
+                    self.client.chat.completions.create(model=model, messages=messages, stream=stream, **kwargs),
+                    self.timeout,
+                )
+            except Exception as e:
+                self._semaphore.release()
+                delay = self._retry_delay(e, attempt)
+                if delay is None or attempt >= self.max_retries:
+                    self._count("failed")
+                    raise GatewayError.wrap(e) from e
+                attempt += 1
+                self._count("retries")
+                logger.info("LLM call failed (%s), retry %d in %.2fs", e, attempt, delay)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self._semaphore.release()
+                raise
+
+            self.latency.observe(time.monotonic() - started)
+            self._count("succeeded")
+            if not stream:
+                self._semaphore.release()
+                usage = getattr(response, "usage", None)
+                if usage is not None and getattr(usage, "total_tokens", None):
+                    self._tokens.debit(usage.total_tokens - estimate)
+                    self._count("tokens", usage.total_tokens)
+            return response
+
+    def _retry_delay(self, error, attempt):
+        """Seconds to wait before retrying ``error``, or None if it isn't retryable."""
+        status = getattr(error, "status_code", None)
+        if isinstance(error, asyncio.TimeoutError):
+            self._count("timeouts")
+        elif status is not None:
+            if status == 429:
+                self._count("rate_limited")
+            if status not in RETRY_STATUSES and status < 500:
+                return None
+        elif not isinstance(error, (openai.APIConnectionError, ConnectionError)):
+            return None
+
+        delay = _retry_after(error)
+        if delay is None:
+            delay = self.backoff_base * 2 ** attempt * random.uniform(0.5, 1.0)
+        return min(delay, self.backoff_max)
+
+    def metrics(self):
+        with self._counters_lock:
+            counters = dict(self._counters)
+        metrics = {name: counters.get(name, 0) for name in
+                   ("requests", "succeeded", "failed", "retries", "rate_limited", "timeouts", "coalesced", "tokens")}
+        metrics["in_flight"] = self.max_concurrency - self._semaphore._value
+        metrics["latency_seconds"] = self.latency.snapshot()
+        return metrics
+
+    def close(self):
+        close = getattr(self.client, "close", None)
+        if close is not None:
+            try:
+                self._run(close())
+            except Exception:
+                logger.debug("Closing the LLM client failed", exc_info=True)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
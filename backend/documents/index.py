@@ -0,0 +1,102 @@
+"""Per-document inverted index for attributing sections to pages.
+
+Pages are added once as they are extracted. Each token maps to postings of
+``{page_number: term_frequency}``, and sections are ranked against pages with
+BM25 so that a page mentioning "risk" twenty times outranks one that mentions
+it in passing. Given ``vectors`` (a ``vectors.PageVectors``), each page is
+also added there for ranking by TF-IDF similarity.
+"""
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def stem(token):
+    # Light plural folding so "risks" matches "risk" and "procedures" matches "procedure"
+    if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [stem(token) for token in TOKEN_RE.findall(text.lower())]
+
+
+class PageIndex:
+    def __init__(self, k1=1.2, b=0.75, vectors=None):
+        self.k1 = k1
+        self.b = b
+        self.vectors = vectors
+        self.postings = defaultdict(dict)
+        self.page_lengths = {}
+        self.pages = {}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self.page_lengths)
+
+    def add_page(self, page_number, text, record=None):
+        """Index ``text`` under ``page_number``; ``record`` is kept for O(1) lookup via ``get``."""
+        # Count raw tokens first so stemming runs once per distinct word, not per occurrence
+        tokens = TOKEN_RE.findall(text.lower())
+        raw_counts = Counter(tokens)
+        counts = Counter()
+        for token, count in raw_counts.items():
+            counts[stem(token)] += count
+        postings = self.postings
+        for token, count in counts.items():
+            postings[token][page_number] = count
+        length = sum(raw_counts.values())
+        self.page_lengths[page_number] = length
+        self._total_length += length
+        self.pages[page_number] = record if record is not None else {"page": page_number}
+        if self.vectors is not None:
+            self.vectors.add_page(page_number, tokens, raw_counts)
+
+    def get(self, page_number):
+        return self.pages.get(page_number)
+
+    def _idf(self, term):
+        n = len(self.page_lengths)
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def top_pages(self, keywords, k=3):
+        return self.top_pages_by_section({None: keywords}, k)[None]
+
+    def top_pages_by_section(self, section_keywords, k=3):
+        """Rank pages for every section at once and return ``{section: [(page, score), ...]}``.
+
+        Each distinct query term's postings are walked once and its BM25
+        contribution is added to every section that uses the term. Multi-word
+        keywords such as "side effect" contribute each of their words.
+        """
+        if not self.page_lengths:
+            return {section: [] for section in section_keywords}
+
+        term_sections = defaultdict(list)
+        for section, keywords in section_keywords.items():
+            terms = {term for keyword in keywords for term in tokenize(keyword)}
+            for term in terms:
+                term_sections[term].append(section)
+
+        avg_length = self._total_length / len(self.page_lengths) or 1
+        scores = {section: defaultdict(float) for section in section_keywords}
+        for term, sections in term_sections.items():
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term)
+            for page_number, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.page_lengths[page_number] / avg_length)
+                weight = idf * tf * (self.k1 + 1) / (tf + norm)
+                for section in sections:
+                    scores[section][page_number] += weight
+
+        return {
+            section: heapq.nlargest(k, page_scores.items(), key=lambda item: (item[1], -item[0]))
+            for section, page_scores in scores.items()
+        }
@@ -0,0 +1,275 @@
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+from .pipeline import process_upload, compact_response, UnsupportedFileType, LOG_KINDS
+from .batch import run_batch
+from .artifacts import get_artifact_store, ZIP_CONTENT_TYPE
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, file_name):
+        self.id = uuid.uuid4().hex
+        self.file_name = file_name
+        self.status = QUEUED
+        self.stage = "queued"
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    @property
+    def finished(self):
+        return self.status in (SUCCEEDED, FAILED)
+
+    @property
+    def logs_url(self):
+        return f"/api/jobs/{self.id}/logs/"
+
+    @property
+    def has_logs(self):
+        return bool(self.result) and all(key in self.result for key in LOG_KINDS.values())
+
+    def to_dict(self, compact=False):
+        """The job's status; with ``compact`` its result leaves the logs at ``logs_url`` (see ``compact_response``)."""
+        data = {
+            "job_id": self.id,
+            "file_name": self.file_name,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 2),
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+        if self.error:
+            data["error"] = self.error
+        if self.result:
+            data["download_url"] = self.result["download_url"]
+            data["result"] = compact_response(self.result, self.logs_url) if compact and self.has_logs else self.result
+        return data
+
+
+class JobStore:
+    """Thread-safe in-memory registry of jobs.
+
+    Finished jobs expire after ``ttl`` seconds, and past ``max_entries`` jobs
+    the least recently used finished ones are dropped, since each holds its
+    full result with the logs. Jobs still queued or running are always kept.
+    """
+
+    def __init__(self, ttl=3600, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, job):
+        with self._lock:
+            self._evict_expired()
+            self._jobs[job.id] = job
+            self._evict_over_limit()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            self._evict_expired()
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._jobs.move_to_end(job_id)
+            return job
+
+    def discard(self, job):
+        with self._lock:
+            self._jobs.pop(job.id, None)
+
+    def update(self, job, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.updated_at = time.time()
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.updated_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _evict_over_limit(self):
+        excess = len(self._jobs) - self.max_entries
+        if excess <= 0:
+            return
+        # Least recently used first
+        evict = [job_id for job_id, job in self._jobs.items() if job.finished][:excess]
+        for job_id in evict:
+            del self._jobs[job_id]
+
+
+class ThreadPoolBackend:
+    """Runs jobs on a bounded local thread pool, rejecting work beyond ``max_queue`` pending jobs."""
+
+    def __init__(self, max_workers=4, max_queue=32):
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="icf-job")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def depth(self):
+        return self._pending
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_queue:
+                raise QueueFull(f"Job queue is full ({self.max_queue} pending)")
+            self._pending += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+
+
+class JobQueue:
+    """Accepts uploads, spools them to disk and runs extraction -> LLM -> render on a backend."""
+
+    def __init__(self, backend, store):
+        self.backend = backend
+        self.store = store
+
+    def submit(self, uploaded_file, protocol_id=None):
+        # The upload's temporary storage goes away with the request, so keep our own copy
+        suffix = os.path.splitext(uploaded_file.name)[1]
+        spool = tempfile.NamedTemporaryFile(delete=False, suffix=suffix, prefix="icf_upload_")
+        with spool:
+            for chunk in uploaded_file.chunks():
+                spool.write(chunk)
+
+        job = self.store.add(Job(uploaded_file.name))
+        try:
+            self.backend.submit(self._run, job, spool.name, protocol_id)
+        except QueueFull:
+            self.store.discard(job)
+            os.unlink(spool.name)
+            raise
+        return job
+
+    def submit_batch(self, uploaded_files):
+        """Queue many uploads (protocols or zip archives) as a single batch job."""
+        spool_dir = tempfile.mkdtemp(prefix="icf_batch_upload_")
+        for index, uploaded_file in enumerate(uploaded_files):
+            # Prefix with the position so same-named uploads don't overwrite each other
+            with open(os.path.join(spool_dir, f"{index}_{os.path.basename(uploaded_file.name)}"), "wb") as f:
+                for chunk in uploaded_file.chunks():
+                    f.write(chunk)
+
+        job = self.store.add(Job(f"batch of {len(uploaded_files)} files"))
+        try:
+            self.backend.submit(self._run_batch, job, spool_dir)
+        except QueueFull:
+            self.store.discard(job)
+            shutil.rmtree(spool_dir, ignore_errors=True)
+            raise
+        return job
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def record(self, file_name, result):
+        """Register a generation that ran outside the queue, so its logs can be fetched by job id until it expires."""
+        job = Job(file_name)
+        job.status, job.stage, job.progress, job.result = SUCCEEDED, "done", 1.0, result
+        return self.store.add(job)
+
+    def _run(self, job, path, protocol_id=None):
+        def on_stage(stage, progress):
+            self.store.update(job, stage=stage, progress=progress)
+
+        self.store.update(job, status=RUNNING, stage="extraction", progress=0.05)
+        try:
+            with open(path, "rb") as f:
+                result = process_upload(f, job.file_name, protocol_id=protocol_id, on_stage=on_stage)
+        except UnsupportedFileType as e:
+            self.store.update(job, status=FAILED, error=str(e))
+        except Exception as e:
+            self.store.update(job, status=FAILED, error=f"{job.stage} failed: {str(e)}")
+        else:
+            self.store.update(job, status=SUCCEEDED, stage="done", progress=1.0, result=result)
+        finally:
+            os.unlink(path)
+            # Job threads are long-lived; don't keep a database connection open between jobs
+            close_old_connections()
+
+    def _run_batch(self, job, spool_dir):
+        def on_progress(done, total):
+            self.store.update(job, progress=0.05 + 0.9 * done / total)
+
+        self.store.update(job, status=RUNNING, stage="batch", progress=0.05)
+        output_dir = tempfile.mkdtemp(prefix="icf_batch_")
+        try:
+            manifest = run_batch(
+                [spool_dir],
+                output_dir,
+                max_documents=getattr(settings, "ICF_BATCH_MAX_DOCUMENTS", 2),
+                max_llm_concurrency=getattr(settings, "ICF_BATCH_LLM_CONCURRENCY", 4),
+                requests_per_minute=getattr(settings, "ICF_BATCH_REQUESTS_PER_MINUTE", 0),
+                on_progress=on_progress,
+            )
+            archive = shutil.make_archive(output_dir, "zip", output_dir)
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            artifact = get_artifact_store().put(archive, f"Protocol_Batch_{timestamp}.zip", ZIP_CONTENT_TYPE)
+        except Exception as e:
+            self.store.update(job, status=FAILED, error=f"batch failed: {str(e)}")
+        else:
+            result = {"download_url": artifact.download_url, "manifest": manifest}
+            self.store.update(job, status=SUCCEEDED, stage="done", progress=1.0, result=result)
+        finally:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+            shutil.rmtree(output_dir, ignore_errors=True)
+            close_old_connections()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide job queue, building its backend from settings on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            backend_class = import_string(getattr(settings, "ICF_JOB_BACKEND", "documents.jobs.ThreadPoolBackend"))
+            backend = backend_class(
+                max_workers=getattr(settings, "ICF_JOB_WORKERS", 4),
+                max_queue=getattr(settings, "ICF_JOB_MAX_QUEUE", 32),
+            )
+            store = JobStore(
+                ttl=getattr(settings, "ICF_JOB_TTL", 3600),
+                max_entries=getattr(settings, "ICF_JOB_MAX_ENTRIES", 256),
+            )
+            _queue = JobQueue(backend, store)
+        return _queue
+
+
+def peek_job_queue():
+    """Return the job queue if it has been created, without creating it."""
+    return _queue
@@ -0,0 +1,183 @@
+"""Layout-aware PDF page text.
+
+``page.get_text()`` returns every line on the page, including the running
+header and footer (protocol title, version, "CONFIDENTIAL", "Page 5 of 79")
+and tables flattened to one cell per line, all of which the model is then
+sent again for every page. ``PdfLayout`` reads a sample of pages once to find
+the lines repeated in the top and bottom margins, and ``page_text`` then works
+from PyMuPDF's ``dict`` output: it drops those lines, joins the lines of each
+text block and collapses whitespace, and writes tables as one ``|``-separated
+row per line. It also returns how many characters went where.
+"""
+import hashlib
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from functools import cached_property
+
+# Bump when page text changes (header/footer or table detection, cleanup), so cached pages aren't reused
+LAYOUT_VERSION = 1
+SPACE_RE = re.compile(r"\s+")
+DIGITS_RE = re.compile(r"\d+")
+# Fewest ruled lines each way, inside the body of the page, before looking for tables
+MIN_TABLE_RULES = 3
+
+
+def collapse(text):
+    return SPACE_RE.sub(" ", text).strip()
+
+
+def normalize_line(text):
+    """Case- and digit-insensitive form of a line, so "Page 5 of 79" matches "Page 6 of 79"."""
+    return DIGITS_RE.sub("#", collapse(text).lower())
+
+
+def _text_lines(page_dict):
+    """``(block, [(bbox, text), ...])`` for each text block of ``page.get_text("dict")``."""
+    for block in page_dict["blocks"]:
+        if block.get("type", 0) != 0:
+            continue
+        yield block, [(line["bbox"], "".join(span["text"] for span in line["spans"])) for line in block["lines"]]
+
+
+def _join_lines(lines):
+    text = ""
+    for line in lines:
+        # Re-join words hyphenated across lines ("evalu-" + "ation", "COVID-" + "19")
+        if text.endswith("-") and len(text) > 1 and text[-2].isalpha() and line[:1].islower():
+            text = text[:-1] + line
+        elif text.endswith("-") and len(text) > 1 and text[-2].isalnum():
+            text += line
+        else:
+            text = f"{text} {line}" if text else line
+    return text
+
+
+def compact_table(rows):
+    """Table rows as ``a | b | c`` lines, without empty rows, empty columns or trailing empty cells."""
+    rows = [[collapse(cell or "") for cell in row] for row in rows]
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        return ""
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    keep = [i for i in range(width) if any(row[i] for row in rows)]
+    lines = []
+    for row in rows:
+        cells = [row[i] for i in keep]
+        while not cells[-1]:
+            cells.pop()  # Trailing empty cells carry no information
+        lines.append(" | ".join(cells))
+    return "\n".join(lines)
+
+
+@dataclass(frozen=True)
+class PdfLayout:
+    """What to strip from each page of one document; small enough to send to worker processes."""
+
+    running_lines: frozenset = frozenset()
+    margin: float = 0.12
+    tables: bool = False
+
+    @classmethod
+    def detect(cls, pdf, margin=0.12, tables=False, sample_pages=24, min_share=0.5):
+        """Find the running header and footer lines of ``pdf`` from up to ``sample_pages`` pages.
+
+        A line counts if its normalized form is in the top or bottom
+        ``margin`` of at least ``min_share`` of the sampled pages.
+        """
+        page_count = pdf.page_count
+        if page_count < 3:
+            return cls(margin=margin, tables=tables)
+        step = max(1, page_count / sample_pages)
+        sampled = sorted({int(i * step) for i in range(min(page_count, sample_pages))})
+        counts = Counter()
+        for i in sampled:
+            page = pdf.load_page(i)
+            top, bottom = page.rect.y0 + page.rect.height * margin, page.rect.y1 - page.rect.height * margin
+            counts.update({
+                normalize_line(text)
+                for _, lines in _text_lines(page.get_text("dict"))
+                for bbox, text in lines
+                if (bbox[3] <= top or bbox[1] >= bottom) and text.strip()
+            })
+        threshold = max(2, math.ceil(min_share * len(sampled)))
+        return cls(frozenset(line for line, count in counts.items() if count >= threshold), margin, tables)
+
+    @cached_property
+    def fingerprint(self):
+        """Changes whenever pages would be extracted differently; folded into page source hashes."""
+        parts = [str(self.margin), str(self.tables), *sorted(self.running_lines)]
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def _has_grid(self, page, top, bottom):
+        # find_tables costs ~0.15s a page, so only pages with ruled lines both ways get it
+        horizontal = vertical = 0
+        for drawing in page.get_drawings():
+            rect = drawing["rect"]
+            if rect.y1 < top or rect.y0 > bottom:
+                continue  # header and footer rules
+            for item in drawing["items"]:
+                if item[0] == "l":
+                    start, end = item[1], item[2]
+                    horizontal += abs(start.y - end.y) < 1
+                    vertical += abs(start.x - end.x) < 1
+                elif item[0] == "re":
+                    # Thin rectangles are rules; anything else is a box with two edges each way
+                    box = item[1]
+                    horizontal += 1 if box.height < 2 else 0 if box.width < 2 else 2
+                    vertical += 1 if box.width < 2 else 0 if box.height < 2 else 2
+            if horizontal >= MIN_TABLE_RULES and vertical >= MIN_TABLE_RULES:
+                return True
+        return False
+
+    def page_text(self, page):
+        """Return ``(text, stats)`` for ``page``.
+
+        ``stats`` counts ``raw_chars`` (the text as plain ``get_text`` lines),
+        ``chars`` kept, ``running_chars`` dropped as headers and footers,
+        ``table_chars`` kept as compact tables and ``tables`` found.
+        """
+        rect = page.rect
+        top, bottom = rect.y0 + rect.height * self.margin, rect.y1 - rect.height * self.margin
+
+        tables = []
+        if self.tables and self._has_grid(page, top, bottom):
+            for table in page.find_tables().tables:
+                text = compact_table(table.extract())
+                if text:
+                    tables.append((table.bbox, text))
+
+        def in_table(bbox):
+            x, y = (bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2
+            return any(x0 <= x <= x1 and y0 <= y <= y1 for (x0, y0, x1, y1), _ in tables)
+
+        raw_chars = running_chars = 0
+        items = []  # (top of block, text), in reading order
+        for block, lines in _text_lines(page.get_text("dict")):
+            kept = []
+            for bbox, text in lines:
+                raw_chars += len(text) + 1
+                if (bbox[3] <= top or bbox[1] >= bottom) and normalize_line(text) in self.running_lines:
+                    running_chars += len(text) + 1
+                elif not in_table(bbox):
+                    text = collapse(text)
+                    if text:
+                        kept.append(text)
+            if kept:
+                items.append((block["bbox"][1], _join_lines(kept)))
+
+        # Each table goes before the first block below its top edge
+        for (_, y0, _, _), text in sorted(tables, key=lambda table: table[0][1]):
+            position = next((i for i, (block_top, _) in enumerate(items) if block_top >= y0), len(items))
+            items.insert(position, (y0, f"[Table]\n{text}"))
+
+        text = "\n".join(text for _, text in items)
+        return text, {
+            "raw_chars": raw_chars,
+            "chars": len(text),
+            "running_chars": running_chars,
+            "table_chars": sum(len(text) for _, text in tables),
+            "tables": len(tables),
+        }
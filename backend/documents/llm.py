@@ -0,0 +1,160 @@
+import asyncio
+import os
+import threading
+from django.conf import settings
+from .cache import get_cache, sha256_text
+
+DEFAULT_MODEL = "gpt-4o-mini"
+SYSTEM_PROMPT = "You are a clinical document parser. Return only valid JSON format as requested."
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _build_async_client():
+    max_connections = getattr(settings, "ICF_LLM_MAX_CONNECTIONS", 32)
+    if getattr(settings, "ICF_LLM_BACKEND", "openai") == "stub":
+        from .llm_stub import AsyncStubLLMClient
+        return AsyncStubLLMClient(latency=getattr(settings, "ICF_STUB_LLM_LATENCY", 0.0))
+
+    import openai
+    from .gateway import GatewayError
+    # Build the limits with the same class openai uses so this works across httpx versions
+    limits = type(openai.DEFAULT_CONNECTION_LIMITS)(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+    )
+    try:
+        return openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=getattr(settings, "OPENAI_BASE_URL", None) or None,
+            http_client=openai.DefaultAsyncHttpxClient(limits=limits),
+            timeout=getattr(settings, "ICF_LLM_TIMEOUT", 60.0),
+            max_retries=0,  # The gateway retries, with rate-limit awareness
+        )
+    except openai.OpenAIError as e:
+        # Most likely no OPENAI_API_KEY; retried on the next call, as the client isn't kept
+        raise GatewayError(f"Model client unavailable: {e}", status=503) from e
+
+
+def get_client():
+    """Return the shared ``LLMGateway``.
+
+    The upstream client is selected by ``ICF_LLM_BACKEND`` ("openai" or
+    "stub"); ``OPENAI_BASE_URL`` can point the OpenAI client at a local
+    ``llm_stub`` server instead.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            from .gateway import LLMGateway
+            _client = LLMGateway(
+                _build_async_client(),
+                requests_per_minute=getattr(settings, "ICF_LLM_REQUESTS_PER_MINUTE", 0),
+                tokens_per_minute=getattr(settings, "ICF_LLM_TOKENS_PER_MINUTE", 0),
+                max_concurrency=getattr(settings, "ICF_LLM_MAX_CONNECTIONS", 32),
+                timeout=getattr(settings, "ICF_LLM_TIMEOUT", 60.0),
+                max_retries=getattr(settings, "ICF_LLM_MAX_RETRIES", 4),
+            )
+        return _client
+
+
+def peek_client():
+    """Return the shared client if it has been created, without creating it."""
+    return _client
+
+
+def get_model():
+    return getattr(settings, "ICF_LLM_MODEL", DEFAULT_MODEL)
+
+
+def chat(prompt, client=None, model=None, use_cache=True):
+    """Send a single-turn prompt and return the model's text reply.
+
+    Replies are cached by a hash of model, system prompt and prompt text.
+    """
+    model = model or get_model()
+    cache = get_cache() if use_cache else None
+    if cache is not None:
+        key = sha256_text(model, SYSTEM_PROMPT, prompt)
+        cached = cache.get("llm", key)
+        if cached is not None:
+            return cached
+
+    client = client or get_client()
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+    )
+    content = response.choices[0].message.content
+
+    if cache is not None:
+        cache.set("llm", key, content)
+    return content
+
+
+def stream_chat(prompt, client=None, model=None, use_cache=True):
+    """Like ``chat`` but yields the reply in pieces as the model produces them.
+
+    A cached reply is yielded whole; a fresh one is cached once complete.
+    """
+    model = model or get_model()
+    cache = get_cache() if use_cache else None
+    if cache is not None:
+        key = sha256_text(model, SYSTEM_PROMPT, prompt)
+        cached = cache.get("llm", key)
+        if cached is not None:
+            yield cached
+            return
+
+    client = client or get_client()
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        stream=True,
+    )
+    parts = []
+    for event in stream:
+        if not event.choices:
+            continue
+        delta = event.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            yield delta
+
+    if cache is not None:
+        cache.set("llm", key, "".join(parts))
+
+
+async def achat(prompt, client=None, model=None, use_cache=True):
+    """Async ``chat``: awaits the gateway's ``acreate`` instead of holding a thread while the model replies.
+
+    The cache lookups run in a worker thread, as the cache is SQLite.
+    """
+    model = model or get_model()
+    cache = get_cache() if use_cache else None
+    if cache is not None:
+        key = sha256_text(model, SYSTEM_PROMPT, prompt)
+        cached = await asyncio.to_thread(cache.get, "llm", key)
+        if cached is not None:
+            return cached
+
+    client = client or get_client()
+    response = await client.acreate(
+        model=model,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+    )
+    content = response.choices[0].message.content
+
+    if cache is not None:
+        await asyncio.to_thread(cache.set, "llm", key, content)
+    return content
@@ -0,0 +1,263 @@
+"""Offline stand-ins for the OpenAI chat API.
+
+``StubLLMClient`` and ``AsyncStubLLMClient`` mimic ``client.chat.completions.create``
+closely enough for the pipeline: they read the section names from the prompt's
+return format, find ``[Page N]`` markers in the text, and answer with
+deterministic JSON that cites pages containing words from each section name.
+With ``stream=True`` the reply arrives as a sequence of small deltas,
+``token_latency`` seconds apart. ``rate_limit_every=N`` makes every Nth call
+fail with a 429 carrying a ``retry-after`` header, to exercise retry logic.
+
+``StubLLMServer`` serves the same replies over HTTP at ``/v1/chat/completions``
+so the real OpenAI client can be pointed at it with ``OPENAI_BASE_URL``::
+
+    python -m documents.llm_stub --port 8765 --latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+SECTION_NAME_RE = re.compile(r'^\s*"([^"]+)":\s*\{', re.MULTILINE)
+PAGE_MARKER_RE = re.compile(r"^\[Page (\d+)\]$", re.MULTILINE)
+WORD_RE = re.compile(r"[a-z]{4,}")
+
+
+def _stem(word):
+    return word[:-1] if word.endswith("s") else word
+
+
+def respond(prompt):
+    """Deterministic model reply for ``prompt``."""
+    sections = SECTION_NAME_RE.findall(prompt)
+    pages = _split_pages(prompt)
+
+    result = {}
+    for section in sections:
+        words = {_stem(w) for w in WORD_RE.findall(section.lower())} - {"study"}
+        hits = [num for num, text in pages if any(w in text for w in words)]
+        if not hits:
+            continue
+        sample = " ".join(pages[[num for num, _ in pages].index(hits[0])][1].split()[:40])
+        result[section] = {"content": sample, "source_pages": hits[:5]}
+    return "```json\n" + json.dumps(result, indent=2) + "\n```"
+
+
+def _split_pages(prompt):
+    markers = list(PAGE_MARKER_RE.finditer(prompt))
+    pages = []
+    for i, match in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(prompt)
+        pages.append((int(match.group(1)), prompt[match.end():end].lower()))
+    return pages
+
+
+def _usage(prompt, content):
+    prompt_tokens = len(prompt) // 4 + 1
+    completion_tokens = len(content) // 4 + 1
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
+
+
+class StubRateLimitError(Exception):
+    """Shaped like ``openai.RateLimitError`` as far as the gateway looks at it."""
+
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limited, retry after {retry_after}s")
+        self.response = SimpleNamespace(headers={"retry-after": str(retry_after)})
+
+
+class _StubBase:
+    def __init__(self, latency=0.0, token_latency=0.0, token_chars=16, rate_limit_every=0, retry_after=0.1):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.token_chars = token_chars
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _begin(self, messages):
+        with self._lock:
+            self.calls += 1
+            calls = self.calls
+        if self.rate_limit_every and calls % self.rate_limit_every == 0:
+            raise StubRateLimitError(self.retry_after)
+        return respond(messages[-1]["content"])
+
+    def _completion(self, model, messages, content):
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content), finish_reason="stop")],
+            usage=_usage(messages[-1]["content"], content),
+        )
+
+    def _deltas(self, model, content):
+        size = self.token_chars
+        for start in range(0, len(content), size):
+            delta = SimpleNamespace(role="assistant", content=content[start:start + size])
+            yield SimpleNamespace(model=model, choices=[SimpleNamespace(delta=delta, finish_reason=None)])
+        yield SimpleNamespace(model=model, choices=[SimpleNamespace(delta=SimpleNamespace(content=None), finish_reason="stop")])
+
+
+class StubLLMClient(_StubBase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, stream=False, **kwargs):
+        content = self._begin(messages)
+        if self.latency:
+            time.sleep(self.latency)
+        if stream:
+            return self._stream(model, content)
+        return self._completion(model, messages, content)
+
+    def _stream(self, model, content):
+        for event in self._deltas(model, content):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            yield event
+
+
+class AsyncStubLLMClient(_StubBase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model, messages, stream=False, **kwargs):
+        content = self._begin(messages)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if stream:
+            return self._stream(model, content)
+        return self._completion(model, messages, content)
+
+    async def _stream(self, model, content):
+        for event in self._deltas(model, content):
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield event
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        stub = self.server.stub
+        try:
+            content = stub._begin(body["messages"])
+        except StubRateLimitError as e:
+            self._send_json(429, {"error": {"message": str(e), "type": "rate_limit_error"}},
+                            {"retry-after": e.response.headers["retry-after"]})
+            return
+        if stub.latency:
+            time.sleep(stub.latency)
+
+        model = body.get("model", "stub")
+        if body.get("stream"):
+            self._send_stream(model, content)
+            return
+        usage = _usage(body["messages"][-1]["content"], content)
+        self._send_json(200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": vars(usage),
+        })
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, model, content):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        stub = self.server.stub
+        for start in range(0, len(content), stub.token_chars):
+            if stub.token_latency:
+                time.sleep(stub.token_latency)
+            chunk = {
+                "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": content[start:start + stub.token_chars]}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    # Load tests open hundreds of connections at once; the default backlog of 5 drops most of them
+    request_queue_size = 1024
+
+
+class StubLLMServer:
+    """Local HTTP server speaking the chat completions API, backed by ``respond``."""
+
+    def __init__(self, host="127.0.0.1", port=0, **stub_options):
+        self.httpd = _StubHTTPServer((host, port), _StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = _StubBase(**stub_options)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI chat completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each reply")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds between streamed deltas")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="answer every Nth call with a 429")
+    args = parser.parse_args()
+
+    server = StubLLMServer(args.host, args.port, latency=args.latency, token_latency=args.token_latency,
+                           rate_limit_every=args.rate_limit_every)
+    print(f"Stub chat API listening on {server.base_url} (set OPENAI_BASE_URL to this)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
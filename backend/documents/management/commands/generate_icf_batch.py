@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from documents.batch import run_batch
+
+
+class Command(BaseCommand):
+    help = "Generate ICF documents for many protocols (files, directories or zip archives) at once."
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="PDF/DOCX files, directories or zip archives")
+        parser.add_argument("--output-dir", "-o", required=True, help="Where ICFs and manifest.json are written")
+        parser.add_argument(
+            "--documents", type=int, default=getattr(settings, "ICF_BATCH_MAX_DOCUMENTS", 2),
+            help="Protocols processed at the same time",
+        )
+        parser.add_argument(
+            "--llm-concurrency", type=int, default=getattr(settings, "ICF_BATCH_LLM_CONCURRENCY", 4),
+            help="Model calls in flight across the whole batch",
+        )
+        parser.add_argument(
+            "--requests-per-minute", type=int, default=getattr(settings, "ICF_BATCH_REQUESTS_PER_MINUTE", 0),
+            help="Model requests started per minute across the whole batch (0 = unlimited)",
+        )
+
+    def handle(self, *args, **options):
+        def on_progress(done, total):
+            self.stdout.write(f"[{done}/{total}] documents finished")
+
+        manifest = run_batch(
+            options["paths"],
+            options["output_dir"],
+            max_documents=options["documents"],
+            max_llm_concurrency=options["llm_concurrency"],
+            requests_per_minute=options["requests_per_minute"],
+            on_progress=on_progress,
+        )
+        summary = manifest["summary"]
+        if not summary["inputs"]:
+            raise CommandError("No PDF or DOCX protocols found in the given paths")
+
+        for entry in manifest["documents"]:
+            if entry["status"] == "failed":
+                self.stderr.write(f"FAILED {entry['source']}: {entry['error']}")
+
+        self.stdout.write(
+            f"{summary['succeeded']}/{summary['unique']} unique protocols succeeded "
+            f"({summary['duplicates']} duplicates skipped) in {summary['elapsed_seconds']}s, "
+            f"{summary['documents_per_minute']} documents/minute"
+        )
+        for stage, seconds in summary["stage_seconds"].items():
+            self.stdout.write(f"  {stage:<12} {seconds:>8.2f}s total")
+        self.stdout.write(self.style.SUCCESS(f"Manifest written to {options['output_dir']}/manifest.json"))
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from documents.protocols import prune
+
+
+class Command(BaseCommand):
+    help = "Delete stored protocol versions past the retention limits."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep", type=int, default=getattr(settings, "ICF_PROTOCOL_MAX_VERSIONS", 10),
+            help="Newest complete versions kept per protocol (0 = all)",
+        )
+        parser.add_argument(
+            "--retention-days", type=int, default=getattr(settings, "ICF_PROTOCOL_RETENTION_DAYS", 0),
+            help="Delete protocols with no version uploaded in this many days (0 = never)",
+        )
+        parser.add_argument(
+            "--stale-hours", type=int, default=24,
+            help="Delete unfinished versions older than this, left by crashed runs",
+        )
+
+    def handle(self, *args, **options):
+        counts = prune(keep=options["keep"], retention_days=options["retention_days"],
+                       stale_hours=options["stale_hours"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {counts['protocols']} protocols, {counts['versions']} old versions "
+            f"and {counts['stale_versions']} unfinished versions"
+        ))
@@ -0,0 +1,238 @@
+"""Stage timing spans and Prometheus-style metrics.
+
+Wrap work in ``span("stage")`` (or decorate a function with ``timed("stage")``)
+to time it. Inside ``collect()`` durations are added up per stage for the
+current pipeline run, and each run's totals feed the per-stage histograms
+served at ``/metrics``; spans outside a run are observed directly. Runs are
+tracked with a context variable, so spans in chunk worker threads count
+towards the run that submitted them as long as the work is submitted through
+``contextvars.copy_context().run``.
+
+With ``ICF_METRICS_ENABLED`` off, ``span`` returns a shared no-op context
+manager and ``collect`` yields ``None``.
+"""
+import contextvars
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, math.inf)
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self):
+        """Cumulative bucket counts keyed by upper bound, Prometheus style."""
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                buckets["+Inf" if bound == math.inf else bound] = cumulative
+            return {"buckets": buckets, "count": self.count, "sum": round(self.sum, 6)}
+
+
+_stage_histograms = {}
+_stage_lock = threading.Lock()
+_current = contextvars.ContextVar("icf_timings", default=None)
+
+
+def enabled():
+    return getattr(settings, "ICF_METRICS_ENABLED", True)
+
+
+def observe_stage(stage, seconds):
+    histogram = _stage_histograms.get(stage)
+    if histogram is None:
+        with _stage_lock:
+            histogram = _stage_histograms.setdefault(stage, Histogram(STAGE_BUCKETS))
+    histogram.observe(seconds)
+
+
+class Timings:
+    """Seconds per stage for one pipeline run.
+
+    Stages that run in several chunk workers at once (prompt build, LLM call,
+    parsing) are summed, so they can add up to more than the wall time.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def as_dict(self):
+        with self._lock:
+            return {stage: round(seconds, 4) for stage, seconds in self.seconds.items()}
+
+
+class _Span:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.started
+        timings = _current.get()
+        if timings is not None:
+            timings.add(self.stage, seconds)
+        else:
+            observe_stage(self.stage, seconds)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(stage):
+    """Context manager timing the enclosed block as ``stage``."""
+    if not enabled():
+        return _NULL_SPAN
+    return _Span(stage)
+
+
+def timed(stage):
+    """Decorator form of ``span``."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def collect():
+    """Collect the spans of one run; yields ``Timings`` (or ``None`` when disabled)."""
+    if not enabled():
+        yield None
+        return
+    timings = Timings()
+    token = _current.set(timings)
+    started = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+        timings.add("total", time.perf_counter() - started)
+        # Histograms get one observation per stage per run, not one per span
+        for stage, seconds in timings.seconds.items():
+            observe_stage(stage, seconds)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+
+def _histogram_lines(name, snapshot, labels=None):
+    labels = labels or {}
+    lines = []
+    for bound, count in snapshot["buckets"].items():
+        lines.append(f"{name}_bucket{_format_labels({**labels, 'le': bound})} {count}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {snapshot['sum']}")
+    lines.append(f"{name}_count{_format_labels(labels)} {snapshot['count']}")
+    return lines
+
+
+def render_prometheus():
+    """Render stage, cache, artifact store, LLM gateway and job queue metrics in the Prometheus text format."""
+    from .artifacts import peek_artifact_store
+    from .cache import get_cache
+    from .jobs import peek_job_queue
+    from .llm import peek_client
+
+    lines = [
+        "# HELP icf_stage_seconds Time spent in each pipeline stage.",
+        "# TYPE icf_stage_seconds histogram",
+    ]
+    with _stage_lock:
+        stages = sorted(_stage_histograms.items())
+    for stage, histogram in stages:
+        lines += _histogram_lines("icf_stage_seconds", histogram.snapshot(), {"stage": stage})
+
+    cache = get_cache()
+    if cache is not None:
+        stats = cache.stats()
+        lines += [
+            "# HELP icf_cache_entries Entries in the content cache.",
+            "# TYPE icf_cache_entries gauge",
+            f"icf_cache_entries {stats['entries']}",
+            "# HELP icf_cache_bytes Bytes stored in the content cache.",
+            "# TYPE icf_cache_bytes gauge",
+            f"icf_cache_bytes {stats['bytes']}",
+        ]
+        for kind in ("hits", "misses"):
+            lines += [
+                f"# HELP icf_cache_{kind}_total Content cache {kind} by namespace.",
+                f"# TYPE icf_cache_{kind}_total counter",
+            ]
+            lines += [f'icf_cache_{kind}_total{{namespace="{ns}"}} {count}' for ns, count in sorted(stats[kind].items())]
+
+    store = peek_artifact_store()
+    if store is not None:
+        stats = store.stats()
+        lines += [
+            "# HELP icf_artifacts Stored artifacts (download ids).",
+            "# TYPE icf_artifacts gauge",
+            f"icf_artifacts {stats['artifacts']}",
+            "# HELP icf_artifact_bytes Bytes of distinct artifact blobs on disk.",
+            "# TYPE icf_artifact_bytes gauge",
+            f"icf_artifact_bytes {stats['bytes']}",
+        ]
+
+    client = peek_client()
+    if client is not None and hasattr(client, "metrics"):
+        llm = client.metrics()
+        for name in ("requests", "succeeded", "failed", "retries", "rate_limited", "timeouts", "coalesced", "tokens"):
+            lines += [f"# TYPE icf_llm_{name}_total counter", f"icf_llm_{name}_total {llm[name]}"]
+        lines += ["# TYPE icf_llm_in_flight gauge", f"icf_llm_in_flight {llm['in_flight']}"]
+        lines += [
+            "# HELP icf_llm_latency_seconds Time until the model answers (or starts streaming).",
+            "# TYPE icf_llm_latency_seconds histogram",
+        ]
+        lines += _histogram_lines("icf_llm_latency_seconds", llm["latency_seconds"])
+
+    queue = peek_job_queue()
+    if queue is not None:
+        lines += ["# TYPE icf_job_queue_depth gauge", f"icf_job_queue_depth {queue.backend.depth}"]
+
+    return "\n".join(lines) + "\n"
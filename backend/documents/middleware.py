@@ -0,0 +1,102 @@
+"""Brotli/gzip compression of JSON and plain-text responses.
+
+Full responses for long protocols are mostly repeated page samples and
+section text, which compress several times over. Encodings are tried in
+``ICF_RESPONSE_COMPRESSION`` order among those the client accepts; "br"
+needs the optional ``brotli`` package and is skipped without it. Streamed
+responses (server-sent events, file downloads) are left alone, so events
+aren't held back in a compressor's buffer. HTML (the admin, DRF's browsable
+API) isn't compressed: its pages carry CSRF tokens, and compressing those
+next to reflected input opens them to BREACH.
+"""
+import re
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/plain")
+BROTLI_QUALITY = 5  # Past about 5 brotli gets much slower for little gain on JSON
+Q_RE = re.compile(r"^\s*q\s*=\s*([0-9.]+)\s*$")
+
+
+def encoding_qualities(header):
+    """``{coding: q}`` from an ``Accept-Encoding`` header, lowercased; ``*`` stands for any coding not listed."""
+    qualities = {}
+    for part in (header or "").split(","):
+        coding, *params = part.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            match = Q_RE.match(param)
+            if match:
+                try:
+                    quality = float(match.group(1))
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    return qualities
+
+
+def negotiate(header, encodings):
+    """Pick from ``encodings`` (preferred first) for an ``Accept-Encoding`` header.
+
+    Returns ``(encoding, identity_ok)``: the acceptable encoding with the
+    highest q, ties going to the earlier one, or None; and whether the
+    client takes an uncompressed body, which it does unless it sends
+    ``identity;q=0`` (or ``*;q=0`` without listing identity).
+    """
+    qualities = encoding_qualities(header)
+    wildcard = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for coding in encodings:
+        quality = qualities.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    identity = qualities.get("identity", qualities.get("*", 1.0))
+    return best, identity > 0
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        configured = [coding.strip() for coding in getattr(settings, "ICF_RESPONSE_COMPRESSION", "").split(",")]
+        self.encodings = [coding for coding in configured if coding == "gzip" or (coding == "br" and brotli)]
+        if not self.encodings:
+            raise MiddlewareNotUsed
+        self.min_bytes = getattr(settings, "ICF_COMPRESSION_MIN_BYTES", 1024)
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header("Content-Encoding"):
+            return response
+        if not response.get("Content-Type", "").startswith(COMPRESSIBLE_TYPES):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding, identity_ok = negotiate(request.headers.get("Accept-Encoding"), self.encodings)
+        # A client refusing identity gets even small bodies compressed; one accepting nothing we have gets identity
+        if encoding is None or (identity_ok and len(response.content) < self.min_bytes):
+            return response
+
+        if encoding == "br":
+            compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        else:
+            # Random bytes in the gzip header, as GZipMiddleware does against BREACH
+            compressed = compress_string(response.content, max_random_bytes=100)
+        if identity_ok and len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response.headers["Content-Length"] = str(len(compressed))
+        response.headers["Content-Encoding"] = encoding
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        return response
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Protocol',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProtocolVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('file_name', models.CharField(max_length=255)),
+                ('file_sha256', models.CharField(db_index=True, max_length=64)),
+                ('status', models.CharField(choices=[('processing', 'Processing'), ('complete', 'Complete')], default='processing', max_length=16)),
+                ('page_count', models.PositiveIntegerField(default=0)),
+                ('pages_reused', models.PositiveIntegerField(default=0)),
+                ('pages_changed', models.PositiveIntegerField(default=0)),
+                ('sections_reused', models.PositiveIntegerField(default=0)),
+                ('sections_regenerated', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('protocol', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='documents.protocol')),
+            ],
+            options={
+                'ordering': ['protocol', 'number'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Page',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('source_hash', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('text_hash', models.CharField(db_index=True, max_length=64)),
+                ('text', models.TextField()),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='documents.protocolversion')),
+            ],
+            options={
+                'ordering': ['version', 'number'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Section',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('content', models.TextField()),
+                ('source_pages', models.JSONField(default=list)),
+                ('source_hashes', models.JSONField(default=list)),
+                ('reused_from', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='documents.section')),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sections', to='documents.protocolversion')),
+            ],
+            options={
+                'ordering': ['version', 'id'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='protocolversion',
+            constraint=models.UniqueConstraint(fields=('protocol', 'number'), name='unique_protocol_version'),
+        ),
+        migrations.AddConstraint(
+            model_name='page',
+            constraint=models.UniqueConstraint(fields=('version', 'number'), name='unique_version_page'),
+        ),
+    ]
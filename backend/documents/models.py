@@ -0,0 +1,67 @@
+from django.db import models
+
+
+class Protocol(models.Model):
+    """A clinical trial protocol; each upload of it (original or amendment) is a ``ProtocolVersion``."""
+
+    title = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.title
+
+    def latest_version(self):
+        return self.versions.filter(status=ProtocolVersion.COMPLETE).order_by("-number").first()
+
+
+class ProtocolVersion(models.Model):
+    PROCESSING = "processing"
+    COMPLETE = "complete"
+    STATUS_CHOICES = [(PROCESSING, "Processing"), (COMPLETE, "Complete")]
+
+    protocol = models.ForeignKey(Protocol, related_name="versions", on_delete=models.CASCADE)
+    number = models.PositiveIntegerField()
+    file_name = models.CharField(max_length=255)
+    file_sha256 = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PROCESSING)
+    page_count = models.PositiveIntegerField(default=0)
+    # How much of the previous version was reused (all zero for a first upload)
+    pages_reused = models.PositiveIntegerField(default=0)
+    pages_changed = models.PositiveIntegerField(default=0)
+    sections_reused = models.PositiveIntegerField(default=0)
+    sections_regenerated = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["protocol", "number"]
+        constraints = [models.UniqueConstraint(fields=["protocol", "number"], name="unique_protocol_version")]
+
+    def __str__(self):
+        return f"{self.protocol} v{self.number}"
+
+
+class Page(models.Model):
+    version = models.ForeignKey(ProtocolVersion, related_name="pages", on_delete=models.CASCADE)
+    number = models.PositiveIntegerField()
+    # Hash of what the page is drawn from; a match lets extraction be skipped
+    source_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # Hash of the extracted text; used to diff versions
+    text_hash = models.CharField(max_length=64, db_index=True)
+    text = models.TextField()
+
+    class Meta:
+        ordering = ["version", "number"]
+        constraints = [models.UniqueConstraint(fields=["version", "number"], name="unique_version_page")]
+
+
+class Section(models.Model):
+    version = models.ForeignKey(ProtocolVersion, related_name="sections", on_delete=models.CASCADE)
+    name = models.CharField(max_length=255)
+    content = models.TextField()
+    # Provenance: page numbers in this version and the text hashes of those pages
+    source_pages = models.JSONField(default=list)
+    source_hashes = models.JSONField(default=list)
+    reused_from = models.ForeignKey("self", null=True, blank=True, related_name="+", on_delete=models.SET_NULL)
+
+    class Meta:
+        ordering = ["version", "id"]
@@ -0,0 +1,231 @@
+"""Parsing model replies into typed sections.
+
+Replies should be a JSON object mapping section names to
+``{"content": "...", "source_pages": [...]}`` (or just the content string),
+but models wrap it in markdown fences, add a sentence before or after it, or
+get cut off mid-reply. ``parse_response`` finds the object and decodes it
+once with the C JSON decoder, salvaging the complete sections of a truncated
+reply and falling back to ``**Heading**`` markdown. ``IncrementalParser``
+reads a streamed reply and returns each section as soon as its value is
+complete. Both check every entry against the section schema and return
+``ExtractedSection`` objects, which the rest of the pipeline passes around.
+"""
+import json
+import re
+from dataclasses import dataclass, field
+
+FENCE_RE = re.compile(r"```[\w-]*[ \t]*\n?")
+MARKDOWN_HEADING_RE = re.compile(r"^\*\*(.+?)\*\*$")
+# What the incremental scanner has to stop at inside and outside strings
+STRING_SPECIAL_RE = re.compile(r'["\\]')
+STRUCTURAL_RE = re.compile(r'[{}\[\]",]')
+
+_decoder = json.JSONDecoder()
+
+
+class ResponseParseError(ValueError):
+    pass
+
+
+@dataclass
+class ExtractedSection:
+    name: str
+    content: str
+    source_pages: list = field(default_factory=list)
+
+    def as_dict(self):
+        return {"content": self.content, "source_pages": self.source_pages}
+
+
+def sections_to_dict(sections):
+    """``{name: {"content", "source_pages"}}``, the shape used in responses and ``generated_text``."""
+    return {section.name: section.as_dict() for section in sections}
+
+
+def _page_numbers(value):
+    # Page numbers as ints >= 1; integer strings and floats such as "3" or 3.0 are accepted
+    if not isinstance(value, list):
+        return []
+    pages = set()
+    for item in value:
+        if isinstance(item, bool):
+            continue
+        if isinstance(item, str) and item.strip().isdigit():
+            item = int(item)
+        elif isinstance(item, float) and item.is_integer():
+            item = int(item)
+        if isinstance(item, int) and item >= 1:
+            pages.add(item)
+    return sorted(pages)
+
+
+def validate_section(name, value, page_numbers=None):
+    """Return an ``ExtractedSection`` for one reply entry, or None if it is empty or malformed.
+
+    With ``page_numbers`` (the pages the model was shown), cited pages outside
+    it are dropped, and a section citing none of them is attributed to all.
+    """
+    if isinstance(value, dict):
+        content = value.get("content", "")
+        source_pages = _page_numbers(value.get("source_pages", []))
+    else:
+        content, source_pages = value, []
+    if isinstance(content, list) and all(isinstance(item, str) for item in content):
+        content = "\n".join(content)
+    if not isinstance(content, str) or not content.strip() or not name.strip():
+        return None
+    if page_numbers is not None:
+        allowed = set(page_numbers)
+        source_pages = [p for p in source_pages if p in allowed] or sorted(allowed)
+    return ExtractedSection(name.strip(), content.strip(), source_pages)
+
+
+def sections_from_object(obj, page_numbers=None):
+    sections = (validate_section(name, value, page_numbers) for name, value in obj.items())
+    return [section for section in sections if section is not None]
+
+
+def strip_fences(text):
+    """The contents of the markdown code block around the reply, or ``text`` itself."""
+    match = FENCE_RE.search(text)
+    brace = text.find("{")
+    # A fence after the opening brace is inside the JSON, e.g. quoted in a section's content
+    if not match or (brace != -1 and brace < match.start()):
+        return text
+    end = text.find("```", match.end())
+    return text[match.end():end] if end != -1 else text[match.end():]
+
+
+def parse_markdown(text, page_numbers=None):
+    """Sections from ``**Section Name**`` heading lines followed by their content."""
+    sections = []
+    name, lines = None, []
+    for line in text.splitlines():
+        line = line.strip()
+        heading = MARKDOWN_HEADING_RE.match(line)
+        if heading:
+            if name:
+                sections.append(validate_section(name, "\n".join(lines), page_numbers))
+            name, lines = heading.group(1).strip(), []
+        elif name and line:
+            lines.append(line)
+    if name:
+        sections.append(validate_section(name, "\n".join(lines), page_numbers))
+    return [section for section in sections if section is not None]
+
+
+def parse_response(text, page_numbers=None):
+    """Parse a complete model reply into a list of ``ExtractedSection``.
+
+    Raises ``ResponseParseError`` if no JSON object or markdown sections can
+    be found; a well-formed object without usable sections gives ``[]``.
+    """
+    body = strip_fences(text)
+    start = body.find("{")
+    if start != -1:
+        try:
+            obj, _ = _decoder.raw_decode(body, start)
+        except json.JSONDecodeError:
+            obj = None
+        if isinstance(obj, dict):
+            return sections_from_object(obj, page_numbers)
+
+        # Truncated or otherwise broken: keep every section whose value is complete
+        parser = IncrementalParser(page_numbers)
+        parser.feed(body)
+        if parser.sections:
+            return parser.close()
+
+    sections = parse_markdown(text, page_numbers)
+    if sections:
+        return sections
+    raise ResponseParseError("No sections found in the model reply")
+
+
+class IncrementalParser:
+    """Parse a reply as it streams in, returning each section once its value is complete.
+
+    ``feed(text)`` returns the sections completed by that piece of the reply.
+    Text before the opening ``{`` (fences, prose) is skipped. String and
+    nesting state carry over between pieces, so each piece is scanned once and
+    only the member being read is kept; a member is decoded when the comma or
+    brace after it arrives.
+    """
+
+    def __init__(self, page_numbers=None):
+        self.page_numbers = page_numbers
+        self.sections = {}
+        self.complete = False
+        self._started = False  # seen the top-level "{"
+        self._parts = []  # text of the member being read, from earlier pieces
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text):
+        if self.complete:
+            return []
+        completed = []
+        pos = member_start = 0
+
+        while pos < len(text):
+            if not self._started:
+                start = text.find("{", pos)
+                if start == -1:
+                    return completed
+                self._started = True
+                self._depth = 1
+                pos = member_start = start + 1
+            elif self._in_string:
+                if self._escape:
+                    pos += 1
+                    self._escape = False
+                    continue
+                match = STRING_SPECIAL_RE.search(text, pos)
+                if match is None:
+                    break
+                pos = match.end()
+                if match.group() == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+            else:
+                match = STRUCTURAL_RE.search(text, pos)
+                if match is None:
+                    break
+                char, pos = match.group(), match.end()
+                if char == '"':
+                    self._in_string = True
+                elif char in "{[":
+                    self._depth += 1
+                elif char in "}]":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        completed += self._member(text[member_start:match.start()])
+                        self.complete = True
+                        return completed
+                elif self._depth == 1:  # a comma between top-level members
+                    completed += self._member(text[member_start:match.start()])
+                    member_start = pos
+
+        if self._started:
+            self._parts.append(text[member_start:])
+        return completed
+
+    def _member(self, tail):
+        text = "".join(self._parts) + tail
+        self._parts = []
+        if not text.strip():
+            return []
+        try:
+            obj = json.loads("{" + text + "}")
+        except json.JSONDecodeError:
+            return []  # a malformed member shouldn't cost the others
+        sections = sections_from_object(obj, self.page_numbers)
+        for section in sections:
+            self.sections[section.name] = section
+        return sections
+
+    def close(self):
+        """Every section parsed so far, in reply order."""
+        return list(self.sections.values())
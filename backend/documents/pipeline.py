@@ -0,0 +1,707 @@
+import os
+import tempfile
+import json
+import datetime
+import logging
+from collections import Counter
+from functools import partial
+from django.conf import settings
+from .utils import iter_pdf_pages, iter_docx_pages
+from .docx_pages import PAGINATION_VERSION
+from .layout import LAYOUT_VERSION
+from .chunking import (
+    map_reduce_sections, merge_results, extract_chunks, ranked_chunk, aextract_chunks, chunk_pages,
+)
+from .parsing import sections_to_dict
+from .cache import get_cache, sha256_file, sha256_text
+from .index import PageIndex
+from .vectors import PageVectors
+from .rendering import get_template, render_document
+from .artifacts import get_artifact_store, DOCX_CONTENT_TYPE
+from .protocols import ProtocolRecorder
+from .sections import get_registry
+from .executor import offload
+from . import cancellation, metrics
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx")
+
+# Characters of each page kept for logs once its full text has been sent to the model
+SAMPLE_CHARS = 150
+
+
+class UnsupportedFileType(Exception):
+    pass
+
+
+def is_supported_file(file_name):
+    return file_name.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def iter_pages(file_obj, file_name, previous=None):
+    """Return a generator of page dicts from an uploaded PDF or DOCX file.
+
+    Pages are produced one at a time so downstream stages can consume them as
+    they arrive. Each page is cached under the SHA-256 of the file contents, so
+    re-uploading the same protocol streams pages back without opening it.
+    PDF text is layout-aware (see ``layout.PdfLayout``) unless
+    ``ICF_PDF_LAYOUT`` is off.
+
+    With ``previous`` (a ``protocols.PreviousVersion``), pages drawn from the
+    same source as a page of that version take its text instead of being
+    extracted again.
+    """
+    variant = ""
+    if file_name.lower().endswith(".pdf"):
+        layout = getattr(settings, "ICF_PDF_LAYOUT", True)
+        margin = getattr(settings, "ICF_PDF_MARGIN", 0.12)
+        tables = getattr(settings, "ICF_PDF_TABLES", False)
+        iterate = partial(
+            iter_pdf_pages,
+            workers=getattr(settings, "ICF_PDF_WORKERS", 1),
+            parallel_min_pages=getattr(settings, "ICF_PDF_PARALLEL_MIN_PAGES", 100),
+            batch_pages=getattr(settings, "ICF_PDF_BATCH_PAGES", 16),
+            layout=layout,
+            margin=margin,
+            tables=tables,
+        )
+        # Cached pages are only valid for the extraction settings that produced them
+        variant = f":layout-{LAYOUT_VERSION}-{margin}-{int(tables)}" if layout else ""
+    elif file_name.lower().endswith(".docx"):
+        max_chars = getattr(settings, "ICF_DOCX_PAGE_CHARS", 3000)
+        iterate = partial(iter_docx_pages, max_chars=max_chars)
+        variant = f":docx-{PAGINATION_VERSION}-{max_chars}"
+    else:
+        raise UnsupportedFileType("Unsupported file type")
+    if previous is not None:
+        iterate = partial(_iter_reused_pages, iterate, previous)
+
+    cache = get_cache()
+    if cache is None:
+        return iterate(file_obj)
+    return _iter_cached_pages(cache, sha256_file(file_obj) + variant, iterate, file_obj)
+
+
+def _iter_cached_pages(cache, key, iterate, file_obj):
+    next_page = 1
+    page_count = cache.get("pages", key)
+    if page_count is not None:
+        while next_page <= page_count:
+            page = cache.get("page", f"{key}:{next_page}")
+            if page is None:
+                break  # Evicted, extract the rest from the file
+            yield page
+            next_page += 1
+        else:
+            return
+
+    page_count = next_page - 1
+    for page in iterate(file_obj, start=next_page):
+        cache.set("page", f"{key}:{page['page']}", page)
+        page_count = page["page"]
+        yield page
+    cache.set("pages", key, page_count)
+
+
+def _iter_reused_pages(iterate, previous, file_obj, start=1):
+    for page in iterate(file_obj, start=start, skip_hashes=previous.source_hashes):
+        if page["text"] is None:
+            page["text"] = previous.text_for_source(page["source_hash"])
+        yield page
+
+
+def process_upload(file_obj, file_name, protocol_id=None, **kwargs):
+    """Run the pipeline on an uploaded protocol, recording it as a new protocol version.
+
+    ``protocol_id`` marks the upload as an amendment of that protocol (raising
+    ``Protocol.DoesNotExist`` if unknown) so unchanged pages and sections are
+    reused. With ``ICF_PERSIST_PROTOCOLS`` off this is plain ``run_pipeline``.
+    Other keyword arguments go to ``run_pipeline``.
+    """
+    if not getattr(settings, "ICF_PERSIST_PROTOCOLS", True):
+        return run_pipeline(iter_pages(file_obj, file_name), **kwargs)
+
+    if not is_supported_file(file_name):
+        raise UnsupportedFileType("Unsupported file type")
+    recorder = ProtocolRecorder.start(file_obj, file_name, protocol_id)
+    try:
+        return run_pipeline(iter_pages(file_obj, file_name, previous=recorder.previous), recorder=recorder, **kwargs)
+    except BaseException:
+        recorder.abort()
+        raise
+
+
+def extract_pages(file_obj, file_name):
+    """Extract all page dicts from an uploaded PDF or DOCX file as a list."""
+    return list(iter_pages(file_obj, file_name))
+
+
+def summarize_page(page):
+    """Keep only what logging needs once a page's text has moved on."""
+    text = page["text"]
+    return {
+        "page": page["page"],
+        "sample": text[:SAMPLE_CHARS],
+        "length": len(text),
+    }
+
+
+def content_sample(summary, length=SAMPLE_CHARS):
+    sample = summary["sample"][:length]
+    return sample + "..." if summary["length"] > length else sample
+
+
+def build_prompt(chunk_text, first_page, last_page):
+    """Prompt asking for every registered section from one chunk."""
+    return get_registry().build_prompt(chunk_text, first_page, last_page)
+
+
+def finish_sections(sections):
+    """Apply the registry's order and length limits; return ``(generated_text, sections)``."""
+    sections = get_registry().apply_limits(sections)
+    return json.dumps(sections_to_dict(sections), indent=2), sections
+
+
+def generate_sections(pages, on_token=None, on_section=None, client=None):
+    """Run the model over every chunk of the extracted pages, asking for every section at once.
+
+    Returns ``(generated_text, sections)``: the merged sections as JSON text
+    and as ``ExtractedSection`` objects. ``pages`` may be a lazy iterator;
+    chunks are dispatched as soon as they fill. ``on_token`` and
+    ``on_section`` are passed through to ``map_reduce_sections``; ``client``
+    overrides the shared chat client. If every chunk fails, the last error
+    (usually a ``GatewayError``) is raised.
+    """
+    sections = map_reduce_sections(
+        pages,
+        build_prompt,
+        client=client,
+        max_tokens=getattr(settings, "ICF_CHUNK_TOKENS", 3000),
+        overlap_pages=getattr(settings, "ICF_CHUNK_OVERLAP_PAGES", 1),
+        max_in_flight=getattr(settings, "ICF_LLM_MAX_IN_FLIGHT", 4),
+        on_token=on_token,
+        on_section=on_section,
+    )
+    return finish_sections(sections)
+
+
+def generate_sections_incremental(reused, pages, **kwargs):
+    """Like ``generate_sections`` for an amendment: run the model over ``pages``
+    only and merge its sections into the carried-over ``reused`` ones."""
+    fresh = generate_sections(pages, **kwargs)[1] if pages else []
+    return finish_sections(merge_results([reused, fresh]))
+
+
+def new_page_index():
+    """An empty ``PageIndex``, with TF-IDF page vectors unless ``ICF_RELEVANCE`` is "bm25"."""
+    vectors = None
+    if getattr(settings, "ICF_RELEVANCE", "vectors") == "vectors":
+        vectors = PageVectors(
+            dim=getattr(settings, "ICF_VECTOR_DIM", 8192),
+            mmap_pages=getattr(settings, "ICF_VECTOR_MMAP_PAGES", 2000),
+        )
+    return PageIndex(vectors=vectors)
+
+
+def rank_sections(index, specs, k=3, min_relative=0.0):
+    """``{section name: [(page, score), ...]}`` for ``specs``, best first.
+
+    Pages are ranked by TF-IDF similarity to each section's ``query`` when
+    the index has vectors, otherwise by BM25 over its keywords.
+    ``min_relative`` drops vector matches scoring under that share of the
+    section's best.
+    """
+    if index.vectors is not None:
+        return index.vectors.rank({spec.name: spec.query for spec in specs}, k=k, min_relative=min_relative)
+    return index.top_pages_by_section({spec.name: spec.keywords for spec in specs}, k=k)
+
+
+def rank_section_pages(index, specs):
+    """``{section name: [page, ...]}``, the pages to send for each section, best first."""
+    top_pages = getattr(settings, "ICF_SECTION_TOP_PAGES", 6)
+    ranked = rank_sections(index, specs, k=top_pages,
+                           min_relative=getattr(settings, "ICF_SECTION_MIN_RELEVANCE", 0.6))
+    # A section that matches nothing is looked for at the start of the protocol
+    first_pages = sorted(index.pages)[:top_pages]
+    return {name: [page for page, _ in matches] or first_pages for name, matches in ranked.items()}
+
+
+def section_tasks(index, texts, specs):
+    """``(chunk, build_prompt)`` per spec: its top-ranked pages and a prompt asking for it alone."""
+    registry = get_registry()
+    ranked = rank_section_pages(index, specs)
+    max_tokens = getattr(settings, "ICF_CHUNK_TOKENS", 3000)
+    return [
+        (ranked_chunk(i, ranked[spec.name], texts, max_tokens), partial(registry.build_prompt, specs=[spec]))
+        for i, spec in enumerate(specs)
+    ]
+
+
+def plan_sections(index, texts, previous=None):
+    """Sections to extract in ``per_section`` mode: ``(specs, reused, incremental)``.
+
+    ``texts`` is the ``PageSpool`` of the protocol's pages. For an amendment
+    of ``previous``, sections carried over from it are left out unless one of
+    their best pages changed; ``reused`` and the ``incremental`` stats are
+    None otherwise.
+    """
+    specs = list(get_registry())
+    if previous is None:
+        return specs, None, None
+    reused, _, changed, incremental = previous.plan_hashes({number: sha256_text(texts[number]) for number in texts})
+    # Re-extract sections that couldn't be carried over or whose best pages changed
+    ranked = rank_section_pages(index, specs)
+    reused_names = {section.name for section in reused}
+    specs = [
+        spec for spec in specs
+        if spec.name not in reused_names or changed.intersection(ranked[spec.name])
+    ]
+    stale = {spec.name for spec in specs}
+    reused = [section for section in reused if section.name not in stale]
+    incremental["sections_sent"] = len(specs)
+    incremental["pages_sent"] = len({page for spec in specs for page in ranked[spec.name]})
+    return specs, reused, incremental
+
+
+def generate_sections_per_section(index, texts, specs, reused=(), on_token=None, on_section=None, client=None):
+    """Extract each of ``specs`` with its own model call over only its top-ranked pages.
+
+    ``texts`` maps page numbers to text for the pages in ``index``, e.g. a
+    ``PageSpool``. The calls
+    run concurrently (up to ``ICF_SECTION_MAX_IN_FLIGHT``), so latency stays
+    close to that of one short call however many sections are registered.
+    ``reused`` sections, carried over from a previous version, are merged in.
+    Returns ``(generated_text, sections)`` and fails like ``generate_sections``.
+    """
+    fresh = extract_chunks(
+        section_tasks(index, texts, specs),
+        client=client,
+        max_in_flight=getattr(settings, "ICF_SECTION_MAX_IN_FLIGHT", 16),
+        on_token=on_token,
+        on_section=on_section,
+    )
+    return finish_sections(merge_results([reused, fresh]))
+
+
+@metrics.timed("attribution")
+def build_detailed_logs(index, sections):
+    """Create detailed logs showing which pages were used for each section.
+
+    ``index`` is the document's ``PageIndex``, whose records are the page
+    summaries produced by ``summarize_page``; ``sections`` are the
+    ``ExtractedSection`` objects from the model.
+    """
+    detailed_logs = []
+
+    # Rank pages for every section in a single pass over the index
+    registry = get_registry()
+    ranked_matches = rank_sections(index, [registry.get(section.name) for section in sections
+                                           if registry.get(section.name)])
+
+    # Add section generation logs with page mapping
+    if sections:
+        for section in sections:
+            section_name, content = section.name, section.content
+
+            # Create contributing pages info from ChatGPT's source pages
+            contributing_pages = []
+            for page_num in section.source_pages:
+                page_obj = index.get(page_num)
+                if page_obj:
+                    contributing_pages.append({
+                        "page": page_obj["page"],
+                        "content_sample": content_sample(page_obj),
+                        "relevance_score": "ChatGPT identified"  # ChatGPT determined this page was relevant
+                    })
+
+            # If no source pages from ChatGPT, fallback to page ranking
+            if not contributing_pages:
+                # Top 3 most relevant pages, already sorted by score
+                for page_num, score in ranked_matches.get(section_name, []):
+                    contributing_pages.append({
+                        "page": page_num,
+                        "content_sample": content_sample(index.get(page_num)),
+                        "relevance_score": round(score, 2)
+                    })
+
+            detailed_logs.append({
+                "type": "section_generation",
+                "section": section_name,
+                "content_preview": content[:200] + "..." if len(content) > 200 else content,
+                "content_length": len(content),
+                "contributing_pages": contributing_pages,
+                "description": f"Generated '{section_name}' section using pages: {', '.join([str(p['page']) for p in contributing_pages]) if contributing_pages else 'AI analysis of all pages'}"
+            })
+
+    # Add document generation summary
+    detailed_logs.append({
+        "type": "document_generation",
+        "sections_count": len(sections),
+        "total_pages_processed": len(index),
+        "description": "Generated DOCX document with extracted protocol information"
+    })
+
+    return detailed_logs
+
+
+@metrics.timed("render")
+def render_icf(sections, detailed_logs, generated_text, output_path=None, logs=None):
+    """Render the ICF from the cached template and return ``(output_path, logs_path)``.
+
+    The DOCX goes to ``output_path`` (a new temp file by default). ``logs``
+    (default ``ICF_RENDER_LOGS``) places the processing logs "inline" at the
+    end of the form, in a separate "appendix" DOCX next to it, or "omit"s
+    them; ``logs_path`` is only set for an appendix.
+    """
+    if output_path is None:
+        output_path = tempfile.NamedTemporaryFile(delete=False, suffix=".docx", prefix="icf_").name
+    logs_path = render_document(
+        get_template(),
+        output_path,
+        sections,
+        detailed_logs,
+        generated_text,
+        generated_on=datetime.datetime.now().strftime("%B %d, %Y at %I:%M %p"),
+        logs=logs or getattr(settings, "ICF_RENDER_LOGS", "inline"),
+        headings=get_registry().headings(),
+    )
+    return output_path, logs_path
+
+
+def render_key(sections, detailed_logs, generated_text, logs=None):
+    """Hash everything an ICF is rendered from except its generation time, so identical ICFs share a blob."""
+    return sha256_text(
+        get_template().fingerprint,
+        logs or getattr(settings, "ICF_RENDER_LOGS", "inline"),
+        json.dumps(get_registry().headings(), sort_keys=True),
+        json.dumps(sections_to_dict(sections), sort_keys=True),
+        generated_text,
+        json.dumps(detailed_logs, sort_keys=True, default=str),
+    )
+
+
+def store_icf(output_path, logs_path=None, content_key=None):
+    """Move rendered files into the artifact store and return their download URLs.
+
+    ``content_key`` (see ``render_key``) stores them by what they were
+    rendered from, so a repeat generation reuses the earlier file.
+    """
+    store = get_artifact_store()
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    download_url = store.put(output_path, f"Protocol_Extracted_Information_{timestamp}.docx", DOCX_CONTENT_TYPE,
+                             content_key=content_key).download_url
+    logs_download_url = None
+    if logs_path:
+        logs_key = sha256_text(content_key, "logs") if content_key else None
+        logs_download_url = store.put(logs_path, f"Protocol_Processing_Logs_{timestamp}.docx", DOCX_CONTENT_TYPE,
+                                      content_key=logs_key).download_url
+    return download_url, logs_download_url
+
+
+def build_response_data(index, generated_text, sections, detailed_logs, download_url, logs_download_url=None):
+    # Keep backward compatibility with simple log format
+    simple_log = [{"page": p["page"], "text_sample": p["sample"][:100]} for p in index.pages.values()]
+
+    # Prepare response data
+    response_data = {
+        "download_url": download_url,
+        "generated_text": generated_text,
+        "log": simple_log,
+        "detailed_logs": detailed_logs,
+        "sections": sections_to_dict(sections),
+    }
+    if logs_download_url:
+        response_data["logs_download_url"] = logs_download_url
+
+    return response_data
+
+
+# Logs left out of compact responses, by the ``kind`` the logs endpoint serves them as
+LOG_KINDS = {"pages": "log", "attribution": "detailed_logs"}
+
+
+def compact_response(response_data, logs_url):
+    """The response with ``sections`` only once and the logs by reference.
+
+    ``generated_text`` (the sections again, as JSON text) is dropped, and the
+    page samples and attribution details are replaced by ``logs_url``, where
+    they can be fetched a page at a time, plus their counts.
+    """
+    dropped = {"generated_text", *LOG_KINDS.values()}
+    compact = {key: value for key, value in response_data.items() if key not in dropped}
+    compact["logs_url"] = logs_url
+    compact["log_counts"] = {kind: len(response_data[key]) for kind, key in LOG_KINDS.items()}
+    return compact
+
+
+def publish_icf(index, sections, generated_text, output_path=None, report=None):
+    """Attribution, rendering and storing: return ``(detailed_logs, download_url, logs_download_url)``.
+
+    With ``output_path`` the DOCX is saved there and not stored, so both URLs
+    are None. ``report(stage, progress)`` is called as each stage starts.
+    """
+    cancellation.check()
+    if report:
+        report("attribution", 0.7)
+    detailed_logs = build_detailed_logs(index, sections)
+
+    if report:
+        report("render", 0.85)
+    store_outputs = output_path is None
+    output_path, logs_path = render_icf(sections, detailed_logs, generated_text, output_path=output_path)
+
+    download_url = logs_download_url = None
+    if store_outputs:
+        with metrics.span("store"):
+            content_key = render_key(sections, detailed_logs, generated_text)
+            download_url, logs_download_url = store_icf(output_path, logs_path, content_key)
+    return detailed_logs, download_url, logs_download_url
+
+
+class PageSpool:
+    """Page texts written to a temporary file as they stream past, read back by page number.
+
+    ``per_section`` mode ranks every page before it knows which to send, so
+    the texts wait here rather than in memory; only the pages chosen for a
+    section are read back.
+    """
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        self._offsets = {}
+
+    def add(self, page):
+        data = page["text"].encode("utf-8")
+        self._file.seek(0, os.SEEK_END)
+        self._offsets[page["page"]] = (self._file.tell(), len(data))
+        self._file.write(data)
+
+    def __getitem__(self, number):
+        offset, length = self._offsets[number]
+        self._file.seek(offset)
+        return self._file.read(length).decode("utf-8")
+
+    def __iter__(self):
+        return iter(sorted(self._offsets))
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def spool_pages(pages):
+    """A ``PageSpool`` holding every page of ``pages``."""
+    spool = PageSpool()
+    try:
+        for page in pages:
+            spool.add(page)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+def track_pages(pages, index, layout_stats, recorder=None, emit=None):
+    """Yield ``pages`` on, indexing, recording and counting the layout stats of each as it is extracted."""
+    page_iter = iter(pages)
+    while True:
+        cancellation.check()
+        # Only time spent producing pages counts as extraction, not the chunking in between
+        with metrics.span("extraction"):
+            page = next(page_iter, None)
+        if page is None:
+            break
+        with metrics.span("indexing"):
+            index.add_page(page["page"], page["text"], summarize_page(page))
+        layout_stats.update(page.get("layout", {}))
+        if recorder:
+            recorder.add_page(page)
+        if emit:
+            emit("page", {"page": page["page"], "chars": len(page["text"])})
+        yield page
+
+
+def finish_response(index, generated_text, sections, detailed_logs, download_url, logs_download_url,
+                    layout_stats, timings, recorder=None, reused=None, incremental=None):
+    """Build the response once a run's spans are collected, finishing the recorded version if any."""
+    response_data = build_response_data(index, generated_text, sections, detailed_logs, download_url, logs_download_url)
+    if layout_stats:
+        response_data["extraction"] = dict(layout_stats)
+    if recorder:
+        response_data["protocol"] = recorder.finish(sections, reused, incremental)
+    if timings is not None:
+        response_data["timings"] = timings.as_dict()
+        logger.info(
+            "ICF pipeline finished: %s",
+            json.dumps({"pages": len(index), "sections": len(sections), "timings": response_data["timings"],
+                        "extraction": response_data.get("extraction")}),
+        )
+    return response_data
+
+
+def run_pipeline(pages, on_stage=None, emit=None, client=None, output_path=None, recorder=None):
+    """Run extraction, LLM, attribution and rendering stages over ``pages``.
+
+    ``pages`` is usually the lazy iterator from ``iter_pages``: each page is
+    indexed and handed to the chunker as it is extracted, so only the pages
+    of chunks waiting on the model are held in memory at once.
+
+    ``on_stage(stage, progress)`` is called as each stage starts so callers
+    such as the job queue can report progress. ``emit(event, data)`` receives
+    finer-grained events for streaming clients: ``stage``, ``page`` for each
+    extracted page, ``token`` for each piece of model output and ``section``
+    for each chunk's extracted sections. It may be called from worker threads.
+    ``client`` overrides the shared chat client, e.g. with a rate-limited one.
+    By default the DOCX goes to the artifact store and ``download_url`` points
+    at it; with ``output_path`` it is saved there instead and ``download_url``
+    is None.
+
+    ``ICF_EXTRACTION_MODE`` picks how sections are extracted: ``per_section``
+    (the default) reads every page, spooling the texts to disk (see
+    ``PageSpool``), then asks for each registered section in its own call
+    over the pages ranked best for it; ``chunked`` asks for all sections from
+    each chunk of pages as they stream in.
+
+    ``recorder`` (a ``protocols.ProtocolRecorder``) stores every page and the
+    generated sections, and the response gains a ``protocol`` summary. If the
+    protocol has a previous version, only pages changed since then plus the
+    source pages of sections they affect are sent to the model (in
+    ``per_section`` mode, only sections whose pages changed are re-extracted);
+    the other sections are carried over.
+
+    Layout-aware PDF pages add up to ``extraction``: characters before and
+    after layout cleanup, running header/footer characters dropped and tables
+    found (see ``layout.PdfLayout.page_text``).
+
+    Unless ``ICF_METRICS_ENABLED`` is off, the response includes ``timings``:
+    seconds per stage (see ``metrics.Timings``) plus ``total``.
+    """
+    def report(stage, progress):
+        if on_stage:
+            on_stage(stage, progress)
+        if emit:
+            emit("stage", {"stage": stage, "progress": progress})
+
+    on_token = on_section = None
+    if emit:
+        def on_token(chunk, text):
+            emit("token", {"chunk": chunk.index, "text": text})
+
+        def on_section(chunk, section):
+            emit("section", {"section": section.name, "chunk": chunk.index, **section.as_dict()})
+
+    # Built once while pages stream past, then used for attribution and logs
+    index = new_page_index()
+    layout_stats = Counter()
+
+    def tracked_pages():
+        yield from track_pages(pages, index, layout_stats, recorder, emit)
+        # Every page has been chunked; what remains is waiting on the model
+        report("llm", 0.5)
+
+    with metrics.collect() as timings:
+        report("extraction", 0.05)
+        previous = recorder.previous if recorder else None
+        reused = incremental = None
+        callbacks = {"on_token": on_token, "on_section": on_section, "client": client}
+        if getattr(settings, "ICF_EXTRACTION_MODE", "per_section") == "per_section":
+            # Ranking pages for a section needs all of them, so the protocol is read in full first
+            with spool_pages(tracked_pages()) as texts:
+                specs, reused, incremental = plan_sections(index, texts, previous)
+                generated_text, sections = generate_sections_per_section(
+                    index, texts, specs, reused=reused or (), **callbacks
+                )
+        elif previous is None:
+            generated_text, sections = generate_sections(tracked_pages(), **callbacks)
+        else:
+            # Diffing needs every page, so an amendment is read in full before the model sees any of it
+            reused, pages_to_send, _, incremental = previous.plan(list(tracked_pages()))
+            generated_text, sections = generate_sections_incremental(reused, pages_to_send, **callbacks)
+
+        detailed_logs, download_url, logs_download_url = publish_icf(
+            index, sections, generated_text, output_path=output_path, report=report
+        )
+
+    return finish_response(index, generated_text, sections, detailed_logs, download_url, logs_download_url,
+                           layout_stats, timings, recorder=recorder, reused=reused, incremental=incremental)
+
+
+# Async path, used by the async views under ASGI
+
+def read_and_plan(pages, index, layout_stats, recorder=None):
+    """Read every page, then plan the model calls: ``(tasks, max_in_flight, reused, incremental)``.
+
+    ``tasks`` are ``(chunk, build_prompt)`` pairs for ``extract_chunks``,
+    chosen as in ``run_pipeline`` for the ``ICF_EXTRACTION_MODE``.
+    """
+    tracked = track_pages(pages, index, layout_stats, recorder)
+    previous = recorder.previous if recorder else None
+    if getattr(settings, "ICF_EXTRACTION_MODE", "per_section") == "per_section":
+        with spool_pages(tracked) as texts:
+            specs, reused, incremental = plan_sections(index, texts, previous)
+            tasks = section_tasks(index, texts, specs)
+        return tasks, getattr(settings, "ICF_SECTION_MAX_IN_FLIGHT", 16), reused, incremental
+
+    all_pages = list(tracked)
+    reused = incremental = None
+    if previous is not None:
+        reused, all_pages, _, incremental = previous.plan(all_pages)
+    chunks = chunk_pages(
+        all_pages,
+        max_tokens=getattr(settings, "ICF_CHUNK_TOKENS", 3000),
+        overlap_pages=getattr(settings, "ICF_CHUNK_OVERLAP_PAGES", 1),
+    )
+    tasks = [(chunk, build_prompt) for chunk in chunks]
+    return tasks, getattr(settings, "ICF_LLM_MAX_IN_FLIGHT", 4), reused, incremental
+
+
+async def arun_pipeline(pages, output_path=None, recorder=None):
+    """Async ``run_pipeline``, returning the same response.
+
+    Reading pages, rendering and storing run on the bounded executor (see
+    ``executor``); the model calls are awaited on the running loop, so a
+    request waiting on the model holds no thread. Pages are read in full
+    before any call in both extraction modes.
+    """
+    index = new_page_index()
+    layout_stats = Counter()
+    with metrics.collect() as timings:
+        tasks, max_in_flight, reused, incremental = await offload(
+            read_and_plan, pages, index, layout_stats, recorder
+        )
+        fresh = await aextract_chunks(tasks, max_in_flight=max_in_flight)
+        generated_text, sections = finish_sections(merge_results([reused or (), fresh]))
+        detailed_logs, download_url, logs_download_url = await offload(
+            publish_icf, index, sections, generated_text, output_path=output_path
+        )
+
+    return await offload(finish_response, index, generated_text, sections, detailed_logs, download_url,
+                         logs_download_url, layout_stats, timings, recorder=recorder, reused=reused,
+                         incremental=incremental)
+
+
+async def aprocess_upload(file_obj, file_name, protocol_id=None, **kwargs):
+    """Async ``process_upload``: the same recording and reuse, with ``arun_pipeline``."""
+    if not getattr(settings, "ICF_PERSIST_PROTOCOLS", True):
+        # Hashing the upload for the page cache reads the whole file
+        pages = await offload(iter_pages, file_obj, file_name)
+        return await arun_pipeline(pages, **kwargs)
+
+    if not is_supported_file(file_name):
+        raise UnsupportedFileType("Unsupported file type")
+    recorder = await offload(ProtocolRecorder.start, file_obj, file_name, protocol_id)
+    try:
+        pages = await offload(iter_pages, file_obj, file_name, previous=recorder.previous)
+        return await arun_pipeline(pages, recorder=recorder, **kwargs)
+    except BaseException:
+        await offload(recorder.abort)
+        raise
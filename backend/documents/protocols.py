@@ -0,0 +1,275 @@
+"""Persistent protocol versions and incremental re-processing of amendments.
+
+Every processed upload is stored as a ``ProtocolVersion`` with its pages
+(text plus source and text hashes) and the generated sections with the pages
+they came from; an upload identical to a stored version reuses it instead.
+When an amendment of a stored protocol arrives, pages whose source hash is
+already known skip text extraction, sections whose source pages are all
+unchanged are carried over, and only the changed pages plus the source pages
+of affected sections go back to the model.
+
+Only the newest ``ICF_PROTOCOL_MAX_VERSIONS`` complete versions of a
+protocol are kept; ``manage.py prune_protocols`` also removes protocols
+untouched for ``ICF_PROTOCOL_RETENTION_DAYS`` and abandoned unfinished
+versions.
+"""
+import datetime
+import logging
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from django.utils import timezone
+from .cache import sha256_file, sha256_text
+from .models import Protocol, ProtocolVersion, Page, Section
+from .parsing import ExtractedSection
+
+logger = logging.getLogger(__name__)
+
+PAGE_BATCH_SIZE = 100
+
+
+class PreviousVersion:
+    """The last complete version of a protocol, loaded once for diffing against an amendment."""
+
+    def __init__(self, version):
+        self.version = version
+        self._text_by_source = {}
+        self.text_hashes = set()
+        for source_hash, text_hash, text in version.pages.values_list("source_hash", "text_hash", "text"):
+            if source_hash:
+                self._text_by_source[source_hash] = text
+            self.text_hashes.add(text_hash)
+        self.source_hashes = frozenset(self._text_by_source)
+        self.sections = list(version.sections.all())
+
+    def text_for_source(self, source_hash):
+        return self._text_by_source.get(source_hash)
+
+    def plan(self, pages):
+        """Split the work for ``pages`` (the amendment's page dicts, in order).
+
+        Returns ``(reused, pages_to_send, changed, stats)``: ``reused`` are the
+        carried-over sections as ``ExtractedSection`` objects with page numbers
+        remapped to the amendment, ``pages_to_send`` are the pages the model
+        still has to read and ``changed`` the numbers of the pages that are new
+        or edited.
+        """
+        page_hashes = {page["page"]: sha256_text(page["text"]) for page in pages}
+        reused, to_send, changed, stats = self.plan_hashes(page_hashes)
+        return reused, [page for page in pages if page["page"] in to_send], changed, stats
+
+    def plan_hashes(self, page_hashes):
+        """``plan`` from ``{page number: text hash}``, for callers not holding the page texts.
+
+        Returns the set of page numbers to send in place of ``pages_to_send``.
+        """
+        pages_by_hash = {}
+        for number, text_hash in page_hashes.items():
+            pages_by_hash.setdefault(text_hash, number)
+        changed = {number for number, text_hash in page_hashes.items() if text_hash not in self.text_hashes}
+
+        reused = []
+        to_send = set(changed)
+        for section in self.sections:
+            if section.source_hashes and all(h in pages_by_hash for h in section.source_hashes):
+                source_pages = sorted(pages_by_hash[h] for h in section.source_hashes)
+                reused.append(ExtractedSection(section.name, section.content, source_pages))
+            else:
+                # Re-read whatever is left of the section's sources along with the changes
+                to_send.update(pages_by_hash[h] for h in section.source_hashes if h in pages_by_hash)
+
+        stats = {
+            "previous_version": self.version.number,
+            "pages_changed": len(changed),
+            "pages_sent": len(to_send),
+        }
+        return reused, to_send, changed, stats
+
+
+class ProtocolRecorder:
+    """Records one upload as a new ``ProtocolVersion`` while the pipeline runs.
+
+    For an upload identical to a stored version, ``existing`` is set and
+    ``version`` is that version: it is diffed against itself and nothing is
+    written.
+    """
+
+    def __init__(self, version, previous, existing=False):
+        self.version = version
+        self.previous = previous
+        self.existing = existing
+        self.pages_reused = 0
+        self._batch = []
+        self._page_hashes = {}
+
+    @classmethod
+    def start(cls, file_obj, file_name, protocol_id=None):
+        """Open a new version of protocol ``protocol_id``.
+
+        An upload identical to a complete version (of that protocol, or of any
+        protocol without an id) reuses that version; anything else without an
+        id starts a new protocol. Raises ``Protocol.DoesNotExist`` for an
+        unknown id.
+        """
+        file_sha256 = sha256_file(file_obj)
+        identical = ProtocolVersion.objects.filter(file_sha256=file_sha256, status=ProtocolVersion.COMPLETE)
+        if protocol_id is not None:
+            Protocol.objects.get(pk=protocol_id)
+            identical = identical.filter(protocol_id=protocol_id)
+        match = identical.order_by("-created_at").first()
+        if match is not None:
+            return cls(match, PreviousVersion(match), existing=True)
+
+        for _ in range(3):
+            protocol = Protocol.objects.get(pk=protocol_id) if protocol_id is not None else None
+            latest = (protocol.versions.aggregate(number=Max("number"))["number"] or 0) if protocol else 0
+            try:
+                # Writes only: with SQLite, a transaction that reads first can't wait for another writer
+                with transaction.atomic():
+                    if protocol is None:
+                        protocol = Protocol.objects.create(title=file_name)
+                    version = ProtocolVersion.objects.create(
+                        protocol=protocol,
+                        number=latest + 1,
+                        file_name=file_name,
+                        file_sha256=file_sha256,
+                    )
+                break
+            except IntegrityError:
+                # Another upload of the same protocol took this version number
+                continue
+        else:
+            raise RuntimeError(f"Could not allocate a version of protocol {protocol_id}")
+
+        previous = protocol.latest_version()
+        return cls(version, PreviousVersion(previous) if previous else None)
+
+    def add_page(self, page):
+        if self.previous and page.get("source_hash") in self.previous.source_hashes:
+            self.pages_reused += 1
+        text_hash = sha256_text(page["text"])
+        self._page_hashes[page["page"]] = text_hash
+        if self.existing:
+            return
+        self._batch.append(Page(
+            version=self.version,
+            number=page["page"],
+            source_hash=page.get("source_hash", ""),
+            text_hash=text_hash,
+            text=page["text"],
+        ))
+        if len(self._batch) >= PAGE_BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self._batch:
+            Page.objects.bulk_create(self._batch)
+        self._batch = []
+
+    def finish(self, sections, reused=(), stats=None):
+        """Store ``sections`` and mark the version complete; return a summary for the response.
+
+        ``reused`` are the sections carried over from the previous version;
+        any the model added to since count as regenerated.
+        """
+        self._flush()
+        stats = stats or {}
+        carried = {section.name: section.content for section in reused or ()}
+        if self.existing:
+            unchanged = sum(1 for section in sections if carried.get(section.name) == section.content)
+            return {
+                **stats,
+                "id": self.version.protocol_id,
+                "version": self.version.number,
+                "existing_version": True,
+                "pages_reused": self.pages_reused,
+                "pages_changed": stats.get("pages_changed", 0),
+                "sections_reused": unchanged,
+                "sections_regenerated": len(sections) - unchanged,
+            }
+
+        previous_ids = {section.name: section.id for section in self.previous.sections} if self.previous else {}
+        # The previous version may have been pruned while this one ran
+        remaining = set(Section.objects.filter(pk__in=previous_ids.values()).values_list("pk", flat=True))
+        previous_ids = {name: pk for name, pk in previous_ids.items() if pk in remaining}
+        rows = []
+        for section in sections:
+            source_pages = [p for p in section.source_pages if p in self._page_hashes]
+            unchanged = carried.get(section.name) == section.content
+            rows.append(Section(
+                version=self.version,
+                name=section.name,
+                content=section.content,
+                source_pages=source_pages,
+                source_hashes=[self._page_hashes[p] for p in source_pages],
+                reused_from_id=previous_ids.get(section.name) if unchanged else None,
+            ))
+        sections_reused = sum(1 for row in rows if row.reused_from_id)
+
+        with transaction.atomic():
+            Section.objects.bulk_create(rows)
+            self.version.page_count = len(self._page_hashes)
+            self.version.pages_reused = self.pages_reused
+            self.version.pages_changed = stats.get("pages_changed", len(self._page_hashes))
+            self.version.sections_reused = sections_reused
+            self.version.sections_regenerated = len(rows) - sections_reused
+            self.version.status = ProtocolVersion.COMPLETE
+            self.version.save()
+        prune_versions(self.version.protocol_id, getattr(settings, "ICF_PROTOCOL_MAX_VERSIONS", 10))
+
+        return {
+            **stats,
+            "id": self.version.protocol_id,
+            "version": self.version.number,
+            "pages_reused": self.version.pages_reused,
+            "pages_changed": self.version.pages_changed,
+            "sections_reused": self.version.sections_reused,
+            "sections_regenerated": self.version.sections_regenerated,
+        }
+
+    def abort(self):
+        """Drop the unfinished version (and its pages) after a failure."""
+        if self.existing:
+            return
+        try:
+            self.version.delete()
+        except Exception:
+            logger.exception("Could not remove unfinished protocol version %s", self.version.pk)
+
+
+def prune_versions(protocol_id, keep):
+    """Delete all but the newest ``keep`` complete versions of a protocol (0 keeps all); return how many."""
+    if keep <= 0:
+        return 0
+    old = list(
+        ProtocolVersion.objects.filter(protocol_id=protocol_id, status=ProtocolVersion.COMPLETE)
+        .order_by("-number").values_list("pk", flat=True)[keep:]
+    )
+    if old:
+        ProtocolVersion.objects.filter(pk__in=old).delete()
+    return len(old)
+
+
+def prune(keep=10, retention_days=0, stale_hours=24):
+    """Apply the retention rules to every stored protocol; return counts of what was deleted.
+
+    Keeps the newest ``keep`` complete versions of each protocol, deletes
+    protocols with no version created in the last ``retention_days`` days
+    (0 keeps them) and unfinished versions older than ``stale_hours``, which
+    were left by a crashed process.
+    """
+    now = timezone.now()
+    counts = {"protocols": 0, "versions": 0, "stale_versions": 0}
+    if retention_days > 0:
+        cutoff = now - datetime.timedelta(days=retention_days)
+        expired = Protocol.objects.exclude(versions__created_at__gte=cutoff)
+        counts["protocols"] = expired.count()
+        expired.delete()
+    for protocol_id in Protocol.objects.values_list("pk", flat=True):
+        counts["versions"] += prune_versions(protocol_id, keep)
+    stale = ProtocolVersion.objects.filter(
+        status=ProtocolVersion.PROCESSING, created_at__lt=now - datetime.timedelta(hours=stale_hours)
+    )
+    counts["stale_versions"] = stale.count()
+    stale.delete()
+    return counts
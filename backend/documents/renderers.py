@@ -0,0 +1,27 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from .serialization import dumps
+from .streaming import sse_event
+
+
+class FastJSONRenderer(JSONRenderer):
+    """``JSONRenderer`` through ``serialization.dumps`` (orjson when installed); ``?indent`` is still honoured."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets clients send ``Accept: text/event-stream``; plain responses become one SSE event."""
+
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = renderer_context.get("response") if renderer_context else None
+        event = "error" if response is not None and response.status_code >= 400 else "message"
+        return sse_event(event, data).encode(self.charset)
@@ -0,0 +1,238 @@
+"""Template-based ICF rendering.
+
+The pre-styled ICF template is read once per process: every package part is
+kept in memory and ``word/document.xml`` is split at insertion points (after
+the title, after each section heading, before the signature block and before
+the final section properties). Rendering then joins the template pieces with
+WordprocessingML fragments built as strings and writes the package back out,
+with no python-docx object model or style lookups per paragraph.
+"""
+import hashlib
+import os
+import re
+import threading
+import zipfile
+from xml.sax.saxutils import escape
+from django.conf import settings
+from lxml import etree
+from .cache import sha256_text
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+W = f"{{{W_NS}}}"
+DOCUMENT_PART = "word/document.xml"
+DEFAULT_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "ICF-template.docx")
+
+# Paragraph style ids used for generated content, with Normal as the fallback
+STYLE_IDS = {
+    "heading2": "Heading2",
+    "heading3": "Heading3",
+    "body": "ICFBodyText",
+    "list": "ListParagraph",
+    "quote": "BlockText",
+}
+
+LOG_MODES = ("inline", "appendix", "omit")
+
+SLOT_RE = re.compile(r"<\?icf-slot ([^?]+)\?>")
+# Characters XML 1.0 can't carry; PDF text sometimes contains form feeds and the like
+INVALID_XML_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+def heading_key(text):
+    return " ".join(text.lower().split()).rstrip(": ")
+
+
+def _text(paragraph):
+    return "".join(node.text or "" for node in paragraph.iter(f"{W}t"))
+
+
+def _style(paragraph):
+    style = paragraph.find(f"{W}pPr/{W}pStyle")
+    return style.get(f"{W}val") if style is not None else None
+
+
+class ICFTemplate:
+    def __init__(self, path):
+        with zipfile.ZipFile(path) as package:
+            self.parts = [(info, package.read(info.filename)) for info in package.infolist()]
+        self.fingerprint = sha256_text(*(f"{info.filename}:{hashlib.sha256(data).hexdigest()}" for info, data in self.parts))
+        parts = {info.filename: data for info, data in self.parts}
+
+        styles = etree.fromstring(parts["word/styles.xml"])
+        available = {style.get(f"{W}styleId") for style in styles.iter(f"{W}style")}
+        self.style_ids = {role: sid if sid in available else "Normal" for role, sid in STYLE_IDS.items()}
+
+        root = etree.fromstring(parts[DOCUMENT_PART])
+        body = root.find(f"{W}body")
+        self.headings = []
+        title_done = False
+        for element in list(body):
+            if element.tag != f"{W}p":
+                continue
+            style = _style(element)
+            if style == "Heading1" and not title_done:
+                element.addnext(etree.ProcessingInstruction("icf-slot", "title"))
+                title_done = True
+            elif style == "Heading2":
+                key = heading_key(_text(element))
+                if key.startswith("signature"):
+                    element.addprevious(etree.ProcessingInstruction("icf-slot", "extra"))
+                element.addnext(etree.ProcessingInstruction("icf-slot", key))
+                self.headings.append(key)
+        body.find(f"{W}sectPr").addprevious(etree.ProcessingInstruction("icf-slot", "end"))
+
+        xml = etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True).decode("utf-8")
+        if "<?icf-slot extra?>" not in xml:
+            xml = xml.replace("<?icf-slot end?>", "<?icf-slot extra?><?icf-slot end?>")
+        # Alternating literal XML and slot names: [xml, slot, xml, slot, ..., xml]
+        self.pieces = SLOT_RE.split(xml)
+
+        # An appendix reuses the package with only the generated body and section properties
+        body_open = xml.index(">", xml.index("<w:body")) + 1
+        end_slot = xml.index("<?icf-slot end?>")
+        self.appendix_head = xml[:body_open]
+        self.appendix_tail = SLOT_RE.sub("", xml[end_slot:])
+
+    def has_slot(self, key):
+        return key in self.headings
+
+    def document_xml(self, fills):
+        """Template ``document.xml`` with ``fills[slot]`` (lists of XML strings) spliced in."""
+        out = []
+        for i, piece in enumerate(self.pieces):
+            if i % 2:
+                out.extend(fills.get(piece, ()))
+            else:
+                out.append(piece)
+        return "".join(out)
+
+    def appendix_xml(self, fragments):
+        return "".join([self.appendix_head, *fragments, self.appendix_tail])
+
+    def write(self, path, document_xml):
+        data = document_xml.encode("utf-8")
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as package:
+            for info, original in self.parts:
+                package.writestr(info, data if info.filename == DOCUMENT_PART else original)
+        return path
+
+
+class Fragments:
+    """Builds WordprocessingML paragraph strings with the template's style ids."""
+
+    def __init__(self, style_ids):
+        self.style_ids = style_ids
+
+    def paragraph(self, text="", role="body"):
+        text = INVALID_XML_RE.sub("", text)
+        style = self.style_ids[role]
+        if not text:
+            return f'<w:p><w:pPr><w:pStyle w:val="{style}"/></w:pPr></w:p>'
+        return (
+            f'<w:p><w:pPr><w:pStyle w:val="{style}"/></w:pPr>'
+            f'<w:r><w:t xml:space="preserve">{escape(text)}</w:t></w:r></w:p>'
+        )
+
+    def paragraphs(self, text, role="body"):
+        """One paragraph per non-empty line of ``text``."""
+        return [self.paragraph(line, role) for line in text.splitlines() if line.strip()]
+
+    def heading(self, text, level=2):
+        return self.paragraph(text, "heading2" if level == 2 else "heading3")
+
+    def bullet(self, text):
+        return self.paragraph(f"• {text}", "list")
+
+
+def log_fragments(frag, detailed_logs):
+    """The "Processing Logs" block: which pages fed each section, with samples."""
+    out = [
+        frag.heading("Processing Logs"),
+        frag.paragraph("The following logs show the page numbers and content used to generate each section:"),
+    ]
+    for log_entry in detailed_logs:
+        if log_entry["type"] == "extraction":
+            out += [
+                frag.heading(f"Page {log_entry['page']} - Text Extraction", level=3),
+                frag.paragraph(f"Content Length: {log_entry['content_length']} characters"),
+                frag.paragraph(log_entry["content_preview"], "quote"),
+            ]
+        elif log_entry["type"] == "section_generation":
+            out += [
+                frag.heading(f"Section: {log_entry['section']}", level=3),
+                frag.paragraph(f"Content Length: {log_entry['content_length']} characters"),
+            ]
+            if log_entry.get("contributing_pages"):
+                out.append(frag.paragraph("Source Pages Used:"))
+                for page_info in log_entry["contributing_pages"]:
+                    out += [
+                        frag.bullet(f"Page {page_info['page']} (relevance: {page_info['relevance_score']})"),
+                        frag.paragraph(f"Content sample: {page_info['content_sample']}", "quote"),
+                    ]
+            out += [frag.paragraph("Generated Content:"), frag.paragraph(log_entry["content_preview"], "quote")]
+        elif log_entry["type"] == "document_generation":
+            out += [
+                frag.heading("Document Generation Summary", level=3),
+                frag.paragraph(f"Sections Generated: {log_entry['sections_count']}"),
+                frag.paragraph(f"Pages Processed: {log_entry['total_pages_processed']}"),
+            ]
+    return out
+
+
+def appendix_path(output_path):
+    root, ext = os.path.splitext(output_path)
+    return f"{root}_logs{ext or '.docx'}"
+
+
+def render_document(template, output_path, sections, detailed_logs, generated_text,
+                    generated_on, logs="inline", headings=None):
+    """Write the ICF for ``sections`` (``ExtractedSection`` objects) to ``output_path``.
+
+    ``headings`` maps section names to the template heading each one fills
+    (see ``SectionRegistry.headings``); a section whose heading isn't in the
+    template is added before the signatures under its own name. Returns the
+    appendix path when ``logs="appendix"``, else None.
+    """
+    if logs not in LOG_MODES:
+        raise ValueError(f"logs must be one of {LOG_MODES}, not {logs!r}")
+    frag = Fragments(template.style_ids)
+    fills = {"title": [frag.paragraph(f"Generated from Clinical Trial Protocol on {generated_on}")]}
+
+    if sections:
+        for section in sections:
+            key = heading_key((headings or {}).get(section.name, section.name))
+            if template.has_slot(key):
+                fills.setdefault(key, []).extend(frag.paragraphs(section.content))
+            else:
+                fills.setdefault("extra", []).extend([frag.heading(section.name), *frag.paragraphs(section.content)])
+    else:
+        fills["extra"] = [
+            frag.heading("Protocol Information"),
+            frag.paragraph("No structured information could be extracted from the protocol document."),
+            frag.paragraph("Original response:"),
+            *frag.paragraphs(generated_text),
+        ]
+
+    logs_path = None
+    if detailed_logs and logs == "inline":
+        fills["end"] = log_fragments(frag, detailed_logs)
+    elif detailed_logs and logs == "appendix":
+        logs_path = appendix_path(output_path)
+        heading = frag.paragraph(f"ICF Processing Logs - generated on {generated_on}", "heading2")
+        template.write(logs_path, template.appendix_xml([heading, *log_fragments(frag, detailed_logs)]))
+
+    template.write(output_path, template.document_xml(fills))
+    return logs_path
+
+
+_template = None
+_template_lock = threading.Lock()
+
+
+def get_template():
+    """Return the parsed ICF template (``ICF_TEMPLATE_PATH``), loaded on first use and kept."""
+    global _template
+    with _template_lock:
+        if _template is None:
+            _template = ICFTemplate(getattr(settings, "ICF_TEMPLATE_PATH", DEFAULT_TEMPLATE))
+        return _template
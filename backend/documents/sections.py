@@ -0,0 +1,146 @@
+"""Registry of the ICF sections to extract.
+
+Sections are defined in a JSON file (``ICF_SECTIONS_PATH``, by default
+``documents/sections.json``) as a list of objects with:
+
+- ``name``: the key the model answers under and the section's title
+- ``prompt``: what the section should contain, shown to the model
+- ``keywords``: terms used to rank pages for the section, by BM25 or
+  together with the name, heading and prompt as a TF-IDF query (see
+  ``SectionSpec.query``)
+- ``max_chars``: the longest the section may be (default 4000)
+- ``heading`` (optional): the template heading the section fills; sections
+  without one are added before the signature block
+
+The registry builds the extraction prompt for any subset of its sections and
+applies each section's length limit to what comes back.
+"""
+import json
+import re
+import threading
+from dataclasses import dataclass
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from .parsing import ExtractedSection
+
+DEFAULT_MAX_CHARS = 4000
+SENTENCE_END_RE = re.compile(r"[.!?](?=\s|$)")
+
+
+@dataclass(frozen=True)
+class SectionSpec:
+    name: str
+    prompt: str
+    keywords: tuple
+    max_chars: int = DEFAULT_MAX_CHARS
+    heading: str = ""
+
+    @property
+    def query(self):
+        """Text pages are compared with when ranked by vectors; the keywords count twice."""
+        return " ".join([self.name, self.heading, self.prompt, *self.keywords, *self.keywords])
+
+
+def truncate(text, max_chars):
+    """``text`` cut to ``max_chars``, at the last sentence end if there is one in the second half."""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    ends = [match.end() for match in SENTENCE_END_RE.finditer(cut)]
+    if ends and ends[-1] > max_chars // 2:
+        return cut[:ends[-1]]
+    return cut.rstrip() + "…"
+
+
+class SectionRegistry:
+    def __init__(self, specs):
+        self.specs = list(specs)
+        self._by_name = {spec.name: spec for spec in self.specs}
+        if not self.specs:
+            raise ImproperlyConfigured("The section registry defines no sections")
+        if len(self._by_name) != len(self.specs):
+            raise ImproperlyConfigured("Section names in the registry must be unique")
+
+    @classmethod
+    def from_file(cls, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                entries = json.load(f)["sections"]
+            return cls(
+                SectionSpec(
+                    name=entry["name"],
+                    prompt=entry["prompt"],
+                    keywords=tuple(entry.get("keywords", ())),
+                    max_chars=int(entry.get("max_chars", DEFAULT_MAX_CHARS)),
+                    heading=entry.get("heading", ""),
+                )
+                for entry in entries
+            )
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            raise ImproperlyConfigured(f"Invalid section registry {path}: {e!r}")
+
+    def __iter__(self):
+        return iter(self.specs)
+
+    def __len__(self):
+        return len(self.specs)
+
+    def get(self, name):
+        return self._by_name.get(name)
+
+    def keywords(self):
+        return {spec.name: spec.keywords for spec in self.specs}
+
+    def headings(self):
+        return {spec.name: spec.heading for spec in self.specs if spec.heading}
+
+    def build_prompt(self, chunk_text, first_page, last_page, specs=None):
+        """Prompt asking for ``specs`` (default: every section) from one chunk of the protocol."""
+        specs = self.specs if specs is None else specs
+        descriptions = "\n".join(
+            f"- {spec.name}: {spec.prompt} (at most {spec.max_chars} characters)" for spec in specs
+        )
+        return_format = ",\n".join(
+            f'    "{spec.name}": {{\n        "content": "extracted content here",\n        "source_pages": [1, 2]\n    }}'
+            for spec in specs
+        )
+        return f"""
+Extract the following sections from the clinical trial protocol and return a JSON object with section names as keys and extracted content as values.
+
+For each section, also indicate which page numbers from the document were used to generate that content.
+Each page of the text starts with a [Page N] marker; only cite page numbers that appear in the text.
+Omit any section that this part of the protocol does not cover.
+
+Sections:
+{descriptions}
+
+Return format:
+{{
+{return_format}
+}}
+
+Text to analyze (pages {first_page}-{last_page}):
+{chunk_text}
+"""
+
+    def apply_limits(self, sections):
+        """Registry sections in registry order, each cut to its ``max_chars``, then any others as they came."""
+        known = {section.name: section for section in sections if section.name in self._by_name}
+        limited = [
+            ExtractedSection(spec.name, truncate(known[spec.name].content, spec.max_chars), known[spec.name].source_pages)
+            for spec in self.specs if spec.name in known
+        ]
+        return limited + [section for section in sections if section.name not in self._by_name]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the section registry from ``ICF_SECTIONS_PATH``, loaded on first use."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = SectionRegistry.from_file(settings.ICF_SECTIONS_PATH)
+        return _registry
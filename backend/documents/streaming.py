@@ -0,0 +1,66 @@
+"""Server-sent events for streaming pipeline progress to the browser."""
+import queue
+import threading
+import logging
+from django.db import close_old_connections
+from .cancellation import Cancelled, cancellable
+from .serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = 15
+_DONE = object()
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+
+def stream_pipeline(run):
+    """Run ``run(emit)`` on a background thread and yield its events as SSE text.
+
+    ``run`` receives an ``emit(event, data)`` callback and returns the final
+    payload, which is sent as a ``done`` event; an exception is sent as an
+    ``error`` event. A ``start`` event goes out immediately so the client sees
+    the first byte before any extraction happens, and comment lines keep idle
+    connections open through proxies while the model is thinking.
+
+    Closing the generator, as the server does when the client disconnects,
+    cancels the run: it stops at its next page or model call, or mid-reply
+    with the stream to the model closed, instead of spending tokens nobody
+    will read.
+    """
+    events = queue.Queue()
+    cancelled = threading.Event()
+
+    def emit(event, data):
+        events.put((event, data))
+
+    def worker():
+        try:
+            with cancellable(cancelled):
+                events.put(("done", run(emit)))
+        except Cancelled:
+            logger.info("Streaming client went away; pipeline cancelled")
+        except Exception as e:
+            logger.exception("Streaming pipeline failed")
+            events.put(("error", {"error": str(e)}))
+        finally:
+            close_old_connections()
+            events.put(_DONE)
+
+    threading.Thread(target=worker, name="icf-stream", daemon=True).start()
+
+    try:
+        yield sse_event("start", {})
+        while True:
+            try:
+                item = events.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            if item is _DONE:
+                return
+            yield sse_event(*item)
+    finally:
+        cancelled.set()
@@ -1,7 +1,22 @@
+from django.conf import settings
 from django.urls import path
-from .views import GenerateICFView, DownloadICF
+from .views import (
+    GenerateICFView, GenerateICFStreamView, DownloadICF, SubmitICFJobView, BatchICFJobView, JobStatusView, JobLogsView,
+    AsyncGenerateICFView, AsyncDownloadICF,
+)
+
+# Under an ASGI server the async views keep requests waiting on the model off threads
+if getattr(settings, "ICF_ASYNC_VIEWS", False):
+    generate_view, download_view = AsyncGenerateICFView.as_view(), AsyncDownloadICF.as_view()
+else:
+    generate_view, download_view = GenerateICFView.as_view(), DownloadICF.as_view()
 
 urlpatterns = [
-    path("generate_icf/", GenerateICFView.as_view(), name="generate-icf"),
-    path("download_icf/", DownloadICF.as_view(), name="download-icf"),
-]
\ No newline at end of file
+    path("generate_icf/", generate_view, name="generate-icf"),
+    path("generate_icf/stream/", GenerateICFStreamView.as_view(), name="generate-icf-stream"),
+    path("download_icf/", download_view, name="download-icf"),
+    path("jobs/", SubmitICFJobView.as_view(), name="submit-icf-job"),
+    path("batch/", BatchICFJobView.as_view(), name="submit-icf-batch"),
+    path("jobs/<str:job_id>/", JobStatusView.as_view(), name="icf-job-status"),
+    path("jobs/<str:job_id>/logs/", JobLogsView.as_view(), name="icf-job-logs"),
+]
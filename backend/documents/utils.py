@@ -1,22 +1,254 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 import fitz
-import docx
+from .cache import sha256_text
+from .docx_pages import iter_docx_page_texts
+from .layout import PdfLayout
 
-def extract_text_from_pdf(file_obj):
+
+class ExtractionError(Exception):
+    pass
+
+
+def _opened_path(file_obj):
+    """The path ``file_obj`` was opened from, if it is a file opened on disk, else None.
+
+    Only the ``name`` of a real open file is trusted, and only if it still
+    names that same file: an upload's ``name`` is whatever the client sent.
+    """
+    if not isinstance(file_obj, io.BufferedReader) or not isinstance(file_obj.name, str):
+        return None
+    try:
+        if os.path.samestat(os.stat(file_obj.name), os.fstat(file_obj.fileno())):
+            return file_obj.name
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+@contextmanager
+def spooled_path(file_obj, suffix=""):
+    """Yield a filesystem path holding the contents of ``file_obj``.
+
+    Large Django uploads already live in a temp file and files opened from
+    disk have a real path, so those are used directly; anything else is
+    copied to a temp file in chunks, which is removed afterwards.
+    """
+    if hasattr(file_obj, "temporary_file_path"):
+        yield file_obj.temporary_file_path()
+        return
+    path = _opened_path(file_obj)
+    if path is not None:
+        yield path
+        return
+
+    spool = tempfile.NamedTemporaryFile(delete=False, suffix=suffix, prefix="icf_spool_")
+    try:
+        with spool:
+            if hasattr(file_obj, "chunks"):
+                for chunk in file_obj.chunks():
+                    spool.write(chunk)
+            else:
+                file_obj.seek(0)
+                shutil.copyfileobj(file_obj, spool)
+        yield spool.name
+    finally:
+        os.unlink(spool.name)
+
+
+def pdf_page_source_hash(page, salt=""):
+    """Hash what a PDF page is drawn from, without extracting its text.
+
+    Covers the content stream, the fonts it uses (subset tags such as
+    ``ABCDEF+`` differ between exports and are dropped), its form XObjects and
+    its geometry. Pages with the same hash extract to the same text, so an
+    amended protocol only needs text extraction for pages whose hash is new.
+    ``salt`` (e.g. a ``PdfLayout.fingerprint``) covers how the text is extracted.
+    """
+    fonts = sorted(
+        f"{basefont.split('+', 1)[-1]}/{name}/{encoding}"
+        for _, _, _, basefont, name, encoding, *_ in page.get_fonts()
+    )
+    xobjects = [page.parent.xref_stream_raw(xref) or b"" for xref, *_ in page.get_xobjects()]
+    digest = hashlib.sha256(page.read_contents())
+    for part in [*fonts, *(hashlib.sha256(x).hexdigest() for x in xobjects), str(tuple(page.rect)), str(page.rotation), salt]:
+        digest.update(b"\0" + part.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _pdf_page(pdf, i, skip_hashes, layout=None):
+    page = pdf.load_page(i)
+    source_hash = pdf_page_source_hash(page, layout.fingerprint if layout else "")
+    result = {"page": i + 1, "text": None, "source_hash": source_hash}
+    # Known pages come back without text; the caller already has it
+    if source_hash in skip_hashes:
+        return result
+    if layout is None:
+        result["text"] = page.get_text()
+    else:
+        result["text"], result["layout"] = layout.page_text(page)
+    return result
+
+
+def _extract_pdf_range(path, first, last, skip_hashes=frozenset(), layout=None):
+    """Extract pages ``first``..``last`` (0-based, exclusive end) in a worker process."""
+    pdf = fitz.open(path, filetype="pdf")
     try:
-        pdf = fitz.open(stream=file_obj.read(), filetype="pdf")
-        pages = []
-        for i, page in enumerate(pdf, start=1):
-            text = page.get_text()
-            pages.append({"page": i, "text": text})
+        return [_pdf_page(pdf, i, skip_hashes, layout) for i in range(first, last)]
+    finally:
         pdf.close()
-        return pages
-    except Exception as e:
-        raise Exception(f"Failed to extract text from PDF: {str(e)}")
 
-def extract_text_from_docx(file_obj):
+
+_process_pool = None
+_process_pool_workers = 0
+_process_pool_lock = threading.Lock()
+
+
+def available_cpus():
+    """CPUs this process may run on, which in a container can be fewer than ``os.cpu_count()``."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+def get_process_pool(workers):
+    """Return a shared process pool, created on first use and kept for later uploads.
+
+    Workers are spawned rather than forked because the server process runs
+    request and job threads that must not be copied mid-operation.
+    """
+    global _process_pool, _process_pool_workers
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool_workers != workers:
+            if _process_pool is not None:
+                _process_pool.shutdown(wait=False)
+            _process_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _process_pool_workers = workers
+        return _process_pool
+
+
+def discard_process_pool(pool):
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_pdf_pages(file_obj, start=1, workers=1, parallel_min_pages=100, batch_pages=16, skip_hashes=frozenset(),
+                   layout=False, margin=0.12, tables=False):
+    """Yield ``{"page", "text", "source_hash"}`` dicts one page at a time, beginning at page ``start``.
+
+    The document is opened by path so PyMuPDF pages it in from disk instead of
+    holding the whole upload in memory.
+
+    With ``workers`` > 1 and at least ``parallel_min_pages`` pages to read,
+    ranges of ``batch_pages`` pages are extracted in a process pool, each worker
+    opening the file independently. Pages are still yielded in order, and only
+    a couple of ranges per worker are in flight at a time. ``workers`` is
+    capped at the available CPUs, so a single-CPU host always reads serially
+    rather than paying for a pool it can't run in parallel.
+
+    Pages whose ``source_hash`` (see ``pdf_page_source_hash``) is in
+    ``skip_hashes`` are yielded with ``text`` set to None instead of being
+    extracted.
+
+    With ``layout``, text comes from ``layout.PdfLayout``: running headers and
+    footers found in the top and bottom ``margin`` of the page are dropped,
+    whitespace is collapsed and, with ``tables``, ruled tables are written one
+    row per line. Each page then also has ``layout`` stats (see
+    ``PdfLayout.page_text``).
+    """
+    with spooled_path(file_obj, suffix=".pdf") as path:
+        try:
+            pdf = fitz.open(path, filetype="pdf")
+        except Exception as e:
+            raise ExtractionError(f"Failed to extract text from PDF: {str(e)}")
+        try:
+            try:
+                page_layout = PdfLayout.detect(pdf, margin=margin, tables=tables) if layout else None
+            except Exception as e:
+                raise ExtractionError(f"Failed to extract text from PDF: {str(e)}")
+            workers = min(workers, available_cpus())
+            if workers > 1 and pdf.page_count - start + 1 >= parallel_min_pages:
+                yield from _iter_pdf_pages_parallel(path, start, pdf.page_count, workers, batch_pages,
+                                                    frozenset(skip_hashes), page_layout)
+                return
+            for i in range(start - 1, pdf.page_count):
+                try:
+                    page = _pdf_page(pdf, i, skip_hashes, page_layout)
+                except Exception as e:
+                    raise ExtractionError(f"Failed to extract text from PDF: {str(e)}")
+                yield page
+        finally:
+            pdf.close()
+
+
+def _iter_pdf_pages_parallel(path, start, page_count, workers, batch_pages, skip_hashes, layout=None):
+    pool = get_process_pool(workers)
+    ranges = iter([(first, min(first + batch_pages, page_count)) for first in range(start - 1, page_count, batch_pages)])
+    pending = deque()
     try:
-        doc = docx.Document(file_obj)
-        text = "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
-        return [{"page": 1, "text": text}]  # Treat as single page
-    except Exception as e:
-        raise Exception(f"Failed to extract text from DOCX: {str(e)}")
+        for first, last in ranges:
+            pending.append(pool.submit(_extract_pdf_range, path, first, last, skip_hashes, layout))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            try:
+                pages = pending.popleft().result()
+            except BrokenProcessPool as e:
+                # A dead worker poisons the pool; let the next upload start a fresh one
+                discard_process_pool(pool)
+                raise ExtractionError(f"Failed to extract text from PDF: {str(e)}")
+            except Exception as e:
+                raise ExtractionError(f"Failed to extract text from PDF: {str(e)}")
+            # Keep the pool busy while the caller consumes this range
+            next_range = next(ranges, None)
+            if next_range:
+                pending.append(pool.submit(_extract_pdf_range, path, *next_range, skip_hashes, layout))
+            yield from pages
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def iter_docx_pages(file_obj, start=1, skip_hashes=frozenset(), max_chars=3000):
+    """Yield ``{"page", "text", "source_hash"}`` dicts for the logical pages of a DOCX, beginning at ``start``.
+
+    The body is streamed and split at page and section breaks, at headings
+    and at about ``max_chars`` characters (see ``docx_pages``). Tables are
+    kept, one row per line.
+    """
+    # Pages have to be read to find where the next one starts, so there is nothing to skip
+    with spooled_path(file_obj, suffix=".docx") as path:
+        texts = iter_docx_page_texts(path, max_chars)
+        number = 0
+        while True:
+            try:
+                text = next(texts, None)
+            except Exception as e:
+                raise ExtractionError(f"Failed to extract text from DOCX: {str(e)}")
+            if text is None:
+                break
+            number += 1
+            if number >= start:
+                yield {"page": number, "text": text, "source_hash": sha256_text(text)}
+        if number == 0 and start <= 1:
+            yield {"page": 1, "text": "", "source_hash": sha256_text("")}  # An empty document is one blank page
+
+
+def extract_text_from_pdf(file_obj):
+    return list(iter_pdf_pages(file_obj))
+
+
+def extract_text_from_docx(file_obj):
+    return list(iter_docx_pages(file_obj))
@@ -0,0 +1,170 @@
+"""Hashed TF-IDF page vectors for ranking pages against sections, offline.
+
+Each page becomes a row of a ``(pages, dim)`` float32 matrix of hashed,
+signed features: stemmed words, word bigrams and character 4-grams of each
+word, so "risks", "risky" and "at risk of" share features with a "Risks"
+query even when the exact keyword never appears. Counts are damped with
+``log1p`` and weighted by IDF at query time.
+
+All sections are ranked in one matrix product: cosine similarity between
+the section queries and every page, with pivoted length normalization so a
+short page (a title page saying "study") doesn't outrank a long page about
+the section just because its vector is short; pages much shorter than
+average are scaled down further. Past ``mmap_pages`` pages the
+matrix moves to an unlinked temporary file, so very long protocols don't
+hold it all in RAM.
+"""
+import tempfile
+import zlib
+from collections import Counter
+import numpy as np
+from .index import TOKEN_RE, stem
+
+NGRAM = 4
+
+
+def _bucket(feature, dim):
+    h = zlib.crc32(feature.encode())
+    # Low bits pick the bucket, the top bit the sign, so collisions tend to cancel out
+    return h % dim, -1.0 if h & 0x80000000 else 1.0
+
+
+class PageVectors:
+    def __init__(self, dim=8192, char_weight=1.0, pivot_slope=0.75, mmap_pages=2000, short_page_share=0.5):
+        self.dim = dim
+        self.char_weight = char_weight
+        self.pivot_slope = pivot_slope
+        self.mmap_pages = mmap_pages
+        self.short_page_share = short_page_share
+        self.page_numbers = []
+        self._lengths = []
+        self._rows = np.zeros((0, dim), dtype=np.float32)
+        self._file = None
+        self._df = np.zeros(dim, dtype=np.int32)
+        self._token_features = {}
+        self._bigram_features = {}
+        self._norms = None
+
+    def __len__(self):
+        return len(self.page_numbers)
+
+    @property
+    def mmapped(self):
+        return self._file is not None
+
+    def _features(self, token):
+        """``(buckets, weights)`` of one word: its stem plus its character n-grams, shared among them."""
+        features = self._token_features.get(token)
+        if features is None:
+            buckets, weights = [], []
+            bucket, sign = _bucket("w:" + stem(token), self.dim)
+            buckets.append(bucket)
+            weights.append(sign)
+            padded = f"<{token}>"
+            grams = [padded[i:i + NGRAM] for i in range(len(padded) - NGRAM + 1)]
+            for gram in grams:
+                bucket, sign = _bucket("c:" + gram, self.dim)
+                buckets.append(bucket)
+                weights.append(sign * self.char_weight / len(grams))
+            features = self._token_features[token] = (
+                np.array(buckets, dtype=np.intp), np.array(weights, dtype=np.float32)
+            )
+        return features
+
+    def vectorize(self, tokens, counts=None):
+        """The damped, unweighted feature vector of a token sequence."""
+        counts = counts if counts is not None else Counter(tokens)
+        buckets, weights = [], []
+        for token, count in counts.items():
+            token_buckets, token_weights = self._features(token)
+            buckets.append(token_buckets)
+            weights.append(token_weights * count)
+        bigram_features = self._bigram_features
+        for pair, count in Counter(zip(tokens, tokens[1:])).items():
+            feature = bigram_features.get(pair)
+            if feature is None:
+                feature = bigram_features[pair] = _bucket(f"b:{stem(pair[0])} {stem(pair[1])}", self.dim)
+            buckets.append(np.array([feature[0]], dtype=np.intp))
+            weights.append(np.array([feature[1] * count], dtype=np.float32))
+        if not buckets:
+            return np.zeros(self.dim, dtype=np.float32)
+        row = np.bincount(np.concatenate(buckets), weights=np.concatenate(weights), minlength=self.dim)
+        return (np.sign(row) * np.log1p(np.abs(row))).astype(np.float32)
+
+    def _grow(self, needed):
+        capacity = max(64, 2 * self._rows.shape[0], needed)
+        used = len(self.page_numbers)
+        if self.mmap_pages and capacity > self.mmap_pages:
+            file = tempfile.TemporaryFile(prefix="icf_vectors_")
+            file.truncate(capacity * self.dim * 4)
+            rows = np.memmap(file, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        else:
+            file = None
+            rows = np.zeros((capacity, self.dim), dtype=np.float32)
+        rows[:used] = self._rows[:used]
+        if self._file is not None:
+            self._file.close()
+        self._rows, self._file = rows, file
+
+    def add_page(self, page_number, tokens, counts=None):
+        """Add a page's row from its lowercased ``tokens`` (``counts`` if already counted)."""
+        row = self.vectorize(tokens, counts)
+        used = len(self.page_numbers)
+        if used == self._rows.shape[0]:
+            self._grow(used + 1)
+        self._rows[used] = row
+        self._df += row != 0
+        self.page_numbers.append(page_number)
+        self._lengths.append(len(tokens))
+        self._norms = None
+
+    def _idf_squared(self):
+        n = len(self.page_numbers)
+        idf = np.log((1 + n) / (1 + self._df)).astype(np.float32) + 1
+        return idf * idf
+
+    def rank(self, queries, k=3, min_relative=0.0):
+        """Rank pages for every query at once and return ``{name: [(page, score), ...]}``.
+
+        ``queries`` maps names to query text. Scores are pivoted cosine
+        similarities, best first; pages scoring nothing are left out, as are
+        those under ``min_relative`` times the query's best score.
+        """
+        used = len(self.page_numbers)
+        if not used or not queries:
+            return {name: [] for name in queries}
+        rows = self._rows[:used]
+        idf2 = self._idf_squared()
+        if self._norms is None:
+            # Row norms of the IDF-weighted matrix, without materializing it
+            norms = np.sqrt(np.einsum("ij,ij,j->i", rows, rows, idf2))
+            mean = norms[norms > 0].mean() if norms.any() else 1.0
+            self._norms = (1 - self.pivot_slope) * mean + self.pivot_slope * norms
+            # Pages under ``short_page_share`` of the mean length (title pages, dividers) are scaled
+            # down in proportion, or one matching phrase on a nearly empty page outranks real content
+            lengths = np.array(self._lengths, dtype=np.float32)
+            floor = max(lengths.mean() * self.short_page_share, 1.0)
+            self._norms = self._norms / np.clip(lengths / floor, 1e-3, 1.0)
+        names = list(queries)
+        matrix = np.stack([self.vectorize(TOKEN_RE.findall(queries[name].lower())) for name in names])
+        query_norms = np.sqrt((matrix * matrix) @ idf2)
+        query_norms[query_norms == 0] = 1.0
+        scores = (matrix * idf2) @ rows.T / (query_norms[:, None] * self._norms[None, :])
+
+        page_numbers = np.array(self.page_numbers)
+        results = {}
+        for name, section_scores in zip(names, scores):
+            top = min(k, used)
+            candidates = np.argpartition(-section_scores, top - 1)[:top]
+            best = sorted(candidates, key=lambda i: (-section_scores[i], page_numbers[i]))
+            cutoff = section_scores[best[0]] * min_relative
+            results[name] = [
+                (int(page_numbers[i]), float(section_scores[i]))
+                for i in best if section_scores[i] > 0 and section_scores[i] >= cutoff
+            ]
+        return results
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -1,364 +1,417 @@
-import os
-import tempfile
-from django.http import FileResponse
+import re
+import time
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.utils.http import content_disposition_header
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.parsers import MultiPartParser
-from openai import OpenAI
-from docx import Document
-from .utils import extract_text_from_pdf, extract_text_from_docx
-import json
-import datetime
+from .pipeline import (
+    process_upload, aprocess_upload, is_supported_file, compact_response, UnsupportedFileType, LOG_KINDS,
+)
+from .models import Protocol
+from .utils import ExtractionError
+from .gateway import GatewayError
+from .parsing import ResponseParseError
+from .jobs import get_job_queue, QueueFull
+from .renderers import FastJSONRenderer, EventStreamRenderer
+from .streaming import stream_pipeline
+from . import metrics
+from .artifacts import get_artifact_store
+from .executor import offload
+from .serialization import dumps
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+def protocol_id_or_error(request):
+    """Return ``(protocol_id, None)`` for the optional ``protocol_id`` field, or ``(None, error_response)``."""
+    protocol_id = request.data.get("protocol_id") or None
+    if protocol_id is None:
+        return None, None
+    if not str(protocol_id).isdigit():
+        return None, Response({"error": "protocol_id must be an integer"}, status=400)
+    if not Protocol.objects.filter(pk=protocol_id).exists():
+        return None, Response({"error": "Protocol not found"}, status=404)
+    return int(protocol_id), None
+
+
+def wants_compact(request):
+    """``?response=compact`` or ``full``, defaulting to ``ICF_RESPONSE_FORMAT``."""
+    return (request.GET.get("response") or getattr(settings, "ICF_RESPONSE_FORMAT", "full")) == "compact"
+
+
+def present(result, file_name, compact):
+    """The generation ``result`` as sent to the client.
+
+    A compact result's logs are served from a job recorded for it, which
+    holds the full result until ``ICF_JOB_TTL`` after it finished.
+    """
+    if not compact:
+        return result
+    return compact_response(result, get_job_queue().record(file_name, result).logs_url)
 
 
 class GenerateICFView(APIView):
+    """Generate an ICF from an uploaded protocol.
+
+    Pass ``protocol_id`` (from an earlier response's ``protocol.id``) when
+    uploading an amendment so unchanged pages and sections are reused, and
+    ``?response=compact`` to get the logs by reference (see ``JobLogsView``).
+    """
     parser_classes = [MultiPartParser]
 
     def post(self, request):
         file = request.FILES.get("file")
         if not file:
             return Response({"error": "No file uploaded"}, status=400)
+        protocol_id, error = protocol_id_or_error(request)
+        if error:
+            return error
 
-        # Extract text
+        # Pages are extracted lazily while the pipeline consumes them
         try:
-            if file.name.lower().endswith(".pdf"):
-                pages = extract_text_from_pdf(file)
-            elif file.name.lower().endswith(".docx"):
-                pages = extract_text_from_docx(file)
-            else:
-                return Response({"error": "Unsupported file type"}, status=400)
-        except Exception as e:
+            result = process_upload(file, file.name, protocol_id=protocol_id)
+            return Response(present(result, file.name, wants_compact(request)))
+        except Protocol.DoesNotExist:
+            return Response({"error": "Protocol not found"}, status=404)
+        except UnsupportedFileType as e:
+            return Response({"error": str(e)}, status=400)
+        except ExtractionError as e:
             return Response({"error": f"Failed to extract text: {str(e)}"}, status=400)
+        except GatewayError as e:
+            return Response({"error": str(e)}, status=e.status)
+        except ResponseParseError as e:
+            return Response({"error": f"Unusable model reply: {str(e)}"}, status=502)
+
+
+class GenerateICFStreamView(APIView):
+    """Same pipeline as ``GenerateICFView``, reported as server-sent events.
+
+    Emits ``start`` immediately, then ``page`` per extracted page, ``token``
+    and ``section`` as the model replies, and finally ``done`` with the usual
+    response payload (or ``error``). A client that disconnects cancels the
+    run, so no more pages are read or model calls made for it.
+    """
+    parser_classes = [MultiPartParser]
+    renderer_classes = [FastJSONRenderer, EventStreamRenderer]
+
+    def post(self, request):
+        file = request.FILES.get("file")
+        if not file:
+            return Response({"error": "No file uploaded"}, status=400)
+
+        if not is_supported_file(file.name):
+            return Response({"error": "Unsupported file type"}, status=400)
+        protocol_id, error = protocol_id_or_error(request)
+        if error:
+            return error
+
+        compact = wants_compact(request)
+
+        def run(emit):
+            return present(process_upload(file, file.name, protocol_id=protocol_id, emit=emit), file.name, compact)
+
+        response = StreamingHttpResponse(
+            stream_pipeline(run),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # Stop nginx from buffering the stream
+        return response
+
+
+class SubmitICFJobView(APIView):
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        file = request.FILES.get("file")
+        if not file:
+            return Response({"error": "No file uploaded"}, status=400)
+        if not is_supported_file(file.name):
+            return Response({"error": "Unsupported file type"}, status=400)
+        protocol_id, error = protocol_id_or_error(request)
+        if error:
+            return error
 
-        # Combine text for model
-        combined_text = "\n".join([p["text"] for p in pages])
-
-        # Generate sections using model
-        prompt = f"""
-Extract the following sections from the clinical trial protocol and return a JSON object with section names as keys and extracted content as values.
-
-For each section, also indicate which page numbers from the document were used to generate that content.
-
-Return format:
-{{
-    "Purpose of the Study": {{
-        "content": "extracted content here",
-        "source_pages": [1, 2]
-    }},
-    "Study Procedures": {{
-        "content": "extracted content here (include number of patients and study duration if available)",
-        "source_pages": [3, 4, 5]
-    }},
-    "Risks": {{
-        "content": "extracted content here",
-        "source_pages": [6, 7]
-    }},
-    "Benefits": {{
-        "content": "extracted content here",
-        "source_pages": [8, 9]
-    }}
-}}
-
-Text to analyze (pages 1-{len(pages)}):
-{combined_text[:4000]}
-"""
-
-        # Try OpenAI API first, fallback to saved response on errors
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a clinical document parser. Return only valid JSON format as requested."},
-                    {"role": "user", "content": prompt},
-                ],
-            )
-            generated_text = response.choices[0].message.content
-            
-            # Clean the response text - remove markdown code blocks
-            cleaned_text = generated_text.strip()
-            if cleaned_text.startswith('```json'):
-                cleaned_text = cleaned_text[7:]  # Remove ```json
-            if cleaned_text.startswith('```'):
-                cleaned_text = cleaned_text[3:]   # Remove ```
-            if cleaned_text.endswith('```'):
-                cleaned_text = cleaned_text[:-3]  # Remove trailing ```
-            cleaned_text = cleaned_text.strip()
-            
-            # Try to parse as JSON
-            try:
-                parsed_sections = json.loads(cleaned_text)
-                # Convert back to string for template processing
-                generated_text = json.dumps(parsed_sections, indent=2)
-            except json.JSONDecodeError:
-                pass
-            
-        except Exception as e:
-            # Fallback to saved response
-            # Read the saved response
-            project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-            response_file = os.path.join(project_root, 'openai_response_sample.txt')
-            with open(response_file, 'r') as f:
-                generated_text = f.read()
-
-        # Try to parse as JSON first, then fallback to markdown parsing
-        generated_sections = {}
-        section_source_pages = {}  # Track which pages were used for each section
-        
+            job = get_job_queue().submit(file, protocol_id=protocol_id)
+        except QueueFull as e:
+            # Backpressure: tell the client to come back later instead of holding the socket
+            return Response({"error": str(e)}, status=503, headers={"Retry-After": "5"})
+
+        data = job.to_dict()
+        data["status_url"] = f"/api/jobs/{job.id}/"
+        return Response(data, status=202)
+
+
+class BatchICFJobView(APIView):
+    """Queue many protocols (``files`` fields, PDF/DOCX or zip archives) as one batch job.
+
+    The finished job's ``download_url`` points at a zip of every ICF plus ``manifest.json``.
+    """
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        files = request.FILES.getlist("files")
+        if not files:
+            return Response({"error": "No files uploaded"}, status=400)
+        unsupported = [f.name for f in files if not (is_supported_file(f.name) or f.name.lower().endswith(".zip"))]
+        if unsupported:
+            return Response({"error": f"Unsupported file type: {', '.join(unsupported)}"}, status=400)
+
         try:
-            # Clean the response text - remove markdown code blocks if present
-            cleaned_text = generated_text.strip()
-            if cleaned_text.startswith('```json'):
-                cleaned_text = cleaned_text[7:]  # Remove ```json
-            if cleaned_text.startswith('```'):
-                cleaned_text = cleaned_text[3:]   # Remove ```
-            if cleaned_text.endswith('```'):
-                cleaned_text = cleaned_text[:-3]  # Remove trailing ```
-            cleaned_text = cleaned_text.strip()
-
-            parsed_json = json.loads(cleaned_text)
-            
-            # Handle new format with content and source_pages
-            for section_name, section_data in parsed_json.items():
-                if isinstance(section_data, dict):
-                    # New format with content and source_pages
-                    content = section_data.get('content', '')
-                    source_pages = section_data.get('source_pages', [])
-                    if content.strip():
-                        generated_sections[section_name] = content.strip()
-                        section_source_pages[section_name] = source_pages
-                elif isinstance(section_data, str) and section_data.strip():
-                    # Old format - just string content
-                    generated_sections[section_name] = section_data.strip()
-                    section_source_pages[section_name] = []  # No page info available
-        except json.JSONDecodeError:
-            # Fallback to markdown parsing
-            current_section = None
-            current_content = []
-            
-            for line in generated_text.split('\n'):
-                line = line.strip()
-                if line.startswith('**') and line.endswith('**'):
-                    # Save previous section
-                    if current_section:
-                        generated_sections[current_section] = '\n'.join(current_content).strip()
-                    # Start new section
-                    section_name = line.replace('**', '').strip()
-                    current_section = section_name
-                    current_content = []
-                elif current_section and line:
-                    current_content.append(line)
-            
-            # Save last section
-            if current_section:
-                generated_sections[current_section] = '\n'.join(current_content).strip()
-                section_source_pages[current_section] = []  # No page info available in markdown fallback
-        
-        # Create detailed logs showing which pages were used for each section
-        detailed_logs = []
-        
-        # Add section generation logs with page mapping
-        if generated_sections:
-            for section_name, content in generated_sections.items():
-                # Get source pages from ChatGPT response
-                source_pages = section_source_pages.get(section_name, [])
-                
-                # Create contributing pages info from ChatGPT's source pages
-                contributing_pages = []
-                for page_num in source_pages:
-                    # Find the page object
-                    page_obj = next((p for p in pages if p["page"] == page_num), None)
-                    if page_obj:
-                        contributing_pages.append({
-                            "page": page_obj["page"],
-                            "content_sample": page_obj["text"][:150] + "..." if len(page_obj["text"]) > 150 else page_obj["text"],
-                            "relevance_score": "ChatGPT identified"  # ChatGPT determined this page was relevant
-                        })
-                
-                # If no source pages from ChatGPT, fallback to keyword matching
-                if not contributing_pages:
-                    for page in pages:
-                        # Simple keyword matching to identify relevant pages
-                        page_text_lower = page["text"].lower()
-                        
-                        # Check if page contains keywords related to this section
-                        section_keywords = {
-                            "Purpose of the Study": ["purpose", "objective", "aim", "goal", "study", "trial"],
-                            "Study Procedures": ["procedure", "method", "protocol", "enrollment", "randomization", "treatment"],
-                            "Risks": ["risk", "adverse", "side effect", "complication", "danger", "harm"],
-                            "Benefits": ["benefit", "advantage", "improvement", "efficacy", "outcome", "positive"]
-                        }
-                        
-                        if section_name in section_keywords:
-                            keywords = section_keywords[section_name]
-                            if any(keyword in page_text_lower for keyword in keywords):
-                                contributing_pages.append({
-                                    "page": page["page"],
-                                    "content_sample": page["text"][:150] + "..." if len(page["text"]) > 150 else page["text"],
-                                    "relevance_score": sum(1 for keyword in keywords if keyword in page_text_lower)
-                                })
-                    
-                    # Sort by relevance and take top contributing pages
-                    contributing_pages.sort(key=lambda x: x["relevance_score"] if isinstance(x["relevance_score"], int) else 0, reverse=True)
-                    contributing_pages = contributing_pages[:3]  # Top 3 most relevant pages
-                
-                detailed_logs.append({
-                    "type": "section_generation",
-                    "section": section_name,
-                    "content_preview": content[:200] + "..." if len(content) > 200 else content,
-                    "content_length": len(content),
-                    "contributing_pages": contributing_pages,
-                    "description": f"Generated '{section_name}' section using pages: {', '.join([str(p['page']) for p in contributing_pages]) if contributing_pages else 'AI analysis of all pages'}"
-                })
-        
-        # Add document generation summary
-        detailed_logs.append({
-            "type": "document_generation",
-            "sections_count": len(generated_sections),
-            "total_pages_processed": len(pages),
-            "description": "Generated DOCX document with extracted protocol information"
-        })
-        
-        # Create a new document with extracted protocol information
-        doc = Document()
-        
-        # Add document title
-        doc.add_heading('Informed Consent Form', level=1)
-        doc.add_heading('Generated from Clinical Trial Protocol', level=2)
-        doc.add_paragraph()  # Add spacing
-        
-        # Add generation timestamp
-        timestamp = datetime.datetime.now().strftime("%B %d, %Y at %I:%M %p")
-        doc.add_paragraph(f"Generated on: {timestamp}")
-        doc.add_paragraph()
-        
-        # Create sections with proper formatting
-        if generated_sections:
-            # Add table of contents section
-            doc.add_heading('Protocol Information Summary', level=2)
-            doc.add_paragraph("The following information has been extracted from the clinical trial protocol:")
-            
-            # Add section list
-            for section_name in generated_sections.keys():
-                doc.add_paragraph(f"• {section_name}", style='List Bullet')
-            
-            doc.add_paragraph()  # Add spacing
-            
-            # Add each section with proper formatting
-            for section_name, content in generated_sections.items():
-                # Add section header
-                doc.add_heading(section_name, level=2)
-                
-                # Add content with proper formatting
-                content_para = doc.add_paragraph(content)
-                content_para.style = 'Normal'
-                
-                # Add spacing between sections
-                doc.add_paragraph()
-            
-            # Add processing logs section
-            doc.add_heading('Processing Logs', level=2)
-            doc.add_paragraph("The following logs show the page numbers and content used to generate each section:")
-            doc.add_paragraph()
-            
-            # Add detailed logs to document
-            for log_entry in detailed_logs:
-                if log_entry["type"] == "extraction":
-                    doc.add_heading(f"Page {log_entry['page']} - Text Extraction", level=3)
-                    doc.add_paragraph(f"Content Length: {log_entry['content_length']} characters")
-                    doc.add_paragraph("Content Preview:")
-                    content_preview = doc.add_paragraph(log_entry['content_preview'])
-                    content_preview.style = 'Intense Quote'
-                    doc.add_paragraph()
-                    
-                elif log_entry["type"] == "section_generation":
-                    doc.add_heading(f"Section: {log_entry['section']}", level=3)
-                    doc.add_paragraph(f"Content Length: {log_entry['content_length']} characters")
-                    
-                    # Show contributing pages
-                    if log_entry.get('contributing_pages'):
-                        doc.add_paragraph("Source Pages Used:")
-                        for page_info in log_entry['contributing_pages']:
-                            doc.add_paragraph(f"• Page {page_info['page']} (relevance: {page_info['relevance_score']})")
-                            page_sample = doc.add_paragraph(f"  Content sample: {page_info['content_sample']}")
-                            page_sample.style = 'Intense Quote'
-                        doc.add_paragraph()
-                    
-                    doc.add_paragraph("Generated Content:")
-                    generated_content = doc.add_paragraph(log_entry['content_preview'])
-                    generated_content.style = 'Intense Quote'
-                    doc.add_paragraph()
-                    
-                elif log_entry["type"] == "document_generation":
-                    doc.add_heading("Document Generation Summary", level=3)
-                    doc.add_paragraph(f"Sections Generated: {log_entry['sections_count']}")
-                    doc.add_paragraph(f"Pages Processed: {log_entry['total_pages_processed']}")
-                    doc.add_paragraph()
+            job = get_job_queue().submit_batch(files)
+        except QueueFull as e:
+            return Response({"error": str(e)}, status=503, headers={"Retry-After": "5"})
+
+        data = job.to_dict()
+        data["status_url"] = f"/api/jobs/{job.id}/"
+        return Response(data, status=202)
+
+
+class JobStatusView(APIView):
+    def get(self, request, job_id):
+        job = get_job_queue().get(job_id)
+        if not job:
+            return Response({"error": "Job not found"}, status=404)
+        return Response(job.to_dict(compact=wants_compact(request)))
+
+
+class LogPagination(LimitOffsetPagination):
+    default_limit = 100
+    max_limit = 1000
+
+
+class JobLogsView(APIView):
+    """A finished generation's logs, ``limit``/``offset`` paginated.
+
+    ``?kind=pages`` (the default) lists each page's text sample and
+    ``?kind=attribution`` the pages behind each section, the ``log`` and
+    ``detailed_logs`` of a full response.
+    """
+
+    def get(self, request, job_id):
+        job = get_job_queue().get(job_id)
+        if not job:
+            return Response({"error": "Job not found"}, status=404)
+        if not job.finished:
+            return Response({"error": "Job has not finished"}, status=409)
+        if not job.has_logs:
+            return Response({"error": "Job has no logs"}, status=404)
+        kind = request.query_params.get("kind", "pages")
+        if kind not in LOG_KINDS:
+            return Response({"error": f"kind must be one of: {', '.join(LOG_KINDS)}"}, status=400)
+
+        paginator = LogPagination()
+        entries = paginator.paginate_queryset(job.result[LOG_KINDS[kind]], request, view=self)
+        return paginator.get_paginated_response(entries)
+
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+def _byte_range(header, size):
+    """Parse a single-range ``Range`` header into ``(start, end)`` inclusive.
+
+    Returns None to serve the whole file (no header, or a form we don't
+    handle such as multiple ranges) and raises ValueError if unsatisfiable.
+    """
+    match = RANGE_RE.match(header or "")
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(0, size - int(last)), size - 1  # bytes=-N: the last N bytes
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def _read_range(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = f.read(min(STREAM_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def _artifact_response(request, store, artifact, read_range=None):
+    """The response for a found artifact: 304, 416, a web server handoff, 206 or the whole file.
+
+    Bodies are streamed with ``read_range(path, start, end)`` if given,
+    otherwise with ``_read_range`` and ``FileResponse``.
+    """
+    max_age = max(0, int(artifact.expires_at - time.time()))
+    headers = {
+        "ETag": artifact.etag,
+        "Cache-Control": f"private, max-age={max_age}, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    if_none_match = request.headers.get("If-None-Match", "")
+    if artifact.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        response = HttpResponse(status=304)
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    disposition = content_disposition_header(as_attachment=True, filename=artifact.filename)
+    accel_prefix = getattr(settings, "ICF_ARTIFACT_ACCEL_REDIRECT", "")
+    if accel_prefix or getattr(settings, "ICF_ARTIFACT_SENDFILE", False):
+        # The web server handles ranges and the transfer itself
+        response = HttpResponse(content_type=artifact.content_type)
+        if accel_prefix:
+            response["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + store.relative_blob_path(artifact.sha256)
         else:
-            # Fallback content if no sections were parsed
-            doc.add_heading('Protocol Information', level=2)
-            doc.add_paragraph("No structured information could be extracted from the protocol document.")
-            doc.add_paragraph("Original response:")
-            doc.add_paragraph(generated_text)
-            
-            # Add basic processing logs even in fallback case
-            if detailed_logs:
-                doc.add_paragraph()
-                doc.add_heading('Processing Logs', level=2)
-                doc.add_paragraph("Processing information:")
-                doc.add_paragraph()
-                
-                for log_entry in detailed_logs:
-                    if log_entry["type"] == "extraction":
-                        doc.add_paragraph(f"• Page {log_entry['page']}: {log_entry['content_length']} characters extracted")
-                    elif log_entry["type"] == "document_generation":
-                        doc.add_paragraph(f"• Total pages processed: {log_entry['total_pages_processed']}")
-                        doc.add_paragraph(f"• Sections generated: {log_entry['sections_count']}")
-
-        # Save to temp file
-        tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".docx", prefix="icf_")
-        doc.save(tmp_file.name)
-
-        # Keep backward compatibility with simple log format
-        simple_log = [{"page": p["page"], "text_sample": p["text"][:100]} for p in pages]
-
-        # Prepare response data
-        response_data = {
-            "download_url": f"/api/download_icf/?file={os.path.basename(tmp_file.name)}",
-            "generated_text": generated_text,
-            "log": simple_log,
-            "detailed_logs": detailed_logs
-        }
-        
-        # Try to add parsed sections if JSON was successful
-        try:
-            parsed_sections = json.loads(generated_text)
-            response_data["sections"] = parsed_sections
-        except json.JSONDecodeError:
-            pass
-        
-        return Response(response_data)
+            response["X-Sendfile"] = artifact.path
+    else:
+        byte_range = None
+        if_range = request.headers.get("If-Range")
+        if not if_range or if_range == artifact.etag:
+            try:
+                byte_range = _byte_range(request.headers.get("Range"), artifact.size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{artifact.size}"
+                return response
+
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                (read_range or _read_range)(artifact.path, start, end), status=206, content_type=artifact.content_type
+            )
+            response["Content-Range"] = f"bytes {start}-{end}/{artifact.size}"
+            response["Content-Length"] = str(end - start + 1)
+        elif read_range:
+            response = StreamingHttpResponse(
+                read_range(artifact.path, 0, artifact.size - 1), content_type=artifact.content_type
+            )
+            response["Content-Length"] = str(artifact.size)
+        else:
+            response = FileResponse(open(artifact.path, "rb"), content_type=artifact.content_type)
+
+    response["Content-Disposition"] = disposition
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
 
 class DownloadICF(APIView):
+    """Serve a stored artifact by its opaque id.
+
+    Responses carry a content-hash ETag (``If-None-Match`` gives 304) and
+    support single byte ranges. With ``ICF_ARTIFACT_ACCEL_REDIRECT`` (nginx)
+    or ``ICF_ARTIFACT_SENDFILE`` (Apache/lighttpd) the file body is left to
+    the web server; otherwise it is streamed with ``FileResponse``, which
+    uses the server's sendfile support when available.
+    """
+
     def get(self, request):
-        file_name = request.GET.get("file")
-        if not file_name:
+        artifact_id = request.GET.get("file")
+        if not artifact_id:
             return Response({"error": "File not specified"}, status=400)
-        
-        file_path = os.path.join(tempfile.gettempdir(), file_name)
-        
-        # Check if file exists
-        if not os.path.exists(file_path):
+
+        store = get_artifact_store()
+        artifact = store.get(artifact_id)
+        if artifact is None:
             return Response({"error": "File not found"}, status=404)
-        
-        # Generate a descriptive filename
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        download_filename = f"Protocol_Extracted_Information_{timestamp}.docx"
-        
-        return FileResponse(
-            open(file_path, "rb"), 
-            as_attachment=True, 
-            filename=download_filename,
-            content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        )
+        return _artifact_response(request, store, artifact)
+
+
+# Async views: the same endpoints for ASGI servers, as plain Django views since DRF's are sync
+
+async def aprotocol_id_or_error(request):
+    """Async ``protocol_id_or_error`` for a plain Django request."""
+    protocol_id = request.POST.get("protocol_id") or None
+    if protocol_id is None:
+        return None, None
+    if not str(protocol_id).isdigit():
+        return None, JsonResponse({"error": "protocol_id must be an integer"}, status=400)
+    if not await Protocol.objects.filter(pk=protocol_id).aexists():
+        return None, JsonResponse({"error": "Protocol not found"}, status=404)
+    return int(protocol_id), None
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncGenerateICFView(View):
+    """``GenerateICFView`` for ASGI: the model calls are awaited, so a request waiting on them holds no thread.
+
+    Extraction, rendering and database work run on the bounded executor (see
+    ``executor``), so one worker process can have many generations in flight.
+    """
+
+    async def post(self, request):
+        # Parsing the multipart body may spool the upload to disk
+        file = await offload(lambda: request.FILES.get("file"))
+        if not file:
+            return JsonResponse({"error": "No file uploaded"}, status=400)
+        protocol_id, error = await aprotocol_id_or_error(request)
+        if error:
+            return error
+
+        try:
+            result = await aprocess_upload(file, file.name, protocol_id=protocol_id)
+            # Encoded like the DRF views' responses
+            return HttpResponse(dumps(present(result, file.name, wants_compact(request))),
+                                content_type="application/json")
+        except Protocol.DoesNotExist:
+            return JsonResponse({"error": "Protocol not found"}, status=404)
+        except UnsupportedFileType as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        except ExtractionError as e:
+            return JsonResponse({"error": f"Failed to extract text: {str(e)}"}, status=400)
+        except GatewayError as e:
+            return JsonResponse({"error": str(e)}, status=e.status)
+        except ResponseParseError as e:
+            return JsonResponse({"error": f"Unusable model reply: {str(e)}"}, status=502)
+
+
+async def _aread_range(path, start, end):
+    # Each block is read on the executor, so a slow client holds no thread between blocks
+    f = await offload(open, path, "rb")
+    try:
+        await offload(f.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = await offload(f.read, min(STREAM_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+    finally:
+        f.close()
+
+
+class AsyncDownloadICF(View):
+    """``DownloadICF`` for ASGI: the artifact lookup and file reads run on the executor."""
+
+    async def get(self, request):
+        artifact_id = request.GET.get("file")
+        if not artifact_id:
+            return JsonResponse({"error": "File not specified"}, status=400)
+
+        store = await offload(get_artifact_store)
+        artifact = await offload(store.get, artifact_id)
+        if artifact is None:
+            return JsonResponse({"error": "File not found"}, status=404)
+        return _artifact_response(request, store, artifact, read_range=_aread_range)
+
+
+class MetricsView(APIView):
+    """Prometheus scrape endpoint: stage histograms, cache, artifact store, LLM gateway and job queue metrics."""
+
+    def get(self, request):
+        if not metrics.enabled():
+            return Response({"error": "Metrics are disabled"}, status=404)
+        return HttpResponse(metrics.render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -45,8 +45,9 @@ echo "✅ Setup complete!"
 echo ""
 echo "To start the application:"
 echo "1. Activate virtual environment: source venv/bin/activate"
-echo "2. Start backend: python manage.py runserver"
-echo "3. In another terminal, start frontend: cd frontend && npm run dev"
+echo "2. Create the database: cd backend && python manage.py migrate"
+echo "3. Start backend: python manage.py runserver"
+echo "4. In another terminal, start frontend: cd frontend && npm run dev"
 echo ""
 echo "Backend will be available at: http://127.0.0.1:8000"
 echo "Frontend will be available at: http://localhost:5173"